@@ -1,29 +1,228 @@
 from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin
+from django.db import models, transaction
 
-from .models import Follow, Group, Post
+from .deletion import schedule_group_deletion, schedule_user_deletion
+from .follows import invalidate_follow_set
+from .notifications import about_posts, forget_unread
+from .models import (
+    DataExport, DeletionJob, Follow, Group, Notification, OutboxEvent, Post,
+    Tag, User, WebhookEndpoint
+)
+from .paginators import CachedCountPaginator
 
+BATCH_SIZE = 500
+# Protected rows listed on a refused delete confirmation page
+PROTECTED_LIMIT = 20
 
-class PostAdmin(admin.ModelAdmin):
+
+def deletion_blockers(admin_site, request, model, objs):
+    """Return (perms_needed, protected) for deleting objs, like the admin
+
+    Permissions are checked per model along the cascade, from the models
+    alone; only the PROTECT relations of objs themselves are queried, a few
+    rows each.
+    """
+    perms_needed, protected = set(), []
+    seen, models_left = set(), [model]
+    while models_left:
+        current = models_left.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        model_admin = admin_site._registry.get(current)
+        if model_admin and not model_admin.has_delete_permission(request):
+            perms_needed.add(current._meta.verbose_name)
+        for relation in current._meta.related_objects:
+            if relation.on_delete is models.CASCADE:
+                models_left.append(relation.related_model)
+    for relation in model._meta.related_objects:
+        if relation.on_delete is not models.PROTECT:
+            continue
+        protected.extend(
+            str(obj) for obj in relation.related_model._base_manager.filter(
+                **{relation.field.name + '__in': objs}
+            )[:PROTECTED_LIMIT]
+        )
+    return perms_needed, protected
+
+
+class LargeTableAdminMixin:
+    """Changelists and delete pages that don't scan the whole table"""
+    paginator = CachedCountPaginator
+    # Don't COUNT the whole table next to the filtered total
+    show_full_result_count = False
+
+    def get_deleted_objects(self, objs, request):
+        # Don't collect every related row just to draw the confirmation page
+        perms_needed, protected = deletion_blockers(
+            self.admin_site, request, self.model, objs
+        )
+        return [str(obj) for obj in objs], {}, perms_needed, protected
+
+
+class BackgroundDeleteMixin(LargeTableAdminMixin):
+    """Replace admin deletion with a queued DeletionJob"""
+    schedule_deletion = None
+
+    def delete_model(self, request, obj):
+        self.schedule_deletion(obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            self.schedule_deletion(obj)
+
+
+class BatchedAdminMixin(LargeTableAdminMixin):
+    """Bulk actions that work in small batches"""
+    batch_size = BATCH_SIZE
+
+    def batches(self, queryset):
+        """Yield querysets of at most batch_size rows in pk order"""
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(ids), self.batch_size):
+            yield self.model.objects.filter(
+                pk__in=ids[start:start + self.batch_size]
+            )
+
+    def delete_queryset(self, request, queryset):
+        for batch in self.batches(queryset):
+            with transaction.atomic():
+                self.delete_batch(batch)
+
+    def delete_batch(self, batch):
+        batch.delete()
+
+
+class PostAdmin(BatchedAdminMixin, admin.ModelAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group', 'image', 'music')
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
-    list_filter = ('pub_date',)
+    list_filter = ('is_published', 'pub_date')
+    # Drills down along the pub_date index
+    date_hierarchy = 'pub_date'
+    autocomplete_fields = ('author', 'group')
+    actions = ('detach_group',)
     empty_value_display = '-пусто-'
 
+    def detach_group(self, request, queryset):
+        for batch in self.batches(queryset):
+            batch.update(group=None)
+    detach_group.short_description = 'Убрать из сообщества'
+
+    def delete_model(self, request, obj):
+        recount_unread = forget_unread(about_posts([obj.pk]))
+        super().delete_model(request, obj)
+        recount_unread()
+
+    def delete_batch(self, batch):
+        recount_unread = forget_unread(about_posts(batch))
+        super().delete_batch(batch)
+        recount_unread()
 
-class GroupAdmin(admin.ModelAdmin):
+
+class GroupAdmin(BackgroundDeleteMixin, admin.ModelAdmin):
     list_display = ('pk', 'title', 'slug', 'description')
     search_fields = ('title', 'slug')
     # Automatically create slug according to title via Java Script
     prepopulated_fields = {'slug': ('title',)}
     empty_value_display = '-пусто-'
+    schedule_deletion = staticmethod(schedule_group_deletion)
+
 
+class YatubeUserAdmin(BackgroundDeleteMixin, UserAdmin):
+    schedule_deletion = staticmethod(schedule_user_deletion)
 
-class FollowAdmin(admin.ModelAdmin):
+
+class FollowAdmin(BatchedAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'author')
-    search_fields = ('user',)
+    list_select_related = ('user', 'author')
+    search_fields = ('user__username', 'author__username')
+    autocomplete_fields = ('user', 'author')
+    empty_value_display = '-пусто-'
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        invalidate_follow_set(obj.user)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_follow_set(obj.user)
+
+    def delete_batch(self, batch):
+        followers = list(User.objects.filter(
+            pk__in=batch.values_list('user_id', flat=True)
+        ))
+        batch.delete()
+        for follower in followers:
+            invalidate_follow_set(follower)
+
+
+class DataExportAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'user', 'status', 'created', 'finished')
+    list_select_related = ('user',)
+    list_filter = ('status',)
     empty_value_display = '-пусто-'
 
 
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk', 'kind', 'label', 'status', 'processed', 'total',
+        'media_removed', 'created', 'finished'
+    )
+    list_filter = ('kind', 'status')
+    readonly_fields = list_display
+
+    def has_add_permission(self, request):
+        return False
+
+
+class NotificationAdmin(BatchedAdminMixin, admin.ModelAdmin):
+    list_display = (
+        'pk', 'recipient', 'actor', 'verb', 'created', 'is_read',
+        'dispatched'
+    )
+    list_select_related = ('recipient', 'actor')
+    list_filter = ('verb', 'is_read', 'dispatched')
+
+    def delete_model(self, request, obj):
+        recount_unread = forget_unread(
+            Notification.objects.filter(pk=obj.pk)
+        )
+        super().delete_model(request, obj)
+        recount_unread()
+
+    def delete_batch(self, batch):
+        recount_unread = forget_unread(batch)
+        super().delete_batch(batch)
+        recount_unread()
+
+
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'topic', 'created')
+    list_filter = ('topic',)
+
+
+class WebhookEndpointAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk', 'url', 'is_active', 'cursor', 'attempts', 'next_attempt_at'
+    )
+    readonly_fields = ('attempts', 'next_attempt_at', 'last_error')
+
+
+class TagAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'name', 'post_count')
+    search_fields = ('name',)
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Follow, FollowAdmin)
+admin.site.register(DataExport, DataExportAdmin)
+admin.site.register(DeletionJob, DeletionJobAdmin)
+admin.site.register(Tag, TagAdmin)
+admin.site.register(Notification, NotificationAdmin)
+admin.site.register(OutboxEvent, OutboxEventAdmin)
+admin.site.register(WebhookEndpoint, WebhookEndpointAdmin)
+admin.site.unregister(User)
+admin.site.register(User, YatubeUserAdmin)
@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from . import signals  # noqa: F401 (connects receivers)
+        if settings.TEMPLATE_TIMING:
+            from . import template_timing
+            template_timing.install()
@@ -0,0 +1,428 @@
+"""Cold storage for old posts.
+
+Posts older than ``ARCHIVE_AFTER_DAYS`` are moved, together with their
+comments, likes, revisions, notifications and tag and mention rows, from
+the main database into the SQLite file ``ARCHIVE_PATH`` by the
+``archive_posts`` command. Likes still in counter shards are added to the
+copied ``likes_count`` first, so nothing the delete cascades to is lost.
+The hot tables and their indexes then only hold recent posts, which is
+where nearly all the traffic goes.
+
+The archive is written by that command alone. Pages read it through a
+per-thread read-only connection with memory-mapped I/O, so cold reads go
+through the page cache without copying into SQLite's own buffers and can
+never modify the file. ``TieredPosts`` glues hot and cold rows into one
+sequence for Paginator: the hot queryset first, then the archive.
+
+Archived rows are plain Post and Comment instances marked with
+``is_archived``; they are shown on profile, group, post and history pages
+but can't be edited, liked or commented. Tag and mention feeds only cover
+hot posts.
+"""
+import os
+import sqlite3
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import outbox
+from .notifications import forget_unread
+from .models import (
+    Comment, Group, Like, LikeCounter, Mention, Notification, Post,
+    PostRevision, PostTag, User
+)
+
+BATCH_SIZE = 500
+TABLES = (
+    ('post', Post), ('comment', Comment), ('user_like', Like),
+    ('revision', PostRevision), ('notification', Notification),
+    ('post_tag', PostTag), ('mention', Mention),
+)
+INDEXES = (
+    'CREATE INDEX IF NOT EXISTS post_author '
+    'ON post (author_id, pub_date DESC, id DESC)',
+    'CREATE INDEX IF NOT EXISTS post_group '
+    'ON post (group_id, pub_date DESC, id DESC)',
+    'CREATE INDEX IF NOT EXISTS comment_post ON comment (post_id, created)',
+    'CREATE INDEX IF NOT EXISTS comment_author ON comment (author_id)',
+    'CREATE INDEX IF NOT EXISTS like_user ON user_like (user_id)',
+    'CREATE INDEX IF NOT EXISTS revision_post '
+    'ON revision (post_id, number)',
+    'CREATE INDEX IF NOT EXISTS post_tag_post ON post_tag (post_id)',
+)
+
+readers = threading.local()
+
+
+def columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def connect_writer(path=None):
+    """Open the archive for writing, creating or extending its tables"""
+    db = sqlite3.connect(path or settings.ARCHIVE_PATH)
+    for table, model in TABLES:
+        db.execute(
+            f'CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY)'
+        )
+        existing = {
+            row[1] for row in db.execute(f'PRAGMA table_info({table})')
+        }
+        # Columns added to the model later are added here as well
+        for column in columns(model):
+            if column not in existing:
+                db.execute(f'ALTER TABLE {table} ADD COLUMN {column}')
+    for statement in INDEXES:
+        db.execute(statement)
+    db.commit()
+    return db
+
+
+def get_reader():
+    """Return this thread's read-only connection, None without an archive"""
+    path = settings.ARCHIVE_PATH
+    db = getattr(readers, 'db', None)
+    if db is not None and readers.path == path:
+        return db
+    if not os.path.exists(path):
+        return None
+    db = sqlite3.connect(
+        f'file:{path}?mode=ro', uri=True, check_same_thread=False
+    )
+    db.row_factory = sqlite3.Row
+    db.execute(f'PRAGMA mmap_size = {settings.ARCHIVE_MMAP_SIZE}')
+    readers.db, readers.path = db, path
+    return db
+
+
+def close_reader():
+    db = getattr(readers, 'db', None)
+    if db is not None:
+        db.close()
+        readers.db = None
+
+
+def query(sql, params=()):
+    db = get_reader()
+    if db is None:
+        return []
+    return db.execute(sql, params).fetchall()
+
+
+def to_db(model, row):
+    fields = model._meta.concrete_fields
+    return [
+        field.get_db_prep_save(row[field.attname], connection)
+        for field in fields
+    ]
+
+
+def load_instance(model, row):
+    """Build an unsaved-looking instance from an archive row"""
+    values = {}
+    present = set(row.keys())
+    for field in model._meta.concrete_fields:
+        if field.attname not in present:
+            # Added to the model after this archive was last written
+            values[field.attname] = field.get_default()
+            continue
+        value = row[field.attname]
+        if value is not None and isinstance(field, models.DateTimeField):
+            value = timezone.make_aware(parse_datetime(value), timezone.utc)
+        elif value is not None and isinstance(field, models.BooleanField):
+            value = bool(value)
+        values[field.attname] = value
+    instance = model(**values)
+    instance._state.adding = False
+    instance.is_archived = True
+    return instance
+
+
+def attach_related(posts):
+    """Resolve authors and groups of cold posts in two queries"""
+    authors = User.objects.in_bulk({post.author_id for post in posts})
+    groups = Group.objects.in_bulk(
+        {post.group_id for post in posts if post.group_id}
+    )
+    for post in posts:
+        post.author = authors[post.author_id]
+        post.group = groups.get(post.group_id)
+    return posts
+
+
+def attach_comments(posts):
+    """Make post.comments serve archived comments without a query"""
+    if not posts:
+        return posts
+    by_post = {post.pk: [] for post in posts}
+    placeholders = ','.join('?' * len(by_post))
+    rows = query(
+        f'SELECT * FROM comment WHERE post_id IN ({placeholders}) '
+        'ORDER BY created DESC, id DESC',
+        list(by_post)
+    )
+    comments = [load_instance(Comment, row) for row in rows]
+    # Thread order, as posts.threads.thread_page gives for hot posts
+    comments.sort(key=lambda comment: (
+        -(comment.root_id or comment.pk), comment.path
+    ))
+    authors = User.objects.in_bulk(
+        {comment.author_id for comment in comments}
+    )
+    for comment in comments:
+        comment.author = authors[comment.author_id]
+        by_post[comment.post_id].append(comment)
+    for post in posts:
+        # The same cache prefetch_related('comments') would fill
+        cached = post.comments.all()
+        cached._result_cache = by_post[post.pk]
+        cached._prefetch_done = True
+        post._prefetched_objects_cache = {'comments': cached}
+    return posts
+
+
+def fetch_posts(column, value, offset, limit):
+    rows = query(
+        f'SELECT * FROM post WHERE {column} = ? '
+        'ORDER BY pub_date DESC, id DESC LIMIT ? OFFSET ?',
+        (value, limit, offset)
+    )
+    posts = [load_instance(Post, row) for row in rows]
+    return attach_comments(attach_related(posts))
+
+
+def count_posts(column, value):
+    rows = query(f'SELECT COUNT(*) FROM post WHERE {column} = ?', (value,))
+    return rows[0][0] if rows else 0
+
+
+def get_post(post_id, author):
+    rows = query(
+        'SELECT * FROM post WHERE id = ? AND author_id = ?',
+        (post_id, author.pk)
+    )
+    if not rows:
+        return None
+    post = load_instance(Post, rows[0])
+    return attach_comments(attach_related([post]))[0]
+
+
+class TieredPosts:
+    """Hot posts followed by archived ones, sliceable for Paginator"""
+
+    def __init__(self, hot, column, value):
+        self.hot = hot
+        self.column = column
+        self.value = value
+        self._hot_count = None
+
+    @property
+    def hot_count(self):
+        if self._hot_count is None:
+            self._hot_count = self.hot.count()
+        return self._hot_count
+
+    def count(self):
+        return self.hot_count + count_posts(self.column, self.value)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        rows = []
+        if start < self.hot_count:
+            rows = list(self.hot[start:min(stop, self.hot_count)])
+        if stop > self.hot_count:
+            offset = max(start - self.hot_count, 0)
+            limit = stop - self.hot_count - offset
+            rows += fetch_posts(self.column, self.value, offset, limit)
+        return rows
+
+
+def author_posts(author):
+    return TieredPosts(author.posts.published(), 'author_id', author.pk)
+
+
+def group_posts(group):
+    return TieredPosts(group.posts.published(), 'group_id', group.pk)
+
+
+def fetch_revisions(post_id, names=('*',), numbers=None):
+    """Return archived revisions of a post newest first
+
+    Only the named columns are read, the rest keep their defaults;
+    numbers limits them to an inclusive (first, last) range.
+    """
+    where, params = 'post_id = ?', [post_id]
+    if numbers:
+        where += ' AND number BETWEEN ? AND ?'
+        params += numbers
+    rows = query(
+        f'SELECT {", ".join(names)} FROM revision WHERE {where} '
+        'ORDER BY number DESC',
+        params
+    )
+    return [load_instance(PostRevision, row) for row in rows]
+
+
+def last_revision(post_id):
+    rows = query(
+        'SELECT MAX(number) FROM revision WHERE post_id = ?', (post_id,)
+    )
+    return rows[0][0] if rows else None
+
+
+def iter_rows(table, column, value):
+    """Yield archived instances matching one column, for exports"""
+    db = get_reader()
+    if db is None:
+        return
+    model = dict(TABLES)[table]
+    # Iterating the cursor keeps one row in memory at a time
+    for row in db.execute(
+        f'SELECT * FROM {table} WHERE {column} = ? ORDER BY id', (value,)
+    ):
+        yield load_instance(model, row)
+
+
+def add_pending_likes(rows, field):
+    """Add likes not yet folded from LikeCounter shards to likes_count"""
+    pending = dict(LikeCounter.objects.filter(
+        **{f'{field}__in': [row['id'] for row in rows]}
+    ).values(field).annotate(total=Sum('delta')).values_list(
+        field, 'total'
+    ))
+    for row in rows:
+        row['likes_count'] += pending.get(row['id'], 0)
+
+
+def archive_batch(db, posts):
+    """Copy a batch with what depends on it, then delete it from hot tables"""
+    post_rows = list(posts.values(*columns(Post)))
+    ids = [row['id'] for row in post_rows]
+    comment_rows = list(
+        Comment.objects.filter(post__in=ids).values(*columns(Comment))
+    )
+    comment_ids = [row['id'] for row in comment_rows]
+    add_pending_likes(post_rows, 'post_id')
+    add_pending_likes(comment_rows, 'comment_id')
+    on_batch = Q(post__in=ids) | Q(comment__in=comment_ids)
+    dependent = {
+        Like: Like.objects.filter(on_batch),
+        PostRevision: PostRevision.objects.filter(post__in=ids),
+        Notification: Notification.objects.filter(on_batch),
+        PostTag: PostTag.objects.filter(post__in=ids),
+        Mention: Mention.objects.filter(post__in=ids),
+    }
+    rows_by_model = {Post: post_rows, Comment: comment_rows}
+    for model, queryset in dependent.items():
+        rows_by_model[model] = list(queryset.values(*columns(model)))
+    # The archive is committed first: a crash in between leaves rows in
+    # both places and the next run copies them again and deletes them
+    for table, model in TABLES:
+        names = columns(model)
+        rows = rows_by_model[model]
+        db.executemany(
+            f'INSERT OR REPLACE INTO {table} ({", ".join(names)}) '
+            f'VALUES ({", ".join("?" * len(names))})',
+            [to_db(model, row) for row in rows]
+        )
+    db.commit()
+    recount_unread = forget_unread(dependent[Notification])
+    # Moving a post isn't deleting it as far as webhooks are concerned
+    with transaction.atomic(), outbox.muted():
+        Post.objects.filter(pk__in=ids).delete()
+        recount_unread()
+    return len(post_rows)
+
+
+def archive_posts(days=None, batch_size=BATCH_SIZE):
+    """Move posts older than the horizon to the archive, return the count"""
+    days = settings.ARCHIVE_AFTER_DAYS if days is None else days
+    horizon = timezone.now() - timedelta(days=days)
+    # Drafts keep their creation date and stay hot until published
+    old = Post.objects.published().filter(pub_date__lt=horizon).order_by(
+        'pk'
+    )
+    db = connect_writer()
+    moved = 0
+    try:
+        while True:
+            batch = old.values_list('pk', flat=True)[:batch_size]
+            ids = list(batch)
+            if not ids:
+                return moved
+            moved += archive_batch(db, Post.objects.filter(pk__in=ids))
+    finally:
+        db.close()
+
+
+def forget_user(user_id):
+    """Delete archived posts of a user and everything of theirs there
+
+    That is comments on the posts and by the user, likes given and
+    received, revisions, notifications and tag and mention rows. Returns
+    names of media files that belonged to the removed posts.
+    """
+    if not os.path.exists(settings.ARCHIVE_PATH):
+        return []
+    db = connect_writer()
+    try:
+        media = [
+            name
+            for row in db.execute(
+                'SELECT image, music FROM post WHERE author_id = ?',
+                (user_id,)
+            )
+            for name in row if name
+        ]
+        # Likes the user gave are counted out of what stays
+        for table, column in (('post', 'post_id'), ('comment', 'comment_id')):
+            db.execute(
+                f'UPDATE {table} SET likes_count = likes_count - 1 '
+                f'WHERE id IN (SELECT {column} FROM user_like '
+                'WHERE user_id = ?)',
+                (user_id,)
+            )
+        posts = 'SELECT id FROM post WHERE author_id = :user'
+        comments = (
+            f'SELECT id FROM comment WHERE author_id = :user '
+            f'OR post_id IN ({posts})'
+        )
+        on_content = f'post_id IN ({posts}) OR comment_id IN ({comments})'
+        for table, where in (
+            ('user_like', f'user_id = :user OR {on_content}'),
+            ('notification',
+             f'recipient_id = :user OR actor_id = :user OR {on_content}'),
+            ('revision', f'post_id IN ({posts})'),
+            ('post_tag', f'post_id IN ({posts})'),
+            ('mention', f'user_id = :user OR post_id IN ({posts})'),
+            ('comment', f'id IN ({comments})'),
+            ('post', 'author_id = :user'),
+        ):
+            db.execute(f'DELETE FROM {table} WHERE {where}', {'user': user_id})
+        db.commit()
+    finally:
+        db.close()
+    return media
+
+
+def forget_group(group_id):
+    if not os.path.exists(settings.ARCHIVE_PATH):
+        return
+    db = connect_writer()
+    try:
+        db.execute(
+            'UPDATE post SET group_id = NULL WHERE group_id = ?', (group_id,)
+        )
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,283 @@
+"""MP3 metadata read at upload time.
+
+``analyze`` walks an MP3 file in chunks, never holding more than one
+chunk: it reads the ID3v2 tag at the start and the ID3v1 tag at the end
+for title and artist, then every MPEG audio frame header. Counting frames
+gives an exact duration for both constant and variable bitrate files.
+
+Decoding audio is out of reach for pure Python, so the waveform is built
+from each frame's side information instead: ``global_gain`` is the
+quantizer step of the frame, which follows the loudness of the music in
+1.5 dB steps. The per-frame values are downsampled to ``PEAKS`` bars and
+scaled to 0-100, which is plenty for drawing a waveform.
+
+The results are stored on the Post (see ``apply_info``), so pages show
+duration, bitrate and the waveform without opening the media file, and
+the player can use ``preload="none"``.
+"""
+MPEG1, MPEG2, MPEG25 = 3, 2, 0
+BITRATES = {
+    MPEG1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256,
+            320),
+    MPEG2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+SAMPLE_RATES = {
+    MPEG1: (44100, 48000, 32000),
+    MPEG2: (22050, 24000, 16000),
+    MPEG25: (11025, 12000, 8000),
+}
+LAYER_3 = 1
+MONO = 3
+CHUNK = 64 * 1024
+# Enough for a frame at the highest bitrate plus the next frame's header
+LOOKAHEAD = 4096
+PEAKS = 120
+# ID3v2 frames holding what we show, per tag version
+TEXT_FRAMES = {
+    2: {b'TT2': 'title', b'TP1': 'artist'},
+    3: {b'TIT2': 'title', b'TPE1': 'artist'},
+    4: {b'TIT2': 'title', b'TPE1': 'artist'},
+}
+TEXT_ENCODINGS = ('latin-1', 'utf-16', 'utf-16-be', 'utf-8')
+
+
+def syncsafe(data):
+    """Decode an ID3 integer that uses 7 bits per byte"""
+    value = 0
+    for byte in data:
+        value = (value << 7) | (byte & 0x7f)
+    return value
+
+
+def decode_text(data):
+    if not data:
+        return ''
+    encoding = TEXT_ENCODINGS[data[0]] if data[0] < 4 else 'latin-1'
+    text = data[1:].decode(encoding, errors='replace')
+    # Several values are separated by NULs; the first one is enough
+    return text.split('\x00')[0].strip()
+
+
+def read_id3v2(stream):
+    """Return (tags, audio start offset) from the tag at the stream start"""
+    stream.seek(0)
+    header = stream.read(10)
+    if len(header) < 10 or header[:3] != b'ID3':
+        return {}, 0
+    version, flags = header[3], header[5]
+    end = 10 + syncsafe(header[6:10]) + (10 if flags & 0x10 else 0)
+    if version not in TEXT_FRAMES:
+        return {}, end
+    wanted = TEXT_FRAMES[version]
+    id_size, header_size = (3, 6) if version == 2 else (4, 10)
+    position = 10
+    if flags & 0x40 and version > 2:
+        # Extended header; its size counts itself only in version 4
+        size = stream.read(4)
+        extended = syncsafe(size) if version == 4 else (
+            int.from_bytes(size, 'big') + 4
+        )
+        position += extended
+    tags = {}
+    while position + header_size <= end and len(tags) < len(wanted):
+        stream.seek(position)
+        frame = stream.read(header_size)
+        frame_id = frame[:id_size]
+        if not frame_id.strip(b'\x00'):
+            # Padding
+            break
+        raw_size = frame[id_size:id_size + (3 if version == 2 else 4)]
+        size = syncsafe(raw_size) if version == 4 else (
+            int.from_bytes(raw_size, 'big')
+        )
+        if frame_id in wanted:
+            tags[wanted[frame_id]] = decode_text(stream.read(size))
+        # Frames we don't show, like cover art, are skipped unread
+        position += header_size + size
+    return tags, end
+
+
+def read_id3v1(stream, size):
+    """Return tags from the 128-byte tag at the end, or {} without one"""
+    if size < 128:
+        return {}
+    stream.seek(size - 128)
+    tag = stream.read(128)
+    if tag[:3] != b'TAG':
+        return {}
+    fields = {'title': tag[3:33], 'artist': tag[33:63]}
+    return {
+        name: value.split(b'\x00')[0].decode('latin-1').strip()
+        for name, value in fields.items()
+    }
+
+
+def parse_header(data, offset):
+    """Return (frame length, samples, sample rate, channels, side info
+    offset, side info length, version) for a Layer III header, or None
+    """
+    if data[offset] != 0xff or data[offset + 1] & 0xe0 != 0xe0:
+        return None
+    second, third, fourth = data[offset + 1:offset + 4]
+    version = (second >> 3) & 3
+    if version == 1 or (second >> 1) & 3 != LAYER_3:
+        return None
+    bitrate_index, rate_index = third >> 4, (third >> 2) & 3
+    if bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    kbps = BITRATES[MPEG1 if version == MPEG1 else MPEG2][bitrate_index]
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    padding = (third >> 1) & 1
+    channels = 1 if fourth >> 6 == MONO else 2
+    if version == MPEG1:
+        samples, length = 1152, 144000 * kbps // sample_rate + padding
+        side_length = 17 if channels == 1 else 32
+    else:
+        samples, length = 576, 72000 * kbps // sample_rate + padding
+        side_length = 9 if channels == 1 else 17
+    # A CRC follows the header when the protection bit is clear
+    side_offset = 4 if second & 1 else 6
+    return (
+        length, samples, sample_rate, channels, side_offset, side_length,
+        version
+    )
+
+
+def frame_gain(side, channels, version):
+    """Return the highest global_gain among the frame's granules"""
+    bits = int.from_bytes(side, 'big')
+    total = len(side) * 8
+
+    def field(start, width):
+        return (bits >> (total - start - width)) & ((1 << width) - 1)
+
+    if version == MPEG1:
+        position = 9 + (5 if channels == 1 else 3) + 4 * channels
+        granules, granule_bits = 2, 59
+    else:
+        position = 8 + (1 if channels == 1 else 2)
+        granules, granule_bits = 1, 63
+    gain = 0
+    for _ in range(granules * channels):
+        # part2_3_length is 0 in silent granules
+        if field(position, 12):
+            gain = max(gain, field(position + 21, 8))
+        position += granule_bits
+    return gain
+
+
+def iter_frames(stream, start, end):
+    """Yield (header, side info, next 4 bytes) of frames between offsets"""
+    stream.seek(start)
+    buffer, base, position = b'', start, 0
+    synced = False
+    while True:
+        if len(buffer) - position < LOOKAHEAD:
+            if position >= len(buffer):
+                base += position
+                stream.seek(base)
+                buffer = b''
+            else:
+                buffer = buffer[position:]
+                base += position
+            position = 0
+            wanted = min(CHUNK, end - base - len(buffer))
+            if wanted > 0:
+                buffer += stream.read(wanted)
+            if len(buffer) < 4:
+                return
+        header = parse_header(buffer, position)
+        if header is not None and not synced:
+            # A stray 0xFF in the data can look like a header; the first
+            # frame only counts if another one follows it
+            following = position + header[0]
+            if following + 4 <= len(buffer):
+                synced = parse_header(buffer, following) is not None
+            else:
+                synced = base + following >= end
+            if not synced:
+                header = None
+        if header is None:
+            synced = False
+            found = buffer.find(b'\xff', position + 1)
+            position = found if found != -1 else len(buffer)
+            continue
+        length, side_offset, side_length = header[0], header[4], header[5]
+        side_start = position + side_offset
+        side_end = side_start + side_length
+        if side_end + 4 > len(buffer):
+            # Truncated last frame
+            return
+        marker = buffer[side_end:side_end + 4]
+        yield header, buffer[side_start:side_end], marker
+        position += length
+
+
+def downsample(gains, count=PEAKS):
+    """Return count bars scaled to 0-100 from per-frame gains"""
+    if not gains:
+        return []
+    count = min(count, len(gains))
+    bars = [
+        max(gains[len(gains) * i // count:len(gains) * (i + 1) // count])
+        for i in range(count)
+    ]
+    audible = [bar for bar in bars if bar]
+    if not audible:
+        return [0] * count
+    low, high = min(audible), max(audible)
+    if high == low:
+        return [100 if bar else 0 for bar in bars]
+    return [
+        round(5 + 95 * (bar - low) / (high - low)) if bar else 0
+        for bar in bars
+    ]
+
+
+def analyze(stream):
+    """Return metadata of an MP3 file object, or None if it has no audio
+
+    The keys are duration (seconds), bitrate (kbit/s), sample_rate,
+    channels, title, artist and peaks. The stream is left rewound.
+    """
+    stream.seek(0, 2)
+    size = stream.tell()
+    v1 = read_id3v1(stream, size)
+    tags, start = read_id3v2(stream)
+    end = size - 128 if v1 else size
+    frames = samples = audio_bytes = 0
+    sample_rate = channels = None
+    gains = bytearray()
+    for header, side, marker in iter_frames(stream, start, end):
+        length, frame_samples, rate, frame_channels = header[:4]
+        if not frames and marker in (b'Xing', b'Info'):
+            # The VBR header frame of encoders like LAME holds no audio
+            continue
+        frames += 1
+        samples += frame_samples
+        audio_bytes += length
+        sample_rate, channels = rate, frame_channels
+        gains.append(frame_gain(side, frame_channels, header[6]))
+    stream.seek(0)
+    if not frames:
+        return None
+    duration = samples / sample_rate
+    return {
+        'duration': round(duration, 3),
+        'bitrate': round(audio_bytes * 8 / duration / 1000),
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'title': tags.get('title') or v1.get('title', ''),
+        'artist': tags.get('artist') or v1.get('artist', ''),
+        'peaks': downsample(gains),
+    }
+
+
+def apply_info(post, info):
+    """Store analyze() results on a post, or clear them for None"""
+    info = info or {}
+    post.music_duration = info.get('duration')
+    post.music_bitrate = info.get('bitrate')
+    post.music_title = info.get('title', '')[:200]
+    post.music_artist = info.get('artist', '')[:200]
+    post.music_peaks = ','.join(map(str, info.get('peaks', [])))
@@ -0,0 +1,14 @@
+from django.utils.functional import SimpleLazyObject
+
+from .notifications import unread_count
+
+
+def notifications(request):
+    """Add the unread counter, read only if a template really uses it"""
+    if not request.user.is_authenticated:
+        return {}
+    return {
+        'unread_notifications': SimpleLazyObject(
+            lambda: unread_count(request.user)
+        ),
+    }
@@ -0,0 +1,229 @@
+"""Background deletion of users and groups.
+
+Deleting a prolific user in one go makes Django collect every post,
+comment and follow in memory and hold the SQLite write lock until all of
+them are gone. Instead the user is deactivated at once and a DeletionJob
+removes the dependents in small transactions from the ``run_deletions``
+worker. Groups are handled the same way: their posts are detached in
+batches before the group row itself is deleted.
+
+Deleting twice is harmless, so a job left running with no heartbeat for
+``STALE_AFTER`` is simply claimed again, and asking to delete an object
+that already has a job queued returns that job.
+"""
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .archive import forget_group, forget_user
+from .follows import invalidate_follow_set
+from .likes import forget_likes
+from .notifications import about_posts, forget_unread
+from .models import (
+    Comment, DataExport, DeletionJob, Follow, Group, Like,
+    Notification, Post, User
+)
+
+BATCH_SIZE = 200
+STALE_AFTER = timedelta(minutes=30)
+
+
+def active_job(kind, object_id):
+    return DeletionJob.objects.filter(
+        kind=kind, object_id=object_id,
+        status__in=(DeletionJob.PENDING, DeletionJob.RUNNING)
+    ).first()
+
+
+def queue_job(kind, obj, label, count_total):
+    """Create a job for obj unless one is already queued or running"""
+    job = active_job(kind, obj.pk)
+    if job is not None:
+        return job
+    try:
+        with transaction.atomic():
+            return DeletionJob.objects.create(
+                kind=kind, object_id=obj.pk, label=label,
+                total=count_total()
+            )
+    except IntegrityError:
+        # Another request queued it in between
+        return active_job(kind, obj.pk)
+
+
+def schedule_user_deletion(user):
+    """Deactivate the user and queue removal of everything they own"""
+    user.is_active = False
+    user.save(update_fields=['is_active'])
+    return queue_job(
+        DeletionJob.USER, user, user.username,
+        lambda: (
+            Notification.objects.filter(
+                Q(recipient=user) | Q(actor=user)
+            ).count()
+            + Follow.objects.filter(Q(user=user) | Q(author=user)).count()
+            + Like.objects.filter(user=user).count()
+            + Comment.objects.filter(
+                Q(author=user) | Q(post__author=user)
+            ).count()
+            + user.posts.count()
+        )
+    )
+
+
+def schedule_group_deletion(group):
+    return queue_job(
+        DeletionJob.GROUP, group, group.title, group.posts.count
+    )
+
+
+def claim_next_job(now=None):
+    """Mark the oldest pending or stale job as running and return it"""
+    now = now or timezone.now()
+    stale = Q(heartbeat__lt=now - STALE_AFTER) | Q(heartbeat__isnull=True)
+    claimable = DeletionJob.objects.filter(
+        Q(status=DeletionJob.PENDING) | Q(stale, status=DeletionJob.RUNNING)
+    )
+    for job in claimable.order_by('created'):
+        claimed = DeletionJob.objects.filter(
+            pk=job.pk, status=job.status, heartbeat=job.heartbeat
+        ).update(status=DeletionJob.RUNNING, heartbeat=now)
+        if claimed:
+            job.status, job.heartbeat = DeletionJob.RUNNING, now
+            return job
+    return None
+
+
+def delete_files(names, job, storage=None):
+    """Remove media files once the rows pointing to them are gone"""
+    storage = storage or Post._meta.get_field('image').storage
+    for name in names:
+        if storage.exists(name):
+            storage.delete(name)
+            DeletionJob.objects.filter(pk=job.pk).update(
+                media_removed=F('media_removed') + 1,
+                heartbeat=timezone.now()
+            )
+
+
+def delete_in_batches(queryset, job, batch_size, before_delete=None):
+    """Delete queryset rows batch by batch, one transaction per batch
+
+    ``before_delete`` sees each batch before it is deleted and may return
+    a callable to run after the batch is committed.
+    """
+    while True:
+        after_commit = None
+        with transaction.atomic():
+            ids = list(
+                queryset.order_by('pk').values_list('pk', flat=True)[
+                    :batch_size
+                ]
+            )
+            if not ids:
+                return
+            batch = queryset.model.objects.filter(pk__in=ids)
+            if before_delete is not None:
+                after_commit = before_delete(batch)
+            batch.delete()
+            DeletionJob.objects.filter(pk=job.pk).update(
+                processed=F('processed') + len(ids),
+                heartbeat=timezone.now()
+            )
+        if after_commit is not None:
+            after_commit()
+
+
+def delete_user(job, batch_size):
+    user_id = job.object_id
+
+    def forget_follow_sets(follows):
+        followers = follows.values_list('user_id', flat=True)
+        for follower in User.objects.filter(pk__in=list(followers)):
+            invalidate_follow_set(follower)
+
+    def forget_comments(comments):
+        # Replies on the same posts go with them
+        return forget_unread(about_posts(comments.values('post_id')))
+
+    def forget_posts(posts):
+        names = [
+            name
+            for pair in posts.values_list('image', 'music')
+            for name in pair if name
+        ]
+        recount_unread = forget_unread(about_posts(posts))
+
+        def after_commit():
+            recount_unread()
+            delete_files(names, job)
+        return after_commit
+
+    delete_in_batches(
+        Notification.objects.filter(
+            Q(recipient_id=user_id) | Q(actor_id=user_id)
+        ),
+        job, batch_size, forget_unread
+    )
+    delete_in_batches(
+        Follow.objects.filter(Q(user_id=user_id) | Q(author_id=user_id)),
+        job, batch_size, forget_follow_sets
+    )
+    # Likes on other users' posts have to leave their counters too
+    delete_in_batches(
+        Like.objects.filter(user_id=user_id), job, batch_size, forget_likes
+    )
+    delete_in_batches(
+        Comment.objects.filter(
+            Q(author_id=user_id) | Q(post__author_id=user_id)
+        ),
+        job, batch_size, forget_comments
+    )
+    delete_in_batches(
+        Post.objects.filter(author_id=user_id), job, batch_size, forget_posts
+    )
+    archives = DataExport.objects.filter(user_id=user_id).exclude(
+        archive=''
+    ).exclude(archive=None)
+    delete_files(
+        list(archives.values_list('archive', flat=True)), job,
+        DataExport._meta.get_field('archive').storage
+    )
+    delete_files(forget_user(user_id), job)
+    User.objects.filter(pk=user_id).delete()
+
+
+def delete_group(job, batch_size):
+    posts = Post.objects.filter(group_id=job.object_id)
+    while True:
+        ids = list(posts.order_by('pk').values_list('pk', flat=True)[
+            :batch_size
+        ])
+        if not ids:
+            break
+        Post.objects.filter(pk__in=ids).update(group=None)
+        DeletionJob.objects.filter(pk=job.pk).update(
+            processed=F('processed') + len(ids), heartbeat=timezone.now()
+        )
+    forget_group(job.object_id)
+    Group.objects.filter(pk=job.object_id).delete()
+
+
+def run_job(job, batch_size=BATCH_SIZE):
+    handler = delete_user if job.kind == DeletionJob.USER else delete_group
+    try:
+        handler(job, batch_size)
+    except Exception:
+        DeletionJob.objects.filter(pk=job.pk).update(
+            status=DeletionJob.FAILED
+        )
+        raise
+    DeletionJob.objects.filter(pk=job.pk).update(
+        status=DeletionJob.DONE, finished=timezone.now()
+    )
+    # The copy guests see; users' own copies expire within seconds
+    cache.delete(make_template_fragment_key('index_page', [None]))
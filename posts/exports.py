@@ -0,0 +1,168 @@
+"""Personal data archives.
+
+An archive is built by the ``run_exports`` worker, never inside a request:
+posts and comments are serialized one row at a time straight into the ZIP
+and media files are copied into it in fixed-size blocks, so memory use
+does not depend on how much the user has posted.
+
+Archives live in the private ``EXPORT_ROOT`` under random names and are
+deleted ``EXPORT_KEEP_DAYS`` after they are built; failed exports go after
+the same time. A worker beats the export's ``heartbeat`` while it builds,
+and an export left running with no beat for ``STALE_AFTER`` is claimed
+again, so a crashed worker can't block its user's exports forever.
+"""
+import json
+import shutil
+import tempfile
+import uuid
+import zipfile
+from datetime import timedelta
+from itertools import chain
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Q
+from django.utils import timezone
+
+from .archive import iter_rows as iter_archived
+from .models import DataExport, Post
+
+CHUNK_SIZE = 500
+COPY_BUFFER_SIZE = 64 * 1024
+STALE_AFTER = timedelta(minutes=30)
+
+
+def write_json_list(archive, name, rows):
+    with archive.open(name, 'w', force_zip64=True) as member:
+        member.write(b'[')
+        for number, row in enumerate(rows):
+            if number:
+                member.write(b',')
+            member.write(
+                json.dumps(row, ensure_ascii=False).encode('utf-8')
+            )
+        member.write(b']')
+
+
+def iter_posts(user):
+    posts = user.posts.select_related('group').order_by('pk')
+    for post in chain(
+        iter_archived('post', 'author_id', user.pk),
+        posts.iterator(chunk_size=CHUNK_SIZE)
+    ):
+        yield {
+            'id': post.pk,
+            'text': post.text,
+            'pub_date': post.pub_date.isoformat(),
+            'group': post.group.slug if post.group else None,
+            'image': post.image.name or None,
+            'music': post.music.name or None,
+        }
+
+
+def iter_comments(user):
+    comments = user.comments.order_by('pk')
+    for comment in chain(
+        iter_archived('comment', 'author_id', user.pk),
+        comments.iterator(chunk_size=CHUNK_SIZE)
+    ):
+        yield {
+            'id': comment.pk,
+            'post': comment.post_id,
+            'text': comment.text,
+            'created': comment.created.isoformat(),
+        }
+
+
+def beat(export):
+    DataExport.objects.filter(pk=export.pk).update(heartbeat=timezone.now())
+
+
+def iter_media(user):
+    """Yield names of the user's media files, archived posts included"""
+    archived = (
+        (post.image.name, post.music.name)
+        for post in iter_archived('post', 'author_id', user.pk)
+    )
+    live = user.posts.order_by('pk').values_list('image', 'music')
+    for pair in chain(archived, live.iterator(chunk_size=CHUNK_SIZE)):
+        for name in pair:
+            if name:
+                yield name
+
+
+def copy_media(archive, storage, names, export):
+    for name in names:
+        beat(export)
+        if not storage.exists(name):
+            continue
+        with storage.open(name, 'rb') as source:
+            with archive.open(f'media/{name}', 'w',
+                              force_zip64=True) as member:
+                shutil.copyfileobj(source, member, COPY_BUFFER_SIZE)
+
+
+def build_archive(export):
+    """Write the user's archive and attach it to the export"""
+    user = export.user
+    with tempfile.TemporaryFile() as buffer:
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            write_json_list(archive, 'posts.json', iter_posts(user))
+            beat(export)
+            write_json_list(archive, 'comments.json', iter_comments(user))
+            storage = Post._meta.get_field('image').storage
+            # Media files go after the JSON parts, their names read anew
+            copy_media(archive, storage, iter_media(user), export)
+        buffer.seek(0)
+        # A random name, so one archive's name says nothing of another's
+        export.archive.save(
+            f'{uuid.uuid4().hex}.zip', File(buffer), save=False
+        )
+
+
+def claim_next_export(now=None):
+    """Mark the oldest pending or stale export as running and return it"""
+    now = now or timezone.now()
+    stale = Q(heartbeat__lt=now - STALE_AFTER) | Q(heartbeat__isnull=True)
+    claimable = DataExport.objects.filter(
+        Q(status=DataExport.PENDING) | Q(stale, status=DataExport.RUNNING)
+    )
+    for export in claimable.order_by('created'):
+        # Matches nothing if another worker claimed or beat it meanwhile
+        claimed = DataExport.objects.filter(
+            pk=export.pk, status=export.status, heartbeat=export.heartbeat
+        ).update(status=DataExport.RUNNING, heartbeat=now)
+        if claimed:
+            export.status, export.heartbeat = DataExport.RUNNING, now
+            return export
+    return None
+
+
+def process_export(export):
+    try:
+        build_archive(export)
+    except Exception:
+        export.status = DataExport.FAILED
+        export.save(update_fields=['status'])
+        raise
+    export.status = DataExport.DONE
+    export.finished = timezone.now()
+    export.save(update_fields=['status', 'finished', 'archive'])
+
+
+def purge_expired(now=None):
+    """Delete exports built or failed EXPORT_KEEP_DAYS ago, return count"""
+    horizon = (now or timezone.now()) - timedelta(
+        days=settings.EXPORT_KEEP_DAYS
+    )
+    expired = DataExport.objects.filter(
+        Q(finished__lt=horizon)
+        | Q(status=DataExport.FAILED, created__lt=horizon)
+    )
+    purged = 0
+    for export in expired.iterator():
+        if export.archive:
+            export.archive.delete(save=False)
+        export.delete()
+        purged += 1
+    return purged
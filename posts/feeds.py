@@ -0,0 +1,272 @@
+"""Stored RSS/Atom feeds and sitemap.
+
+Crawlers poll feeds and sitemaps far more often than posts change, so
+every document is rendered once and kept in the cache with its ETag. A
+document belongs to scopes (the whole site, a group, an author, a sitemap
+shard) and is keyed by the time its scopes last changed. Signals touch
+the scopes of a post whenever it is saved or deleted, so only the
+documents that post appears in are rendered again, on their next request.
+Responses carry ETag and Last-Modified and answer conditional requests
+with 304. Scope stamps have to be in a cache every process shares (see
+CACHES in the settings): posts also change in workers such as
+publish_scheduled, import_data and archive_posts, and their touches must
+reach the web processes serving the documents.
+
+The sitemap lists hot posts. Shards cover fixed ranges of ``SITEMAP_LIMIT``
+primary keys, so a changed post invalidates one shard. While all posts fit
+into the first shard ``sitemap.xml`` is that shard; past it, it becomes an
+index pointing at ``sitemap-<n>.xml`` files.
+"""
+import hashlib
+import io
+import time
+
+from django.contrib.sites.shortcuts import get_current_site
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.http import Http404, HttpResponse
+from django.template.defaultfilters import truncatewords
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed
+from django.utils.http import http_date, quote_etag
+from django.utils.xmlutils import SimplerXMLGenerator
+
+from .models import Group, Post
+
+FEED_SIZE = 20
+# The sitemaps.org limit of URLs per file
+SITEMAP_LIMIT = 50000
+# Rendered documents outlive their scopes' changes only until they expire
+DOCUMENT_TIMEOUT = 24 * 60 * 60
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+# Touched by bulk loads that bypass signals
+ALL = 'all'
+
+
+def scope_key(scope):
+    return f'feeds_changed:{scope}'
+
+
+def changed_at(scopes):
+    """Return when the latest of the scopes changed, as a timestamp"""
+    keys = [scope_key(scope) for scope in scopes]
+    stamps = cache.get_many(keys)
+    for key in keys:
+        if key not in stamps:
+            cache.add(key, time.time(), None)
+            stamps[key] = cache.get(key, time.time())
+    return max(stamps.values())
+
+
+def touch(*scopes):
+    now = time.time()
+    cache.set_many({scope_key(scope): now for scope in scopes}, None)
+
+
+def touch_on_commit(*scopes):
+    # Touched now for this request and again after commit, so a document
+    # rendered by another request before the commit isn't kept
+    touch(*scopes)
+    transaction.on_commit(lambda: touch(*scopes))
+
+
+def shard_of(pk):
+    return (pk - 1) // SITEMAP_LIMIT
+
+
+def post_scopes(post, old_group_id=None):
+    scopes = {
+        'global', f'author:{post.author_id}', 'sitemap',
+        f'sitemap:{shard_of(post.pk)}',
+    }
+    for group_id in (post.group_id, old_group_id):
+        if group_id:
+            scopes.add(f'group:{group_id}')
+    return scopes
+
+
+def stored(request, name, scopes, render):
+    """Return the document for name, rendering it if its scopes changed
+
+    ``render`` returns ``(content, content_type)`` and is only called on
+    a miss. The response honours If-None-Match and If-Modified-Since.
+    """
+    site = get_current_site(request)
+    scopes = (ALL, *scopes)
+    stamp = changed_at(scopes)
+    key = 'feed_document:' + hashlib.md5(
+        f'{request.scheme}:{site.domain}:{name}:{stamp}'.encode('utf-8')
+    ).hexdigest()
+    document = cache.get(key)
+    if document is None:
+        content, content_type = render()
+        etag = quote_etag(hashlib.md5(content).hexdigest())
+        document = (content, content_type, etag)
+        cache.set(key, document, DOCUMENT_TIMEOUT)
+    content, content_type, etag = document
+    last_modified = int(stamp)
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if not_modified is not None:
+        return not_modified
+    response = HttpResponse(content, content_type=content_type)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+class PostFeed(Feed):
+    """Latest posts of the site, a group (obj) or an author (obj)"""
+    feed_type = Rss201rev2Feed
+
+    def title(self, obj):
+        if isinstance(obj, Group):
+            return f'Yatube: {obj.title}'
+        if obj is not None:
+            return f'Yatube: записи {obj.username}'
+        return 'Yatube'
+
+    def link(self, obj):
+        if isinstance(obj, Group):
+            return reverse('group_post', args=[obj.slug])
+        if obj is not None:
+            return reverse('profile', args=[obj.username])
+        return reverse('index')
+
+    def description(self, obj):
+        if isinstance(obj, Group):
+            return obj.description
+        return 'Последние записи'
+
+    def items(self, obj):
+        posts = Post.objects.published().select_related('author')
+        if isinstance(obj, Group):
+            posts = posts.filter(group=obj)
+        elif obj is not None:
+            posts = posts.filter(author=obj)
+        return posts.order_by('-pub_date', '-pk')[:FEED_SIZE]
+
+    def item_title(self, item):
+        return truncatewords(item.text, 10)
+
+    def item_description(self, item):
+        return item.text_html
+
+    def item_link(self, item):
+        return reverse('post', args=[item.author.username, item.pk])
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+
+class AtomPostFeed(PostFeed):
+    feed_type = Atom1Feed
+    subtitle = PostFeed.description
+
+
+FEEDS = {'rss': PostFeed(), 'atom': AtomPostFeed()}
+
+
+def feed_response(request, fmt, obj=None):
+    """Return the stored feed of obj (a Group, a User or the whole site)"""
+    feed = FEEDS.get(fmt)
+    if feed is None:
+        raise Http404
+    if isinstance(obj, Group):
+        scope = f'group:{obj.pk}'
+    elif obj is not None:
+        scope = f'author:{obj.pk}'
+    else:
+        scope = 'global'
+
+    def render():
+        generator = feed.get_feed(obj, request)
+        content = generator.writeString('utf-8').encode('utf-8')
+        return content, generator.content_type
+
+    return stored(request, f'{fmt}:{scope}', [scope], render)
+
+
+def write_sitemap(root, entries):
+    """Render (tag, loc, lastmod) entries as a urlset or sitemapindex"""
+    stream = io.StringIO()
+    xml = SimplerXMLGenerator(stream, 'utf-8')
+    xml.startDocument()
+    xml.startElement(root, {'xmlns': SITEMAP_NS})
+    for tag, loc, lastmod in entries:
+        xml.startElement(tag, {})
+        xml.addQuickElement('loc', loc)
+        if lastmod is not None:
+            xml.addQuickElement('lastmod', lastmod)
+        xml.endElement(tag)
+    xml.endElement(root)
+    xml.endDocument()
+    return stream.getvalue().encode('utf-8'), 'application/xml'
+
+
+def site_url(request):
+    return f'{request.scheme}://{get_current_site(request).domain}'
+
+
+def render_shard(request, shard):
+    base = site_url(request)
+    posts = Post.objects.published().filter(
+        pk__gt=shard * SITEMAP_LIMIT, pk__lte=(shard + 1) * SITEMAP_LIMIT
+    ).order_by('pk').values_list('pk', 'author__username', 'pub_date')
+    entries = (
+        (
+            'url',
+            base + reverse('post', args=[username, pk]),
+            pub_date.date().isoformat(),
+        )
+        for pk, username, pub_date in posts.iterator()
+    )
+    return write_sitemap('urlset', entries)
+
+
+def render_index(request, shards):
+    base = site_url(request)
+    entries = []
+    for shard in range(shards):
+        stamp = changed_at((ALL, f'sitemap:{shard}'))
+        entries.append((
+            'sitemap',
+            base + reverse('sitemap_shard', args=[shard]),
+            time.strftime('%Y-%m-%d', time.gmtime(stamp)),
+        ))
+    return write_sitemap('sitemapindex', entries)
+
+
+def shard_count():
+    last = Post.objects.aggregate(last=Max('pk'))['last']
+    return shard_of(last) + 1 if last else 1
+
+
+def sitemap_response(request):
+    """Return the only sitemap shard, or an index once there are more"""
+    shards = shard_count()
+    if shards == 1:
+        return stored(
+            request, 'sitemap:0', ['sitemap:0'],
+            lambda: render_shard(request, 0)
+        )
+    return stored(
+        request, 'sitemap', ['sitemap'],
+        lambda: render_index(request, shards)
+    )
+
+
+def sitemap_shard_response(request, shard):
+    if shard >= shard_count():
+        raise Http404
+    return stored(
+        request, f'sitemap:{shard}', [f'sitemap:{shard}'],
+        lambda: render_shard(request, shard)
+    )
@@ -0,0 +1,80 @@
+"""Cached flatpage lookups.
+
+Every 404 goes through the flatpage fallback middleware, so without a
+cache each crawler probe or mistyped URL costs a FlatPage query. Lookups
+are cached by site and URL, misses included. All entries share a version
+that signals bump whenever a flatpage or its sites change, so a new page
+shows up at once even where a miss was cached.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.flatpages.middleware import FlatpageFallbackMiddleware
+from django.contrib.flatpages.models import FlatPage
+from django.contrib.flatpages.views import render_flatpage
+from django.contrib.sites.shortcuts import get_current_site
+from django.core.cache import cache
+from django.http import Http404, HttpResponsePermanentRedirect
+
+VERSION_KEY = 'flatpages_version'
+# Misses expire on their own so the cache can't fill up with bot probes
+MISS_TIMEOUT = 300
+MISSING = 'missing'
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def invalidate_flatpages():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def get_flatpage(url, site_id):
+    """Return the FlatPage for url on the site or None"""
+    digest = hashlib.md5(url.encode('utf-8')).hexdigest()
+    key = f'flatpage:{get_version()}:{site_id}:{digest}'
+    page = cache.get(key)
+    if page is None:
+        page = FlatPage.objects.filter(url=url, sites=site_id).first()
+        if page is None:
+            cache.set(key, MISSING, MISS_TIMEOUT)
+        else:
+            cache.set(key, page, None)
+    return None if page == MISSING else page
+
+
+def flatpage(request, url):
+    """django.contrib.flatpages.views.flatpage with cached lookups"""
+    if not url.startswith('/'):
+        url = '/' + url
+    site_id = get_current_site(request).id
+    page = get_flatpage(url, site_id)
+    if page is None:
+        if not url.endswith('/') and settings.APPEND_SLASH:
+            url += '/'
+            if get_flatpage(url, site_id) is not None:
+                return HttpResponsePermanentRedirect(f'{request.path}/')
+        raise Http404
+    return render_flatpage(request, page)
+
+
+class CachedFlatpageFallbackMiddleware(FlatpageFallbackMiddleware):
+    def process_response(self, request, response):
+        if response.status_code != 404:
+            return response
+        try:
+            return flatpage(request, request.path_info)
+        except Http404:
+            return response
+        except Exception:
+            if settings.DEBUG:
+                raise
+            return response
@@ -0,0 +1,89 @@
+"""Per-viewer cache of followed authors.
+
+Each viewer gets a sorted array of author ids stored in the shared cache
+with a small Bloom filter in front of it, so "does the viewer follow this
+author" is answered for a whole page without touching the database.
+Every change of a viewer's follows deletes the set from the shared cache
+(see CACHES in the settings), whichever process made it; the short
+timeout bounds the damage of a change that slipped past invalidation.
+"""
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+
+from .models import Follow
+
+CACHE_KEY = 'follow_set:{}'
+CACHE_TIMEOUT = 5 * 60
+# About 1% false positives with 10 bits per item and 4 hash functions
+BLOOM_BITS_PER_ITEM = 10
+BLOOM_HASHES = 4
+
+
+class BloomFilter:
+    """Bloom filter over integer ids, used only to answer "no" quickly"""
+
+    def __init__(self, capacity):
+        self.size = max(64, capacity * BLOOM_BITS_PER_ITEM)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        # Double hashing with two cheap multiplicative hashes
+        first = (value * 0x9E3779B1) & 0xFFFFFFFF
+        second = ((value * 0x85EBCA77) & 0xFFFFFFFF) | 1
+        for i in range(BLOOM_HASHES):
+            yield (first + i * second) % self.size
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(value)
+        )
+
+
+class FollowSet:
+    """Authors followed by one viewer"""
+
+    def __init__(self, author_ids):
+        self.ids = array('q', sorted(set(author_ids)))
+        self.bloom = BloomFilter(len(self.ids))
+        for author_id in self.ids:
+            self.bloom.add(author_id)
+
+    def __contains__(self, author):
+        author_id = getattr(author, 'pk', author)
+        if author_id is None or author_id not in self.bloom:
+            return False
+        index = bisect_left(self.ids, author_id)
+        return index < len(self.ids) and self.ids[index] == author_id
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def get_follow_set(user):
+    """Return a cached FollowSet of authors the user is subscribed to"""
+    if not user.is_authenticated:
+        return FollowSet(())
+    key = CACHE_KEY.format(user.pk)
+    follow_set = cache.get(key)
+    if follow_set is None:
+        follow_set = FollowSet(
+            Follow.objects.filter(user=user).values_list(
+                'author_id', flat=True
+            )
+        )
+        cache.set(key, follow_set, CACHE_TIMEOUT)
+    return follow_set
+
+
+def invalidate_follow_set(user):
+    cache.delete(CACHE_KEY.format(user.pk))
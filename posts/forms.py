@@ -1,17 +1,149 @@
+from django import forms
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
+from django.utils import timezone
 
-from .models import Comment, Post
+from .audio import analyze, apply_info
+from .groups import get_group_choices
+from .models import Comment, Group, Inbox, Post
+
+
+class GroupChoiceField(forms.ChoiceField):
+    """Group select validated by primary key, cleaned to an id
+
+    Only the cached first groups and the current one are rendered, the
+    rest are loaded by the autocomplete script.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(choices=(), **kwargs)
+
+    def set_choices(self, selected=None):
+        shown = get_group_choices()
+        if selected is not None and selected not in dict(shown):
+            title = Group.objects.filter(pk=selected).values_list(
+                'title', flat=True
+            ).first()
+            if title is not None:
+                shown = shown + [(selected, title)]
+        self.choices = [('', '---------')] + shown
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+
+    def validate(self, value):
+        if value is None:
+            if self.required:
+                raise forms.ValidationError(
+                    self.error_messages['required'], code='required'
+                )
+        elif not Group.objects.filter(pk=value).exists():
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
 
 
 class PostForm(ModelForm):
+    group = GroupChoiceField(
+        required=False,
+        label=Post._meta.get_field('group').verbose_name,
+        help_text=Post._meta.get_field('group').help_text,
+        widget=forms.Select(attrs={'data-autocomplete': 'group'}),
+    )
+    draft = forms.BooleanField(
+        required=False,
+        label='Сохранить как черновик',
+        help_text='Черновик видишь только ты'
+    )
+    field_order = ['group', 'text', 'image', 'music', 'publish_at', 'draft']
+    music_info = None
 
     class Meta:
         model = Post
-        fields = ['group', 'text', 'image', 'music']
+        # group is set by save() from the cleaned id
+        fields = ['text', 'image', 'music', 'publish_at']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk and self.instance.is_published:
+            # A published post can't go back to drafts
+            del self.fields['publish_at'], self.fields['draft']
+        elif self.instance.pk:
+            self.initial.setdefault('draft', not self.instance.publish_at)
+        if self.instance.group_id:
+            self.initial.setdefault('group', self.instance.group_id)
+        selected = self.initial.get('group')
+        if self.is_bound:
+            selected = self['group'].data
+        try:
+            selected = int(selected)
+        except (TypeError, ValueError):
+            selected = None
+        self.fields['group'].set_choices(selected)
+
+    def clean_music(self):
+        music = self.cleaned_data.get('music')
+        if isinstance(music, UploadedFile):
+            self.music_info = analyze(music)
+            if self.music_info is None:
+                raise forms.ValidationError(
+                    'Не удалось найти звук в файле, нужен .mp3'
+                )
+        return music
+
+    def schedule(self):
+        """Publish now, leave a draft or wait for publish_at"""
+        post = self.instance
+        if self.cleaned_data['draft']:
+            post.is_published, post.publish_at = False, None
+        elif post.publish_at and post.publish_at > timezone.now():
+            post.is_published = False
+        else:
+            post.is_published, post.publish_at = True, None
+            post.pub_date = timezone.now()
+
+    def save(self, commit=True):
+        if 'draft' in self.fields:
+            self.schedule()
+        if 'music' in self.changed_data:
+            apply_info(self.instance, self.music_info)
+        group_id = self.cleaned_data['group']
+        if group_id != self.instance.group_id:
+            self.instance.group_id = group_id
+            # Drop the cached object of the previous group
+            field = Post._meta.get_field('group')
+            if field.is_cached(self.instance):
+                field.delete_cached_value(self.instance)
+        return super().save(commit)
 
 
 class CommentForm(ModelForm):
 
     class Meta:
         model = Comment
-        fields = ['text']
+        fields = ['text', 'parent']
+        widgets = {'parent': forms.HiddenInput}
+
+    def __init__(self, *args, post=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if post is not None:
+            # Only comments of the same post can be answered
+            self.fields['parent'].queryset = post.comments.all()
+
+
+class InboxForm(ModelForm):
+
+    class Meta:
+        model = Inbox
+        fields = ['email_on_follow', 'email_on_comment']
@@ -0,0 +1,53 @@
+"""Group choices for post forms.
+
+The first ``CHOICES_LIMIT`` groups by title are kept in the cache as a
+short list, dropped by signals whenever a group is saved or deleted and
+expiring soon anyway; the rest are found through the prefix search behind
+``group_autocomplete``. A submitted group is checked with a primary key
+lookup, so a group created or deleted in another process is never judged
+by a stale list.
+"""
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import Group
+
+CACHE_KEY = 'group_choices'
+CACHE_TIMEOUT = 60
+CHOICES_LIMIT = 20
+SEARCH_LIMIT = 20
+
+
+def get_group_choices():
+    """Return (id, title) of the first CHOICES_LIMIT groups"""
+    choices = cache.get(CACHE_KEY)
+    if choices is None:
+        choices = list(
+            Group.objects.order_by('title').values_list('id', 'title')[
+                :CHOICES_LIMIT
+            ]
+        )
+        cache.set(CACHE_KEY, choices, CACHE_TIMEOUT)
+    return choices
+
+
+def invalidate_group_choices():
+    cache.delete(CACHE_KEY)
+
+
+def prefix_range(field, prefix):
+    # A range instead of LIKE, so SQLite can walk the index
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '\uffff'})
+
+
+def search_groups(prefix, limit=SEARCH_LIMIT):
+    """Return groups whose title or slug start with prefix"""
+    prefix = prefix.strip()
+    if not prefix:
+        return Group.objects.none()
+    condition = (
+        prefix_range('title', prefix)
+        | prefix_range('title', prefix[:1].upper() + prefix[1:])
+        | prefix_range('slug', prefix.lower())
+    )
+    return Group.objects.filter(condition).order_by('title')[:limit]
@@ -0,0 +1,227 @@
+"""Resized copies of post images, made on demand.
+
+Templates ask for any size with ``{% image_url post.image w h %}``, which
+returns ``/img/<token>/<w>x<h>/<fit>.<fmt>``. The token names the source
+file and signs it together with the size, fit and format, so clients
+can't make the server resize to sizes nobody asked for.
+
+Derivatives are written to ``IMAGE_CACHE_DIR``, which is kept under
+``IMAGE_CACHE_SIZE`` bytes by dropping the least recently used files: a
+hit bumps the file's mtime, and once the cache is full the oldest files
+go until it is back to ``LOW_WATER`` of its size. The size is a counter in
+the shared cache that every write adds to, so the directory is only
+scanned when the counter passes the limit, or is lost; the scan sets it
+to what is really on disk. Resizes are
+serialized per derivative with a file lock, so a burst of requests for a
+new size makes one resize and the rest read its result.
+"""
+import base64
+import hashlib
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+from PIL import Image, ImageOps, features
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CROP = 'crop'
+FIT = 'fit'
+FITS = (CROP, FIT)
+FORMATS = {'jpg': 'JPEG', 'png': 'PNG'}
+if features.check('webp'):
+    FORMATS['webp'] = 'WEBP'
+CONTENT_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+}
+MAX_SIDE = 2000
+QUALITY = 82
+LOW_WATER = 0.9
+# Different derivatives may share a lock; this bounds the lock files
+LOCK_STRIPES = 64
+USAGE_KEY = 'image_cache_bytes'
+
+thread_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+class InvalidImageRequest(Exception):
+    pass
+
+
+def signature(name, spec):
+    return salted_hmac('posts.images', f'{name}|{spec}').hexdigest()[:16]
+
+
+def make_token(name, spec):
+    encoded = base64.urlsafe_b64encode(name.encode('utf-8')).decode('ascii')
+    return f'{encoded.rstrip("=")}.{signature(name, spec)}'
+
+
+def read_token(token, spec):
+    """Return the image name signed into token for spec"""
+    encoded, _, sig = token.partition('.')
+    try:
+        name = base64.urlsafe_b64decode(
+            encoded + '=' * (-len(encoded) % 4)
+        ).decode('utf-8')
+    except ValueError:
+        raise InvalidImageRequest(token)
+    if not constant_time_compare(sig, signature(name, spec)):
+        raise InvalidImageRequest(token)
+    return name
+
+
+def spec_of(width, height, fit, fmt):
+    if fit not in FITS or fmt not in FORMATS:
+        raise InvalidImageRequest(fit, fmt)
+    if not (0 < width <= MAX_SIDE and 0 < height <= MAX_SIDE):
+        raise InvalidImageRequest(width, height)
+    return f'{width}x{height}/{fit}.{fmt}'
+
+
+def image_url(name, width, height, fit=CROP, fmt='jpg'):
+    """Return the signed URL of a derivative of the stored image name"""
+    token = make_token(name, spec_of(width, height, fit, fmt))
+    return reverse('image', args=[token, width, height, fit, fmt])
+
+
+def cache_path(name, spec):
+    digest = hashlib.sha1(f'{name}|{spec}'.encode('utf-8')).hexdigest()
+    fmt = spec.rsplit('.', 1)[1]
+    return os.path.join(
+        settings.IMAGE_CACHE_DIR, digest[:2], f'{digest}.{fmt}'
+    ), digest
+
+
+@contextmanager
+def resize_lock(digest):
+    stripe = int(digest[:8], 16) % LOCK_STRIPES
+    with thread_locks[stripe]:
+        if fcntl is None:
+            yield
+            return
+        lock_dir = os.path.join(settings.IMAGE_CACHE_DIR, 'locks')
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(os.path.join(lock_dir, f'{stripe}.lock'), 'a') as lock:
+            # Other processes wait here while one of them resizes
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def open_cached(path):
+    try:
+        handle = open(path, 'rb')
+        # The mtime is the LRU clock
+        os.utime(handle.fileno())
+    except FileNotFoundError:
+        return None
+    return handle
+
+
+def resize(source, width, height, fit, image_format):
+    image = Image.open(source)
+    # JPEG decoding can scale down by 2-8x for free
+    image.draft('RGB', (width, height))
+    image = ImageOps.exif_transpose(image)
+    if fit == CROP:
+        image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+    else:
+        image.thumbnail((width, height), Image.LANCZOS)
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def write_derivative(name, path, width, height, fit, fmt):
+    image_format = FORMATS[fmt]
+    with default_storage.open(name) as source:
+        image = resize(source, width, height, fit, image_format)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(handle, 'wb') as target:
+            image.save(
+                target, image_format, quality=QUALITY, optimize=True
+            )
+        # Readers never see a half-written file
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return os.path.getsize(path)
+
+
+def evict(limit=None):
+    """Drop least recently used derivatives until the cache fits"""
+    limit = settings.IMAGE_CACHE_SIZE if limit is None else limit
+    files = []
+    total = 0
+    for shard in os.scandir(settings.IMAGE_CACHE_DIR):
+        if not shard.is_dir() or shard.name == 'locks':
+            continue
+        for entry in os.scandir(shard.path):
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    removed = 0
+    if total > limit:
+        for _, size, path in sorted(files):
+            if total <= limit * LOW_WATER:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+    cache.set(USAGE_KEY, total, None)
+    return removed
+
+
+def count_written(size):
+    """Add a new derivative to the size counter, evict once it's full"""
+    try:
+        total = cache.incr(USAGE_KEY, size)
+    except ValueError:
+        # Not counted yet, or dropped by the cache
+        total = None
+    if total is None or total > settings.IMAGE_CACHE_SIZE:
+        evict()
+
+
+def get_derivative(token, width, height, fit, fmt):
+    """Return an open file with the derivative and its content type
+
+    Raises InvalidImageRequest for a bad token or spec and OSError when
+    the source is missing or isn't an image.
+    """
+    spec = spec_of(width, height, fit, fmt)
+    name = read_token(token, spec)
+    path, digest = cache_path(name, spec)
+    content_type = CONTENT_TYPES[FORMATS[fmt]]
+    cached = open_cached(path)
+    if cached is not None:
+        return cached, content_type
+    with resize_lock(digest):
+        # Whoever held the lock before may have made it already
+        cached = open_cached(path)
+        if cached is not None:
+            return cached, content_type
+        size = write_derivative(name, path, width, height, fit, fmt)
+        cached = open(path, 'rb')
+    count_written(size)
+    return cached, content_type
@@ -0,0 +1,55 @@
+"""Keyset pagination over (pub_date, post) index rows.
+
+Instead of OFFSET, each page starts right after the last row of the
+previous one, so deep pages cost the same as the first.
+"""
+import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+
+
+class KeysetPage:
+    def __init__(self, rows, size, cursor_of):
+        self.has_next = len(rows) > size
+        self.object_list = rows[:size]
+        self.next_cursor = (
+            cursor_of(self.object_list[-1]) if self.has_next else None
+        )
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def make_cursor(pub_date, post_id):
+    return f'{int(pub_date.timestamp() * 1000000)}_{post_id}'
+
+
+def parse_cursor(cursor):
+    try:
+        stamp, post_id = (int(part) for part in cursor.split('_'))
+    except (AttributeError, ValueError):
+        return None
+    pub_date = datetime.datetime.fromtimestamp(
+        stamp / 1000000, tz=timezone.utc
+    )
+    return pub_date, post_id
+
+
+def keyset_page(rows, cursor, size=10):
+    """Return a page of index rows having ``pub_date`` and ``post_id``"""
+    rows = rows.order_by('-pub_date', '-post_id')
+    position = parse_cursor(cursor)
+    if position is not None:
+        pub_date, post_id = position
+        rows = rows.filter(
+            Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, post_id__lt=post_id)
+        )
+    return KeysetPage(
+        list(rows[:size + 1]), size,
+        lambda row: make_cursor(row.pub_date, row.post_id)
+    )
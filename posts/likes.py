@@ -0,0 +1,139 @@
+"""Likes on posts and comments.
+
+A Like row per user and target, unique through partial indexes, answers
+"did I like it". The number shown on cards is ``likes_count`` on the post
+or comment itself, so a page needs no COUNT per card.
+
+Writers never touch that column: every like and unlike adds +1 or -1 to
+one of ``SHARDS`` LikeCounter rows of the target picked at random, so
+likes on a popular post don't all wait for the same row lock. The
+``aggregate_likes`` worker folds the shards into ``likes_count``, which
+therefore lags behind by up to one worker interval.
+"""
+import random
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Comment, Like, LikeCounter, Post
+
+SHARDS = 8
+BATCH_SIZE = 500
+
+
+def target_filter(post_id=None, comment_id=None):
+    if post_id is not None:
+        return {'post_id': post_id}
+    return {'comment_id': comment_id}
+
+
+def bump(delta, post_id=None, comment_id=None):
+    """Add delta to a random counter shard of the post or comment"""
+    target = target_filter(post_id, comment_id)
+    shard = random.randrange(SHARDS)
+    counters = LikeCounter.objects.filter(shard=shard, **target)
+    if counters.update(delta=F('delta') + delta):
+        return
+    try:
+        with transaction.atomic():
+            LikeCounter.objects.create(shard=shard, delta=delta, **target)
+    except IntegrityError:
+        # Another request created the shard first
+        counters.update(delta=F('delta') + delta)
+
+
+def like(user, post=None, comment=None):
+    """Like a post or a comment, return False if it was liked already"""
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                Like.objects.create(user=user, post=post, comment=comment)
+        except IntegrityError:
+            return False
+        bump(1, getattr(post, 'pk', None), getattr(comment, 'pk', None))
+    return True
+
+
+def unlike(user, post=None, comment=None):
+    """Take a like back, return False if there was none"""
+    post_id = getattr(post, 'pk', None)
+    comment_id = getattr(comment, 'pk', None)
+    with transaction.atomic():
+        deleted, _ = Like.objects.filter(
+            user=user, **target_filter(post_id, comment_id)
+        ).delete()
+        if not deleted:
+            return False
+        bump(-1, post_id, comment_id)
+    return True
+
+
+def forget_likes(likes):
+    """Count a batch of likes out before it is deleted with its user"""
+    for post_id, comment_id in likes.values_list('post_id', 'comment_id'):
+        bump(-1, post_id, comment_id)
+
+
+def liked_ids(user, field, ids):
+    if not user.is_authenticated or not ids:
+        return set()
+    return set(Like.objects.filter(
+        user=user, **{f'{field}__in': list(ids)}
+    ).values_list(field, flat=True))
+
+
+def liked_post_ids(user, post_ids):
+    """Return which of the posts the user liked, in one query"""
+    return liked_ids(user, 'post_id', post_ids)
+
+
+def liked_comment_ids(user, comment_ids):
+    return liked_ids(user, 'comment_id', comment_ids)
+
+
+def fold(field, model, batch_size):
+    """Move counter shards of up to batch_size targets into likes_count"""
+    counters = LikeCounter.objects.filter(
+        **{f'{field}__isnull': False}
+    ).exclude(delta=0)
+    targets = list(
+        counters.order_by(field).values_list(field, flat=True).distinct()[
+            :batch_size
+        ]
+    )
+    if not targets:
+        return 0
+    with transaction.atomic():
+        # All shards of a target are read together, so the sum can't
+        # catch an unlike without the like it takes back
+        rows = list(counters.filter(
+            **{f'{field}__in': targets}
+        ).values_list('pk', field, 'delta'))
+        totals = defaultdict(int)
+        for _, target, delta in rows:
+            totals[target] += delta
+        for target, delta in totals.items():
+            if delta:
+                model.objects.filter(pk=target).update(
+                    likes_count=F('likes_count') + delta
+                )
+        # Subtracting what was read keeps likes that came in meanwhile
+        for pk, _, delta in rows:
+            LikeCounter.objects.filter(pk=pk).update(
+                delta=F('delta') - delta
+            )
+    return len(targets)
+
+
+def aggregate(batch_size=BATCH_SIZE):
+    """Fold pending shards of posts and comments, return targets done"""
+    folded = 0
+    for field, model in (('post_id', Post), ('comment_id', Comment)):
+        while True:
+            done = fold(field, model, batch_size)
+            if not done:
+                break
+            folded += done
+    LikeCounter.objects.filter(delta=0).delete()
+    return folded
@@ -0,0 +1,289 @@
+"""Live updates over Server-Sent Events.
+
+New posts and comments are pushed to subscribed browsers as the URLs of
+their cards. Each browser fetches the card with its own session, so like
+buttons, edit links and CSRF tokens are rendered for its user, which a
+fragment rendered once for everybody can't do.
+
+Subscribers live in the process serving ``yatube.asgi``; every such
+process binds a Unix datagram socket in ``LIVE_SOCKET_DIR`` so that
+events published by any other process (a WSGI worker, the scheduler, ...)
+reach all of them.
+
+Channels are ``posts`` for every new post, ``author:<id>`` for posts of
+one author and ``post:<id>`` for comments of one post.
+"""
+import asyncio
+import json
+import os
+import socket
+import threading
+from collections import defaultdict
+from importlib import import_module
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.db import close_old_connections
+from django.urls import reverse
+
+from .follows import get_follow_set
+from .models import User
+
+# Datagrams bigger than this are not fanned out to other processes
+MAX_DATAGRAM_SIZE = 64 * 1024
+
+
+def format_event(event, data, event_id=None):
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.extend(f'data: {line}' for line in data.splitlines() or [''])
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+class Subscription:
+    def __init__(self, channels, loop):
+        self.channels = frozenset(channels)
+        self.loop = loop
+        self.queue = asyncio.Queue(settings.LIVE_QUEUE_SIZE)
+
+    def deliver(self, message):
+        # A client that can't keep up loses events instead of memory
+        if not self.queue.full():
+            self.queue.put_nowait(message)
+
+
+class Broker:
+    """In-process pub/sub with datagram fan-out between processes"""
+
+    def __init__(self, socket_dir=None):
+        self.socket_dir = socket_dir
+        self.lock = threading.Lock()
+        self.channels = defaultdict(set)
+        self.subscriptions = 0
+        self.socket = None
+        self.socket_path = None
+
+    def subscribe(self, channels, loop):
+        """Return a Subscription or None when the process is full"""
+        with self.lock:
+            if self.subscriptions >= settings.LIVE_MAX_CONNECTIONS:
+                return None
+            subscription = Subscription(channels, loop)
+            for channel in subscription.channels:
+                self.channels[channel].add(subscription)
+            self.subscriptions += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                self.channels[channel].discard(subscription)
+                if not self.channels[channel]:
+                    del self.channels[channel]
+            self.subscriptions -= 1
+
+    def peers(self):
+        if not self.socket_dir or not os.path.isdir(self.socket_dir):
+            return []
+        return [
+            os.path.join(self.socket_dir, name)
+            for name in os.listdir(self.socket_dir)
+            if name.endswith('.sock')
+            and os.path.join(self.socket_dir, name) != self.socket_path
+        ]
+
+    def has_listeners(self):
+        return bool(self.subscriptions or self.peers())
+
+    def deliver_local(self, channel, message):
+        with self.lock:
+            subscriptions = list(self.channels.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(
+                subscription.deliver, message
+            )
+
+    def publish(self, channels, event, data, event_id=None):
+        message = format_event(event, data, event_id)
+        for channel in channels:
+            self.deliver_local(channel, message)
+        peers = self.peers()
+        if not peers:
+            return
+        datagram = json.dumps({
+            'channels': list(channels),
+            'message': message.decode('utf-8'),
+        }).encode('utf-8')
+        if len(datagram) > MAX_DATAGRAM_SIZE:
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+            for path in peers:
+                try:
+                    sender.sendto(datagram, path)
+                except ConnectionRefusedError:
+                    # The process behind this socket is gone
+                    self.remove_socket(path)
+                except (FileNotFoundError, BlockingIOError):
+                    pass
+
+    @staticmethod
+    def remove_socket(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def listen(self, loop):
+        """Receive events published by other processes on this loop"""
+        if self.socket is not None or not self.socket_dir:
+            return
+        os.makedirs(self.socket_dir, exist_ok=True)
+        self.socket_path = os.path.join(
+            self.socket_dir, f'{os.getpid()}.sock'
+        )
+        self.remove_socket(self.socket_path)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.bind(self.socket_path)
+        self.socket.setblocking(False)
+        loop.add_reader(self.socket.fileno(), self.on_datagram)
+
+    def on_datagram(self):
+        while True:
+            try:
+                datagram = self.socket.recv(MAX_DATAGRAM_SIZE)
+            except BlockingIOError:
+                return
+            payload = json.loads(datagram)
+            message = payload['message'].encode('utf-8')
+            for channel in payload['channels']:
+                self.deliver_local(channel, message)
+
+
+broker = Broker(settings.LIVE_SOCKET_DIR)
+
+
+def publish_post(post):
+    if not broker.has_listeners():
+        return
+    url = reverse('post_card', args=[post.author.username, post.pk])
+    broker.publish(
+        ['posts', f'author:{post.author_id}'], 'post', url, post.pk
+    )
+
+
+def publish_comment(comment):
+    if not broker.has_listeners():
+        return
+    url = reverse('comment_card', args=[comment.pk])
+    broker.publish([f'post:{comment.post_id}'], 'comment', url, comment.pk)
+
+
+def follow_channels(cookies):
+    """Return author channels for the session user or None for anonyms"""
+    session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+    if not session_key:
+        return None
+    try:
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        user = User.objects.filter(
+            pk=store(session_key).get(SESSION_KEY), is_active=True
+        ).first()
+        if user is None:
+            return None
+        return [f'author:{author_id}' for author_id in get_follow_set(user)]
+    finally:
+        close_old_connections()
+
+
+def parse_cookies(scope):
+    cookies = {}
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            for pair in value.decode('latin-1').split(';'):
+                key, _, morsel = pair.strip().partition('=')
+                cookies[key] = morsel
+    return cookies
+
+
+async def resolve_channels(scope, executor):
+    params = parse_qs(scope['query_string'].decode('latin-1'))
+    stream = params.get('stream', [''])[0]
+    if stream == 'index':
+        return ['posts']
+    if stream == 'post' and params.get('id', [''])[0].isdigit():
+        return [f'post:{params["id"][0]}']
+    if stream == 'follow':
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, follow_channels, parse_cookies(scope)
+        )
+    return None
+
+
+async def send_status(send, status, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': list(headers),
+    })
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def serve_events(scope, receive, send, executor=None):
+    """ASGI application streaming events of one subscription"""
+    loop = asyncio.get_running_loop()
+    broker.listen(loop)
+    channels = await resolve_channels(scope, executor)
+    if channels is None:
+        await send_status(send, 400)
+        return
+    subscription = broker.subscribe(channels, loop)
+    if subscription is None:
+        await send_status(send, 503, [(b'retry-after', b'30')])
+        return
+    disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'retry: 5000\n\n',
+            'more_body': True,
+        })
+        while True:
+            message = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait(
+                {message, disconnect},
+                timeout=settings.LIVE_HEARTBEAT,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnect in done:
+                message.cancel()
+                return
+            if message in done:
+                body = message.result()
+            else:
+                message.cancel()
+                body = b': ping\n\n'
+            await send({
+                'type': 'http.response.body',
+                'body': body,
+                'more_body': True,
+            })
+    finally:
+        disconnect.cancel()
+        broker.unsubscribe(subscription)
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.likes import BATCH_SIZE, aggregate
+
+
+class Command(BaseCommand):
+    help = 'Fold like counter shards into likes_count'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Fold what is pending and exit'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='Seconds to sleep between runs'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Posts or comments per transaction'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            folded = aggregate(options['batch_size'])
+            if folded:
+                self.stdout.write(f'Updated like counts of {folded} items')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
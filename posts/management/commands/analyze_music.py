@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from posts.audio import analyze, apply_info
+from posts.models import Post
+
+FIELDS = [
+    'music_duration', 'music_bitrate', 'music_title', 'music_artist',
+    'music_peaks',
+]
+
+
+class Command(BaseCommand):
+    help = 'Read duration, tags and waveform of music uploaded earlier'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Analyze every file, not only ones without metadata'
+        )
+
+    def handle(self, *args, **options):
+        queryset = Post.objects.exclude(music='').exclude(
+            music__isnull=True
+        ).order_by('pk')
+        if not options['all']:
+            queryset = queryset.filter(music_duration__isnull=True)
+        total, missing, last_pk = 0, 0, 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk).only(
+                'pk', 'music'
+            )[:options['batch_size']])
+            if not batch:
+                break
+            for post in batch:
+                info = None
+                try:
+                    with post.music.open('rb') as music:
+                        info = analyze(music)
+                except OSError:
+                    missing += 1
+                apply_info(post, info)
+            Post.objects.bulk_update(batch, FIELDS)
+            total += len(batch)
+            last_pk = batch[-1].pk
+        self.stdout.write(f'{total} files analyzed, {missing} missing')
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.archive import BATCH_SIZE, archive_posts
+
+
+class Command(BaseCommand):
+    help = 'Move old posts and their comments to the archive database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+            help='Archive posts older than this many days'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Posts moved per transaction'
+        )
+
+    def handle(self, *args, **options):
+        moved = archive_posts(options['days'], options['batch_size'])
+        self.stdout.write(f'Archived {moved} posts')
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.tags import index_post
+
+
+class Command(BaseCommand):
+    help = 'Build tag and mention index rows for existing posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--after', type=int, default=0,
+            help='Only index posts with a bigger id (to resume a run)'
+        )
+
+    def handle(self, *args, **options):
+        last_pk, total = options['after'], 0
+        while True:
+            batch = list(
+                Post.objects.published().filter(pk__gt=last_pk).order_by(
+                    'pk'
+                ).only('pk', 'text', 'pub_date')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            for post in batch:
+                index_post(post)
+            total += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f'Indexed {total} posts, last id {last_pk}')
@@ -0,0 +1,72 @@
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+STOCK = 'django.contrib.flatpages.middleware.FlatpageFallbackMiddleware'
+CACHED = 'posts.flatpages.CachedFlatpageFallbackMiddleware'
+# What crawlers and vulnerability scanners typically ask for
+PROBES = [
+    '/wp-login.php', '/wp-admin/', '/.env', '/xmlrpc.php', '/.git/config',
+    '/phpmyadmin/', '/admin.php', '/config.json', '/robots.txt',
+    '/sitemap.xml', '/favicon.ico', '/apple-touch-icon.png',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay a bot-style 404 flood against the stock and the cached '
+        'flatpage fallback middleware'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument(
+            '--unique', type=float, default=0.2,
+            help='Share of requests for never repeated paths'
+        )
+
+    def handle(self, *args, **options):
+        # Every request would log a 'Not Found' warning
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        rng = random.Random(0)
+        paths = [
+            f'/no-such-page-{number}/' if rng.random() < options['unique']
+            else rng.choice(PROBES)
+            for number in range(options['requests'])
+        ]
+        for name, middleware in (('stock', STOCK), ('cached', CACHED)):
+            stack = [
+                CACHED if item == STOCK else item
+                for item in settings.MIDDLEWARE
+            ]
+            stack = [middleware if item == CACHED else item for item in stack]
+            cache.clear()
+            with override_settings(MIDDLEWARE=stack):
+                self.report(name, *self.run(paths))
+
+    def run(self, paths):
+        client = Client()
+        statuses = set()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.monotonic()
+            for path in paths:
+                # Stay out of INTERNAL_IPS so the debug toolbar is skipped
+                statuses.add(client.get(path, REMOTE_ADDR='10.0.0.1')
+                             .status_code)
+            elapsed = time.monotonic() - started
+        return len(paths), elapsed, len(queries), statuses
+
+    def report(self, name, count, elapsed, queries, statuses):
+        self.stdout.write(
+            f'{name}: {count} requests in {elapsed:.2f}s, '
+            f'{count / elapsed:.0f} req/s, '
+            f'{queries / count:.2f} queries per request, '
+            f'statuses {sorted(statuses)}'
+        )
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+
+class Gauge:
+    """Track how many connections are being served at the same time"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc_info):
+        with self.lock:
+            self.current -= 1
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve many slow connections through the WSGI and the ASGI path '
+        'with the same number of threads and compare the results'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/')
+        parser.add_argument('--connections', type=int, default=200)
+        parser.add_argument(
+            '--client-delay', type=float, default=0.05,
+            help='Seconds each client needs to send its request'
+        )
+
+    def handle(self, *args, **options):
+        from yatube.asgi import application, wsgi_application
+
+        self.path = options['path']
+        self.connections = options['connections']
+        self.delay = options['client_delay']
+        self.threads = settings.ASGI_THREADS
+        self.report('WSGI', *self.run_wsgi(wsgi_application))
+        self.report('ASGI', *asyncio.run(self.run_asgi(application)))
+
+    def report(self, name, elapsed, peak):
+        self.stdout.write(
+            f'{name}: {self.connections} connections, {self.threads} '
+            f'threads, {elapsed:.2f}s, '
+            f'{self.connections / elapsed:.0f} req/s, '
+            f'{peak} connections served at once'
+        )
+
+    def run_wsgi(self, wsgi_application):
+        gauge = Gauge()
+        factory = RequestFactory()
+
+        def connection(number):
+            # A sync worker holds its thread while the client is sending
+            with gauge:
+                time.sleep(self.delay)
+                # Stay out of INTERNAL_IPS so the debug toolbar is skipped
+                environ = factory.get(
+                    self.path, REMOTE_ADDR='10.0.0.1'
+                ).environ
+                response = wsgi_application(environ, lambda *args: None)
+                b''.join(response)
+                response.close()
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(self.threads) as pool:
+            list(pool.map(connection, range(self.connections)))
+        return time.monotonic() - started, gauge.peak
+
+    async def run_asgi(self, application):
+        gauge = Gauge()
+
+        async def connection(number):
+            scope = {
+                'type': 'http',
+                'method': 'GET',
+                'path': self.path,
+                'query_string': b'',
+                'headers': [(b'host', b'testserver')],
+                'server': ('testserver', 80),
+                'client': ('10.0.0.1', 10000 + number),
+            }
+
+            async def receive():
+                await asyncio.sleep(self.delay)
+                return {'type': 'http.request', 'body': b''}
+
+            async def send(message):
+                pass
+
+            with gauge:
+                await application(scope, receive, send)
+
+        started = time.monotonic()
+        await asyncio.gather(*(
+            connection(number) for number in range(self.connections)
+        ))
+        return time.monotonic() - started, gauge.peak
@@ -0,0 +1,68 @@
+import asyncio
+import resource
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.live import broker, serve_events
+
+
+class Command(BaseCommand):
+    help = 'Hold many idle SSE connections and fan one event out to them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options['connections']))
+
+    async def run(self, count):
+        closed = asyncio.Event()
+        received = 0
+        everyone_received = asyncio.Event()
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': '/events/',
+            'query_string': b'stream=index',
+            'headers': [],
+        }
+
+        async def receive():
+            await closed.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            nonlocal received
+            if message.get('body', b'').startswith(b'event: post'):
+                received += 1
+                if received == count:
+                    everyone_received.set()
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.monotonic()
+        clients = [
+            asyncio.ensure_future(serve_events(scope, receive, send))
+            for _ in range(count)
+        ]
+        while broker.subscriptions < count:
+            await asyncio.sleep(0.01)
+        connected = time.monotonic() - started
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.stdout.write(
+            f'{count} connections open in {connected:.2f}s, '
+            f'~{(rss_after - rss_before) * 1024 / count / 1024:.1f} KiB '
+            f'each'
+        )
+
+        started = time.monotonic()
+        broker.publish(['posts'], 'post', '<div>bench</div>')
+        await everyone_received.wait()
+        self.stdout.write(
+            f'Event delivered to all of them in '
+            f'{(time.monotonic() - started) * 1000:.1f}ms'
+        )
+
+        closed.set()
+        await asyncio.gather(*clients)
+        self.stdout.write(f'Subscriptions left: {broker.subscriptions}')
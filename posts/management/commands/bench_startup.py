@@ -0,0 +1,98 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Runs in a fresh interpreter, so nothing is imported beforehand
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+set_up = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+from wsgiref.util import setup_testing_defaults
+application = get_wsgi_application()
+handler = time.perf_counter()
+timings = []
+for _ in range(2):
+    environ = {'PATH_INFO': sys.argv[1], 'REMOTE_ADDR': '10.0.0.1'}
+    setup_testing_defaults(environ)
+    statuses = []
+    began = time.perf_counter()
+    response = application(
+        environ, lambda status, headers: statuses.append(status)
+    )
+    b''.join(response)
+    response.close()
+    timings.append(time.perf_counter() - began)
+print(json.dumps({
+    'setup': set_up - started,
+    'handler': handler - set_up,
+    'first': timings[0],
+    'second': timings[1],
+    'status': statuses[0],
+    'modules': len(sys.modules),
+}))
+'''
+PROFILES = ('dev', 'test', 'prod')
+
+
+class Command(BaseCommand):
+    help = (
+        'Start fresh interpreters with each settings profile and measure '
+        'import, setup and first-request latency'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--profile', action='append', choices=PROFILES,
+            help='Profiles to measure, all by default'
+        )
+
+    def handle(self, *args, **options):
+        for profile in options['profile'] or PROFILES:
+            runs = [
+                self.run(profile, options['path'])
+                for _ in range(options['repeat'])
+            ]
+            self.report(profile, runs)
+
+    def run(self, profile, path):
+        env = dict(
+            os.environ,
+            YATUBE_PROFILE=profile,
+            DJANGO_SETTINGS_MODULE='yatube.settings',
+            ALLOWED_HOSTS='127.0.0.1',
+        )
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', CHILD, path],
+            env=env,
+            cwd=settings.BASE_DIR,
+            check=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+        result = json.loads(output.decode().splitlines()[-1])
+        result['process'] = time.perf_counter() - started
+        return result
+
+    def report(self, profile, runs):
+        def median(key):
+            return statistics.median(run[key] for run in runs) * 1000
+
+        self.stdout.write(
+            f'{profile}: process {median("process"):.0f}ms, '
+            f'django.setup {median("setup"):.0f}ms, '
+            f'handler {median("handler"):.0f}ms, '
+            f'first request {median("first"):.0f}ms, '
+            f'second request {median("second"):.1f}ms, '
+            f'{runs[0]["modules"]} modules, status {runs[0]["status"]}'
+        )
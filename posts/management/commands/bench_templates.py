@@ -0,0 +1,101 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.template.backends.django import DjangoTemplates
+from django.test import RequestFactory
+
+from posts import template_timing
+from posts.models import Group, Post, User
+
+LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Render 10- and 100-post feed pages with and without caching'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        # Sample rows are created inside a transaction that is rolled back
+        try:
+            with transaction.atomic():
+                self.run()
+                raise Rollback
+        except Rollback:
+            pass
+
+    def engine(self, cached):
+        options = dict(settings.TEMPLATES[0]['OPTIONS'])
+        options['loaders'] = (
+            [('django.template.loaders.cached.Loader', LOADERS)]
+            if cached else LOADERS
+        )
+        return DjangoTemplates({
+            'NAME': 'bench',
+            'DIRS': settings.TEMPLATES[0]['DIRS'],
+            'APP_DIRS': False,
+            'OPTIONS': options,
+        })
+
+    def run(self):
+        author = User.objects.create(username='bench_author')
+        group = Group.objects.create(
+            title='Bench', slug='bench-group', description='Bench'
+        )
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}\nвторая строка', author=author,
+                 group=group)
+            for number in range(100)
+        )
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        template_timing.install()
+        try:
+            for size in (10, 100):
+                posts = Post.objects.select_related('author', 'group')
+                paginator = Paginator(posts, size)
+                context = {
+                    'group': group,
+                    'group_page': True,
+                    'paginator': paginator,
+                    'page': paginator.get_page(1),
+                }
+                list(context['page'])
+                for cached in (False, True):
+                    self.measure(size, cached, context, request)
+        finally:
+            template_timing.uninstall()
+
+    def measure(self, size, cached, context, request):
+        template = self.engine(cached).get_template('group.html')
+        template.render(context, request)
+        template_timing.start_collecting()
+        started = time.perf_counter()
+        for _ in range(self.repeat):
+            template.render(context, request)
+        elapsed = (time.perf_counter() - started) / self.repeat
+        totals = template_timing.stop_collecting()
+        mode = 'cached loader' if cached else 'default loaders'
+        self.stdout.write(
+            f'{size} posts, {mode}: {elapsed * 1000:.2f}ms per page'
+        )
+        for name, (count, seconds) in sorted(
+            totals.items(), key=lambda item: -item[1][1]
+        )[:4]:
+            self.stdout.write(
+                f'    {name}: {count // self.repeat} renders, '
+                f'{seconds * 1000 / self.repeat:.2f}ms'
+            )
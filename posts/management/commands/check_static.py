@@ -0,0 +1,81 @@
+import gzip
+import json
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.staticfiles import brotli
+
+
+class Command(BaseCommand):
+    help = (
+        'Verify collected static files against the manifest and report '
+        'original and compressed sizes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--budget', type=int, default=0,
+            help='Fail when a file is bigger than this many KB compressed'
+        )
+
+    def handle(self, *args, **options):
+        manifest_path = os.path.join(
+            settings.STATIC_ROOT, staticfiles_storage.manifest_name
+        )
+        if not os.path.isfile(manifest_path):
+            raise CommandError(f'No manifest at {manifest_path}')
+        with open(manifest_path, encoding='utf-8') as manifest:
+            paths = json.load(manifest)['paths']
+        problems = []
+        totals = {'original': 0, 'gzip': 0, 'br': 0}
+        for name, hashed_name in sorted(paths.items()):
+            problems.extend(self.check(name, hashed_name, totals, options))
+        self.stdout.write(
+            f'{len(paths)} files, {totals["original"] / 1024:.1f} KB, '
+            f'gzip {totals["gzip"] / 1024:.1f} KB, '
+            f'br {totals["br"] / 1024:.1f} KB'
+        )
+        if problems:
+            raise CommandError('\n'.join(problems))
+
+    def check(self, name, hashed_name, totals, options):
+        path = os.path.join(settings.STATIC_ROOT, hashed_name)
+        if not os.path.isfile(path):
+            return [f'{hashed_name}: missing']
+        with open(path, 'rb') as asset:
+            content = asset.read()
+        problems = []
+        # The name carries the hash of the stored (already rewritten) content
+        digest = staticfiles_storage.file_hash(
+            hashed_name, ContentFile(content)
+        )
+        root, _ = os.path.splitext(hashed_name)
+        if not root.endswith(f'.{digest}'):
+            problems.append(f'{hashed_name}: content hash is {digest}')
+        totals['original'] += len(content)
+        smallest = len(content)
+        for encoding, suffix, unpack in (
+            ('gzip', '.gz', gzip.decompress),
+            ('br', '.br', brotli.decompress if brotli else None),
+        ):
+            if not os.path.isfile(path + suffix):
+                continue
+            with open(path + suffix, 'rb') as packed_file:
+                packed = packed_file.read()
+            totals[encoding] += len(packed)
+            smallest = min(smallest, len(packed))
+            if len(packed) >= len(content):
+                problems.append(f'{hashed_name}{suffix}: not smaller')
+            if unpack is not None and unpack(packed) != content:
+                problems.append(f'{hashed_name}{suffix}: content differs')
+        budget = options['budget'] * 1024
+        if budget and smallest > budget:
+            problems.append(
+                f'{hashed_name}: {smallest / 1024:.1f} KB over the budget'
+            )
+        return problems
+
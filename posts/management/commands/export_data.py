@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.transfer import get_format, iter_records, write_records
+
+
+class Command(BaseCommand):
+    help = 'Stream site content to a JSONL or CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSONL or CSV file to write')
+        parser.add_argument('--format', choices=('jsonl', 'csv'))
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            format = get_format(options['path'], options['format'])
+        except ValueError as error:
+            raise CommandError(error)
+        started = time.monotonic()
+        total = 0
+        with open(
+            options['path'], 'w', newline='', encoding='utf-8'
+        ) as stream:
+            records = iter_records(options['chunk_size'])
+            for _ in write_records(stream, format, records):
+                total += 1
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {total} records in {elapsed:.2f}s '
+            f'({total / max(elapsed, 1e-6):.0f} records/s)'
+        ))
@@ -0,0 +1,94 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts import feeds
+from posts.follows import invalidate_follow_set
+from posts.groups import invalidate_group_choices
+from posts.models import User
+from posts.threads import fill_paths
+from posts.transfer import (
+    MODELS, from_record, get_format, insert, read_records, reset_sequences
+)
+
+
+class Command(BaseCommand):
+    help = 'Stream site content from a JSONL or CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSONL or CSV file to import')
+        parser.add_argument('--format', choices=('jsonl', 'csv'))
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--ignore-conflicts', action='store_true',
+            help='Skip records whose ids already exist'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            format = get_format(options['path'], options['format'])
+        except ValueError as error:
+            raise CommandError(error)
+        self.batch_size = options['batch_size']
+        self.ignore_conflicts = options['ignore_conflicts']
+        self.counts = dict.fromkeys(MODELS, 0)
+        self.followers = set()
+        self.first_post_pk = None
+        started = time.monotonic()
+        with open(options['path'], newline='', encoding='utf-8') as stream:
+            self.load(read_records(stream, format))
+        # Work that would slow down every batch is done once at the end
+        reset_sequences()
+        if self.counts['post']:
+            call_command(
+                'backfill_tags', after=(self.first_post_pk or 1) - 1,
+                stdout=self.stdout
+            )
+        for user in User.objects.filter(pk__in=self.followers):
+            invalidate_follow_set(user)
+        if self.counts['group']:
+            invalidate_group_choices()
+        if self.counts['post']:
+            feeds.touch(feeds.ALL)
+        if self.counts['comment']:
+            fill_paths()
+        elapsed = time.monotonic() - started
+        total = sum(self.counts.values())
+        for label, count in self.counts.items():
+            self.stdout.write(f'{label}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {total} records in {elapsed:.2f}s '
+            f'({total / max(elapsed, 1e-6):.0f} records/s)'
+        ))
+
+    def load(self, records):
+        label, batch = None, []
+        for record in records:
+            if record['model'] not in MODELS:
+                raise CommandError(f'Unknown model: {record["model"]}')
+            if batch and (record['model'] != label
+                          or len(batch) >= self.batch_size):
+                self.flush(label, batch)
+                batch = []
+            label = record['model']
+            batch.append(from_record(record))
+        if batch:
+            self.flush(label, batch)
+
+    def flush(self, label, batch):
+        if label in ('post', 'comment'):
+            for obj in batch:
+                obj.render_html()
+        with transaction.atomic():
+            insert(label, batch, self.ignore_conflicts)
+        if label == 'post':
+            # Tag index rows for imported posts are built once at the end
+            ids = [obj.pk for obj in batch if obj.pk is not None]
+            if ids and (self.first_post_pk is None
+                        or min(ids) < self.first_post_pk):
+                self.first_post_pk = min(ids)
+        if label == 'follow':
+            self.followers.update(obj.user_id for obj in batch)
+        self.counts[label] += len(batch)
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.scheduling import BATCH_SIZE, next_due, publish_due
+
+
+class Command(BaseCommand):
+    help = 'Publish scheduled posts that are due'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Publish what is due and exit'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=60,
+            help='Longest sleep between runs, in seconds'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Posts per transaction'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            while True:
+                published = publish_due(options['batch_size'])
+                if not published:
+                    break
+                total += published
+            if total:
+                self.stdout.write(f'Published {total} scheduled posts')
+            if options['once']:
+                return
+            delay = options['interval']
+            due = next_due()
+            if due is not None:
+                # Wake up when the next post is due
+                delay = min(delay, (due - timezone.now()).total_seconds())
+            time.sleep(max(delay, 0))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.ratelimit import STATS_DAYS, throttled_counts
+
+
+class Command(BaseCommand):
+    help = (
+        'Show roughly how many requests were throttled per scope '
+        f'in the last {STATS_DAYS} days'
+    )
+
+    def handle(self, *args, **options):
+        for scope, count in throttled_counts().items():
+            self.stdout.write(f'{scope}: {count}')
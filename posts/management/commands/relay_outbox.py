@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.outbox import BATCH_SIZE, TIMEOUT, prune, relay
+
+
+class Command(BaseCommand):
+    help = 'Deliver outbox events to webhook endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Deliver the current backlog and exit'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1,
+            help='Seconds to sleep when there is nothing to deliver'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Events per request'
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=TIMEOUT,
+            help='Seconds to wait for an endpoint to answer'
+        )
+        parser.add_argument(
+            '--prune', action='store_true',
+            help='Delete events all endpoints have received'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            while True:
+                delivered = relay(options['batch_size'], options['timeout'])
+                if not delivered:
+                    break
+                total += delivered
+            if total:
+                self.stdout.write(f'Delivered {total} events')
+            if options['prune']:
+                prune()
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Comment, Post
+from posts.rendering import RENDERER_VERSION
+
+
+class Command(BaseCommand):
+    help = 'Re-render stored post and comment HTML made by older renderers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Re-render every row, not only outdated ones'
+        )
+
+    def handle(self, *args, **options):
+        for model in (Post, Comment):
+            queryset = model.objects.order_by('pk')
+            if not options['all']:
+                queryset = queryset.filter(
+                    text_html_version__lt=RENDERER_VERSION
+                )
+            total, last_pk = 0, 0
+            while True:
+                batch = list(queryset.filter(pk__gt=last_pk).only(
+                    'pk', 'text'
+                )[:options['batch_size']])
+                if not batch:
+                    break
+                for obj in batch:
+                    obj.render_html()
+                model.objects.bulk_update(
+                    batch, ['text_html', 'text_html_version']
+                )
+                total += len(batch)
+                last_pk = batch[-1].pk
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: {total} re-rendered'
+            )
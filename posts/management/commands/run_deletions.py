@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.deletion import BATCH_SIZE, claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = 'Delete scheduled users and groups in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Process the current queue and exit'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='Seconds to sleep when the queue is empty'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+                continue
+            try:
+                run_job(job, options['batch_size'])
+            except Exception as error:
+                self.stderr.write(f'Deletion of {job} failed: {error}')
+            else:
+                self.stdout.write(f'Deleted {job}')
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.exports import (
+    claim_next_export, process_export, purge_expired
+)
+
+
+class Command(BaseCommand):
+    help = 'Build pending personal data archives'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Process the current queue and exit'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='Seconds to sleep when the queue is empty'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            purged = purge_expired()
+            if purged:
+                self.stdout.write(f'Deleted {purged} expired exports')
+            export = claim_next_export()
+            if export is None:
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+                continue
+            try:
+                process_export(export)
+            except Exception as error:
+                self.stderr.write(f'Export {export.pk} failed: {error}')
+            else:
+                self.stdout.write(f'Export {export.pk} is ready')
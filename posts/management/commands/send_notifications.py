@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.notifications import DIGEST_BATCH_SIZE, dispatch_digests
+
+
+class Command(BaseCommand):
+    help = 'Send digest emails for pending notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Process the current queue and exit'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=600,
+            help='Seconds between digests, events in between are coalesced'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=DIGEST_BATCH_SIZE,
+            help='Recipients per batch'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            while True:
+                processed = dispatch_digests(options['batch_size'])
+                if not processed:
+                    break
+                total += processed
+            if total:
+                self.stdout.write(f'Processed {total} notifications')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.6 on 2026-10-19 14:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0019_post_music'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataExport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Собирается'), ('done', 'Готов'), ('failed', 'Ошибка')], db_index=True, default='pending', max_length=10, verbose_name='Статус')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата запроса')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Дата готовности')),
+                ('archive', models.FileField(blank=True, null=True, upload_to='exports/', verbose_name='Архив')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='data_exports', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Выгрузка данных',
+                'verbose_name_plural': 'Выгрузки данных',
+                'ordering': ('-created',),
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.6 on 2026-10-19 14:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_dataexport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'Пользователь'), ('group', 'Сообщество')], max_length=10, verbose_name='Что удаляем')),
+                ('object_id', models.PositiveIntegerField(verbose_name='ID объекта')),
+                ('label', models.CharField(max_length=200, verbose_name='Название')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершено'), ('failed', 'Ошибка')], db_index=True, default='pending', max_length=10, verbose_name='Статус')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Всего связанных объектов')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Обработано')),
+                ('media_removed', models.PositiveIntegerField(default=0, verbose_name='Удалено медиафайлов')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата постановки')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Дата завершения')),
+            ],
+            options={
+                'verbose_name': 'Фоновое удаление',
+                'verbose_name_plural': 'Фоновые удаления',
+                'ordering': ('-created',),
+            },
+        ),
+    ]
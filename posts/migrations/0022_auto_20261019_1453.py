@@ -0,0 +1,47 @@
+# Generated by Django 2.2.6 on 2026-10-19 14:53
+
+from django.db import migrations, models
+from django.template.defaultfilters import linebreaksbr
+
+
+def render_existing(apps, schema_editor):
+    # Version 1 of posts.rendering, frozen here for this migration
+    for name in ('Post', 'Comment'):
+        model = apps.get_model('posts', name)
+        rows = model.objects.only('pk', 'text')
+        for row in rows.iterator(chunk_size=500):
+            model.objects.filter(pk=row.pk).update(
+                text_html=linebreaksbr(row.text, autoescape=True),
+                text_html_version=1,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_deletionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='text_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='HTML текста'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='text_html_version',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Версия рендера'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='text_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='HTML текста'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='text_html_version',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Версия рендера'),
+        ),
+        migrations.RunPython(render_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 2.2.6 on 2026-10-19 14:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0023_auto_20261019_1454'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('verb', models.CharField(choices=[('follow', 'Подписка'), ('comment', 'Комментарий')], max_length=10, verbose_name='Событие')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата события')),
+                ('is_read', models.BooleanField(default=False, verbose_name='Прочитано')),
+                ('dispatched', models.BooleanField(default=False, verbose_name='Обработано рассылкой')),
+                ('actor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Инициатор')),
+                ('comment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.Comment', verbose_name='Комментарий')),
+                ('post', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.Post', verbose_name='Запись')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL, verbose_name='Получатель')),
+            ],
+            options={
+                'verbose_name': 'Уведомление',
+                'verbose_name_plural': 'Уведомления',
+                'ordering': ('-created',),
+            },
+        ),
+        migrations.CreateModel(
+            name='Inbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread', models.PositiveIntegerField(default=0, verbose_name='Непрочитанных')),
+                ('email_on_follow', models.BooleanField(default=True, verbose_name='Письма о новых подписчиках')),
+                ('email_on_comment', models.BooleanField(default=True, verbose_name='Письма о комментариях')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='inbox', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Настройки уведомлений',
+                'verbose_name_plural': 'Настройки уведомлений',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['dispatched', 'recipient'], name='notification_outbox_idx'),
+        ),
+    ]
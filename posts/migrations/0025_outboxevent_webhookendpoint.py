@@ -0,0 +1,44 @@
+# Generated by Django 2.2.6 on 2026-10-19 15:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0024_auto_20261019_1456'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(choices=[('post.created', 'Новая запись'), ('post.updated', 'Запись изменена'), ('post.deleted', 'Запись удалена'), ('comment.created', 'Новый комментарий'), ('follow.created', 'Новая подписка'), ('follow.deleted', 'Отписка')], max_length=20, verbose_name='Событие')),
+                ('payload', models.TextField(verbose_name='Данные')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата события')),
+            ],
+            options={
+                'verbose_name': 'Событие для вебхуков',
+                'verbose_name_plural': 'События для вебхуков',
+                'ordering': ('pk',),
+            },
+        ),
+        migrations.CreateModel(
+            name='WebhookEndpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(verbose_name='Адрес')),
+                ('secret', models.CharField(max_length=100, verbose_name='Ключ подписи')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Включен')),
+                ('cursor', models.PositiveIntegerField(default=0, verbose_name='Последнее доставленное событие')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Неудачных попыток подряд')),
+                ('next_attempt_at', models.DateTimeField(blank=True, null=True, verbose_name='Следующая попытка')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+            ],
+            options={
+                'verbose_name': 'Вебхук',
+                'verbose_name_plural': 'Вебхуки',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-19 15:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0026_auto_20261019_1505'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='group',
+            name='title',
+            field=models.CharField(db_index=True, max_length=200, verbose_name='Название сообщества'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.6 on 2026-10-19 15:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0027_auto_20261019_1507'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='music_artist',
+            field=models.CharField(blank=True, editable=False, max_length=200, verbose_name='Исполнитель'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='music_bitrate',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Битрейт, кбит/с'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='music_duration',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Длительность, с'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='music_peaks',
+            field=models.TextField(blank=True, editable=False, verbose_name='Форма волны'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='music_title',
+            field=models.CharField(blank=True, editable=False, max_length=200, verbose_name='Название трека'),
+        ),
+    ]
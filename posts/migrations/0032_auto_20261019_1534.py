@@ -0,0 +1,38 @@
+# Generated by Django 2.2.6 on 2026-10-19 15:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0031_auto_20261019_1531'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostRevision',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(verbose_name='Номер')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата')),
+                ('is_snapshot', models.BooleanField(default=False, verbose_name='Полная копия')),
+                ('text', models.TextField(blank=True, verbose_name='Текст')),
+                ('delta', models.TextField(blank=True, verbose_name='Изменения')),
+                ('length', models.PositiveIntegerField(verbose_name='Длина текста')),
+                ('lines_added', models.PositiveIntegerField(default=0, verbose_name='Добавлено строк')),
+                ('lines_removed', models.PositiveIntegerField(default=0, verbose_name='Удалено строк')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='posts.Post', verbose_name='Запись')),
+            ],
+            options={
+                'verbose_name': 'Версия записи',
+                'verbose_name_plural': 'Версии записей',
+                'ordering': ('-number',),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='postrevision',
+            constraint=models.UniqueConstraint(fields=('post', 'number'), name='postrevision_post_number_unique'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 2.2.6 on 2026-10-19 15:46
+
+import os
+import shutil
+
+from django.conf import settings
+from django.db import migrations, models
+import posts.models
+
+
+def move_archives(apps, schema_editor):
+    """Take built archives out of the public MEDIA_ROOT"""
+    DataExport = apps.get_model('posts', 'DataExport')
+    names = DataExport.objects.exclude(archive='').exclude(
+        archive=None
+    ).values_list('archive', flat=True)
+    for name in names.iterator(chunk_size=500):
+        source = os.path.join(settings.MEDIA_ROOT, name)
+        if not os.path.isfile(source):
+            continue
+        target = os.path.join(settings.EXPORT_ROOT, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(source, target)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0032_auto_20261019_1534'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dataexport',
+            name='archive',
+            field=models.FileField(blank=True, null=True, storage=posts.models.ExportStorage(), upload_to='', verbose_name='Архив'),
+        ),
+        migrations.RunPython(move_archives, migrations.RunPython.noop),
+    ]
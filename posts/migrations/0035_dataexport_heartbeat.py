@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-19 16:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0034_auto_20261019_1557'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataexport',
+            name='heartbeat',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Последняя активность'),
+        ),
+    ]
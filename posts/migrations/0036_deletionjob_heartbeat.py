@@ -0,0 +1,22 @@
+# Generated by Django 2.2.6 on 2026-10-19 16:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0035_dataexport_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deletionjob',
+            name='heartbeat',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Последняя активность'),
+        ),
+        migrations.AddConstraint(
+            model_name='deletionjob',
+            constraint=models.UniqueConstraint(condition=models.Q(status__in=('pending', 'running')), fields=('kind', 'object_id'), name='deletionjob_one_active'),
+        ),
+    ]
@@ -1,14 +1,56 @@
+import os
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .rendering import RENDERER_VERSION, render_text
 
 User = get_user_model()
 
+# Comment.path: fixed-width ids keep text order equal to thread order
+PATH_SEGMENT = 10
+MAX_DEPTH = 5
+
+
+def path_segment(pk):
+    return f'{pk:0{PATH_SEGMENT}d}'
+
+
+class RenderedTextMixin(models.Model):
+    """Keep an HTML copy of ``text`` produced by posts.rendering"""
+    text_html = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='HTML текста'
+    )
+    text_html_version = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Версия рендера'
+    )
+
+    class Meta:
+        abstract = True
+
+    def render_html(self):
+        self.text_html = render_text(self.text)
+        self.text_html_version = RENDERER_VERSION
+
+    def save(self, *args, **kwargs):
+        self.render_html()
+        super().save(*args, **kwargs)
+
 
 class Group(models.Model):
 
     title = models.CharField(
         max_length=200,
-        verbose_name='Название сообщества'
+        verbose_name='Название сообщества',
+        db_index=True
     )
     slug = models.SlugField(max_length=100, unique=True)
     description = models.TextField(
@@ -24,14 +66,37 @@ class Group(models.Model):
        return self.title
 
 
-class Post(models.Model):
+class PostQuerySet(models.QuerySet):
+
+    def published(self):
+        """Return posts visible to readers, over post_published_idx"""
+        return self.filter(is_published=True)
+
+
+class Post(RenderedTextMixin):
     text = models.TextField(
         verbose_name='Текст записи',
         help_text='Не оставляй это поле пустым'
     )
+    # Set again when a draft or a scheduled post goes live, never by hand
     pub_date = models.DateTimeField(
         verbose_name='Дата публикации',
-        auto_now_add=True
+        default=timezone.now,
+        editable=False,
+        db_index=True
+    )
+    # Drafts and scheduled posts are seen by their author only
+    is_published = models.BooleanField(
+        default=True,
+        editable=False,
+        verbose_name='Опубликована'
+    )
+    # Picked up by the publish_scheduled worker; empty for drafts
+    publish_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name='Опубликовать в',
+        help_text='Оставь пустым, чтобы опубликовать сразу'
     )
     author = models.ForeignKey(
         User,
@@ -63,14 +128,83 @@ class Post(models.Model):
         verbose_name='Музыкальный файл',
         help_text='Файл должен быть в расширении .mp3'
     )
+    # Read from the file by posts.audio when it is uploaded
+    music_duration = models.FloatField(
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name='Длительность, с'
+    )
+    music_bitrate = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name='Битрейт, кбит/с'
+    )
+    music_title = models.CharField(
+        max_length=200,
+        blank=True,
+        editable=False,
+        verbose_name='Название трека'
+    )
+    music_artist = models.CharField(
+        max_length=200,
+        blank=True,
+        editable=False,
+        verbose_name='Исполнитель'
+    )
+    music_peaks = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='Форма волны'
+    )
+    # Folded in from LikeCounter shards by posts.likes.aggregate
+    likes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Лайков'
+    )
+    # True on read-only copies loaded from posts.archive
+    is_archived = False
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Запись'
         verbose_name_plural = 'Записи'
+        indexes = [
+            # Lists and feeds never read unpublished rows
+            models.Index(
+                fields=['-pub_date'],
+                name='post_published_idx',
+                condition=models.Q(is_published=True),
+            ),
+            # Only pending posts are due; published ones leave the index
+            models.Index(
+                fields=['publish_at'],
+                name='post_due_idx',
+                condition=models.Q(is_published=False),
+            ),
+        ]
+
+    @property
+    def music_length(self):
+        """Return the duration as m:ss"""
+        minutes, seconds = divmod(round(self.music_duration or 0), 60)
+        return f'{minutes}:{seconds:02}'
+
+    @property
+    def waveform(self):
+        """Return (x, y, height) of waveform bars in a 100-high box"""
+        peaks = [int(peak) for peak in self.music_peaks.split(',') if peak]
+        return [
+            (x, (100 - peak) // 2, max(peak, 1))
+            for x, peak in enumerate(peaks)
+        ]
 
     def __str__(self):
-        group = self.group.title or 'No Group'
+        group = self.group.title if self.group else 'No Group'
         post_data = [
             self.text[0:15],
             self.author.username,
@@ -80,7 +214,7 @@ class Post(models.Model):
         return '|'.join(post_data)
 
 
-class Comment(models.Model):
+class Comment(RenderedTextMixin):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -102,9 +236,95 @@ class Comment(models.Model):
         verbose_name='Дата публикации комментария',
         auto_now_add=True
     )
+    likes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Лайков'
+    )
+    # Threads, see posts.threads. A top-level comment is its own root
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        related_name='replies',
+        blank=True,
+        null=True,
+        verbose_name='Ответ на'
+    )
+    root = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        related_name='+',
+        blank=True,
+        null=True,
+        editable=False,
+        # comment_thread_idx starts with it
+        db_index=False,
+        verbose_name='Начало ветки'
+    )
+    # Zero-padded ids of the root, ..., parent and the comment itself
+    path = models.CharField(
+        max_length=(PATH_SEGMENT + 1) * (MAX_DEPTH + 1),
+        blank=True,
+        editable=False,
+        verbose_name='Путь в ветке'
+    )
+    depth = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Глубина'
+    )
+    # Position in the thread by time; the root is 0
+    seq = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Номер в ветке'
+    )
+    replies_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Ответов в ветке'
+    )
 
     class Meta:
         ordering = ('-created',)
+        indexes = [
+            models.Index(fields=['post', 'depth'], name='comment_roots_idx'),
+            models.Index(fields=['post', 'path'], name='comment_path_idx'),
+            models.Index(fields=['root', 'seq'], name='comment_thread_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding or self.path:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            if self.parent_id is not None:
+                self.attach_to_parent()
+            super().save(*args, **kwargs)
+            # The path ends with the comment's own id, known only now
+            prefix = self.parent.path + '/' if self.parent_id else ''
+            self.path = prefix + path_segment(self.pk)
+            if self.root_id is None:
+                self.root_id = self.pk
+            Comment.objects.filter(pk=self.pk).update(
+                path=self.path, root_id=self.root_id
+            )
+
+    def attach_to_parent(self):
+        parent = self.parent
+        if parent.depth >= MAX_DEPTH:
+            # Too deep to indent further; answer next to the parent
+            parent = self.parent = parent.parent
+        self.depth = parent.depth + 1
+        # Rows written around save(), e.g. by bulk_create, lack a root
+        self.root_id = parent.root_id or parent.pk
+        # The update locks the root row, so numbers are handed out in turn
+        Comment.objects.filter(pk=self.root_id).update(
+            replies_count=models.F('replies_count') + 1
+        )
+        # Not replies_count: numbers of deleted replies stay taken
+        self.seq = Comment.objects.filter(root_id=self.root_id).aggregate(
+            last=Coalesce(models.Max('seq'), 0)
+        )['last'] + 1
 
 
 class Follow(models.Model):
@@ -124,3 +344,514 @@ class Follow(models.Model):
     class Meta:
         verbose_name = 'Подписчик'
         verbose_name_plural = 'Подписчики'
+
+
+class Like(models.Model):
+    """A user's like of either a post or a comment"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='likes',
+        verbose_name='Пользователь'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='likes',
+        blank=True,
+        null=True,
+        verbose_name='Запись'
+    )
+    comment = models.ForeignKey(
+        Comment,
+        on_delete=models.CASCADE,
+        related_name='likes',
+        blank=True,
+        null=True,
+        verbose_name='Комментарий'
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата',
+        auto_now_add=True
+    )
+
+    class Meta:
+        verbose_name = 'Лайк'
+        verbose_name_plural = 'Лайки'
+        constraints = [
+            models.CheckConstraint(
+                check=(
+                    models.Q(post__isnull=False, comment__isnull=True)
+                    | models.Q(post__isnull=True, comment__isnull=False)
+                ),
+                name='like_one_target'
+            ),
+            # Partial, so the NULL side of each row stays out of the index
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                condition=models.Q(post__isnull=False),
+                name='like_user_post_unique'
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'comment'],
+                condition=models.Q(comment__isnull=False),
+                name='like_user_comment_unique'
+            ),
+        ]
+
+
+class LikeCounter(models.Model):
+    """One of several rows a target's likes are counted on, see likes"""
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='+',
+        blank=True,
+        null=True,
+        verbose_name='Запись'
+    )
+    comment = models.ForeignKey(
+        Comment,
+        on_delete=models.CASCADE,
+        related_name='+',
+        blank=True,
+        null=True,
+        verbose_name='Комментарий'
+    )
+    shard = models.PositiveSmallIntegerField(verbose_name='Шард')
+    # Likes minus unlikes not yet added to likes_count
+    delta = models.IntegerField(default=0, verbose_name='Изменение')
+
+    class Meta:
+        verbose_name = 'Счетчик лайков'
+        verbose_name_plural = 'Счетчики лайков'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'shard'],
+                condition=models.Q(post__isnull=False),
+                name='likecounter_post_shard_unique'
+            ),
+            models.UniqueConstraint(
+                fields=['comment', 'shard'],
+                condition=models.Q(comment__isnull=False),
+                name='likecounter_comment_shard_unique'
+            ),
+        ]
+
+
+class PostRevision(models.Model):
+    """One version of a post's text, see posts.revisions"""
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='revisions',
+        verbose_name='Запись'
+    )
+    number = models.PositiveIntegerField(verbose_name='Номер')
+    created = models.DateTimeField(
+        verbose_name='Дата',
+        auto_now_add=True
+    )
+    # A snapshot keeps the whole text, other revisions a delta against
+    # the previous one
+    is_snapshot = models.BooleanField(
+        default=False,
+        verbose_name='Полная копия'
+    )
+    text = models.TextField(blank=True, verbose_name='Текст')
+    delta = models.TextField(blank=True, verbose_name='Изменения')
+    # Shown in the history without rebuilding the text
+    length = models.PositiveIntegerField(verbose_name='Длина текста')
+    lines_added = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Добавлено строк'
+    )
+    lines_removed = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Удалено строк'
+    )
+
+    class Meta:
+        ordering = ('-number',)
+        verbose_name = 'Версия записи'
+        verbose_name_plural = 'Версии записей'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'number'],
+                name='postrevision_post_number_unique'
+            ),
+        ]
+
+
+class ExportStorage(FileSystemStorage):
+    """Archives in EXPORT_ROOT, outside MEDIA_ROOT and its public URL
+
+    They are only handed out by the owner-checked data_export_download.
+    """
+
+    @property
+    def base_location(self):
+        return settings.EXPORT_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    def url(self, name):
+        raise ValueError('Export archives have no public URL')
+
+
+class DataExport(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Собирается'),
+        (DONE, 'Готов'),
+        (FAILED, 'Ошибка'),
+    )
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='data_exports',
+        verbose_name='Пользователь'
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        db_index=True,
+        verbose_name='Статус'
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата запроса',
+        auto_now_add=True
+    )
+    finished = models.DateTimeField(
+        verbose_name='Дата готовности',
+        blank=True,
+        null=True
+    )
+    # Moved on by the worker while it builds; a stale one means it died
+    heartbeat = models.DateTimeField(
+        verbose_name='Последняя активность',
+        blank=True,
+        null=True,
+        editable=False
+    )
+    archive = models.FileField(
+        storage=ExportStorage(),
+        blank=True,
+        null=True,
+        verbose_name='Архив'
+    )
+
+    class Meta:
+        ordering = ('-created',)
+        verbose_name = 'Выгрузка данных'
+        verbose_name_plural = 'Выгрузки данных'
+
+
+class DeletionJob(models.Model):
+    USER = 'user'
+    GROUP = 'group'
+    KIND_CHOICES = (
+        (USER, 'Пользователь'),
+        (GROUP, 'Сообщество'),
+    )
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Завершено'),
+        (FAILED, 'Ошибка'),
+    )
+
+    kind = models.CharField(
+        max_length=10,
+        choices=KIND_CHOICES,
+        verbose_name='Что удаляем'
+    )
+    object_id = models.PositiveIntegerField(verbose_name='ID объекта')
+    label = models.CharField(max_length=200, verbose_name='Название')
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        db_index=True,
+        verbose_name='Статус'
+    )
+    total = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Всего связанных объектов'
+    )
+    processed = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Обработано'
+    )
+    media_removed = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Удалено медиафайлов'
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата постановки',
+        auto_now_add=True
+    )
+    finished = models.DateTimeField(
+        verbose_name='Дата завершения',
+        blank=True,
+        null=True
+    )
+    # Moved on by the worker after every batch; a stale one means it died
+    heartbeat = models.DateTimeField(
+        verbose_name='Последняя активность',
+        blank=True,
+        null=True,
+        editable=False
+    )
+
+    class Meta:
+        ordering = ('-created',)
+        verbose_name = 'Фоновое удаление'
+        verbose_name_plural = 'Фоновые удаления'
+        constraints = [
+            # One queued or running job per object
+            models.UniqueConstraint(
+                fields=['kind', 'object_id'],
+                condition=models.Q(status__in=('pending', 'running')),
+                name='deletionjob_one_active'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} {self.label}'
+
+
+class Tag(models.Model):
+    name = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name='Тег'
+    )
+    post_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество записей'
+    )
+
+    class Meta:
+        verbose_name = 'Тег'
+        verbose_name_plural = 'Теги'
+
+    def __str__(self):
+        return self.name
+
+
+class PostTag(models.Model):
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        related_name='post_links',
+        verbose_name='Тег'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='tag_links',
+        verbose_name='Запись'
+    )
+    # Copy of Post.pub_date so tag feeds are read from this index alone
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        unique_together = ('tag', 'post')
+        indexes = [
+            models.Index(
+                fields=['tag', '-pub_date', '-post'],
+                name='posttag_feed_idx'
+            ),
+        ]
+
+
+class Mention(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='mentions',
+        verbose_name='Упомянутый'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='mentions',
+        verbose_name='Запись'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='mention_feed_idx'
+            ),
+        ]
+
+
+class Notification(models.Model):
+    FOLLOW = 'follow'
+    COMMENT = 'comment'
+    VERB_CHOICES = (
+        (FOLLOW, 'Подписка'),
+        (COMMENT, 'Комментарий'),
+    )
+
+    recipient = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='notifications',
+        verbose_name='Получатель'
+    )
+    actor = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Инициатор'
+    )
+    verb = models.CharField(
+        max_length=10,
+        choices=VERB_CHOICES,
+        verbose_name='Событие'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='+',
+        blank=True,
+        null=True,
+        verbose_name='Запись'
+    )
+    comment = models.ForeignKey(
+        Comment,
+        on_delete=models.CASCADE,
+        related_name='+',
+        blank=True,
+        null=True,
+        verbose_name='Комментарий'
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата события',
+        auto_now_add=True
+    )
+    is_read = models.BooleanField(default=False, verbose_name='Прочитано')
+    dispatched = models.BooleanField(
+        default=False,
+        verbose_name='Обработано рассылкой'
+    )
+
+    class Meta:
+        ordering = ('-created',)
+        verbose_name = 'Уведомление'
+        verbose_name_plural = 'Уведомления'
+        indexes = [
+            models.Index(
+                fields=['dispatched', 'recipient'],
+                name='notification_outbox_idx'
+            ),
+        ]
+
+
+class Inbox(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='inbox',
+        verbose_name='Пользователь'
+    )
+    # Kept in step with Notification.is_read so the menu needs no COUNT
+    unread = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Непрочитанных'
+    )
+    email_on_follow = models.BooleanField(
+        default=True,
+        verbose_name='Письма о новых подписчиках'
+    )
+    email_on_comment = models.BooleanField(
+        default=True,
+        verbose_name='Письма о комментариях'
+    )
+
+    class Meta:
+        verbose_name = 'Настройки уведомлений'
+        verbose_name_plural = 'Настройки уведомлений'
+
+
+class OutboxEvent(models.Model):
+    """A change to hand over to webhooks, written with the change itself"""
+    POST_CREATED = 'post.created'
+    POST_UPDATED = 'post.updated'
+    POST_DELETED = 'post.deleted'
+    COMMENT_CREATED = 'comment.created'
+    FOLLOW_CREATED = 'follow.created'
+    FOLLOW_DELETED = 'follow.deleted'
+    TOPIC_CHOICES = (
+        (POST_CREATED, 'Новая запись'),
+        (POST_UPDATED, 'Запись изменена'),
+        (POST_DELETED, 'Запись удалена'),
+        (COMMENT_CREATED, 'Новый комментарий'),
+        (FOLLOW_CREATED, 'Новая подписка'),
+        (FOLLOW_DELETED, 'Отписка'),
+    )
+    topic = models.CharField(
+        max_length=20,
+        choices=TOPIC_CHOICES,
+        verbose_name='Событие'
+    )
+    # JSON document, the same one every endpoint receives
+    payload = models.TextField(verbose_name='Данные')
+    created = models.DateTimeField(
+        verbose_name='Дата события',
+        auto_now_add=True
+    )
+
+    class Meta:
+        ordering = ('pk',)
+        verbose_name = 'Событие для вебхуков'
+        verbose_name_plural = 'События для вебхуков'
+
+
+class WebhookEndpoint(models.Model):
+    url = models.URLField(verbose_name='Адрес')
+    secret = models.CharField(
+        max_length=100,
+        verbose_name='Ключ подписи'
+    )
+    is_active = models.BooleanField(default=True, verbose_name='Включен')
+    # Id of the last OutboxEvent the endpoint acknowledged
+    cursor = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Последнее доставленное событие'
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Неудачных попыток подряд'
+    )
+    next_attempt_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name='Следующая попытка'
+    )
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+
+    class Meta:
+        verbose_name = 'Вебхук'
+        verbose_name_plural = 'Вебхуки'
+
+    def __str__(self):
+        return self.url
@@ -0,0 +1,139 @@
+"""Notifications about new followers and comments.
+
+Signals only write Notification rows and bump the denormalized
+``Inbox.unread`` counter, so requests never wait for mail. Code that
+deletes notifications, directly or through a post or comment cascade,
+passes them to ``forget_unread`` first and calls what it returns after,
+which recounts the counters of their recipients in one UPDATE. The
+``send_notifications`` worker later collects undispatched rows per
+recipient and coalesces them into one digest email, honouring the
+recipient's Inbox preferences.
+"""
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.template.loader import render_to_string
+
+from .models import Inbox, Notification
+
+DIGEST_BATCH_SIZE = 100
+
+
+def notify(recipient, actor, verb, post=None, comment=None):
+    if recipient.pk == actor.pk:
+        return None
+    notification = Notification.objects.create(
+        recipient=recipient, actor=actor, verb=verb,
+        post=post, comment=comment
+    )
+    Inbox.objects.get_or_create(user=recipient)
+    Inbox.objects.filter(user=recipient).update(unread=F('unread') + 1)
+    return notification
+
+
+def about_posts(posts):
+    """Notifications deleted along with the posts and their comments"""
+    return Notification.objects.filter(
+        Q(post__in=posts) | Q(comment__post__in=posts)
+    )
+
+
+def recount_unread(user_ids):
+    """Set the users' counters to the notifications they haven't read"""
+    if not user_ids:
+        return
+    unread = Notification.objects.filter(
+        recipient=OuterRef('user'), is_read=False
+    ).order_by().values('recipient').annotate(
+        total=Count('pk')
+    ).values('total')
+    Inbox.objects.filter(user__in=user_ids).update(
+        unread=Coalesce(Subquery(unread), 0)
+    )
+
+
+def forget_unread(notifications):
+    """Return a callable fixing counters once notifications are deleted
+
+    Call it before the delete: it reads who has unread ones among them.
+    """
+    recipients = set(notifications.filter(is_read=False).values_list(
+        'recipient', flat=True
+    ))
+    return lambda: recount_unread(recipients)
+
+
+def unread_count(user):
+    return Inbox.objects.filter(user=user).values_list(
+        'unread', flat=True
+    ).first() or 0
+
+
+def mark_all_read(user):
+    with transaction.atomic():
+        user.notifications.filter(is_read=False).update(is_read=True)
+        Inbox.objects.filter(user=user).update(unread=0)
+
+
+def build_digest(recipient, notifications):
+    """Coalesce events into follower names and comments per post"""
+    inbox = getattr(recipient, 'inbox', None) or Inbox(user=recipient)
+    followers = []
+    comments = OrderedDict()
+    for notification in notifications:
+        if notification.verb == Notification.FOLLOW:
+            if inbox.email_on_follow:
+                followers.append(notification.actor.username)
+        elif inbox.email_on_comment:
+            comments.setdefault(notification.post, []).append(
+                notification.actor.username
+            )
+    if not followers and not comments:
+        return None
+    return EmailMessage(
+        subject='Новое на Yatube',
+        body=render_to_string('posts/email/digest.txt', {
+            'user': recipient,
+            'followers': followers,
+            'comments': comments.items(),
+        }),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[recipient.email],
+    )
+
+
+def dispatch_digests(batch_size=DIGEST_BATCH_SIZE):
+    """Send one digest to each of the next batch of recipients
+
+    Returns the number of processed notifications, 0 when idle.
+    """
+    pending = Notification.objects.filter(dispatched=False)
+    recipients = list(pending.order_by('recipient').values_list(
+        'recipient', flat=True
+    ).distinct()[:batch_size])
+    if not recipients:
+        return 0
+    batch = list(pending.filter(recipient__in=recipients).select_related(
+        'recipient__inbox', 'actor', 'post'
+    ).order_by('recipient', 'created'))
+    by_recipient = defaultdict(list)
+    for notification in batch:
+        by_recipient[notification.recipient].append(notification)
+    messages = [
+        message for message in (
+            build_digest(recipient, notifications)
+            for recipient, notifications in by_recipient.items()
+            if recipient.email
+        ) if message is not None
+    ]
+    if messages:
+        # One connection for the whole batch
+        get_connection().send_messages(messages)
+    Notification.objects.filter(
+        pk__in=[notification.pk for notification in batch]
+    ).update(dispatched=True)
+    return len(batch)
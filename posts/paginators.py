@@ -0,0 +1,64 @@
+"""Paginators that avoid counting big tables on every page view."""
+import hashlib
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connection
+from django.utils.functional import cached_property
+
+COUNT_TIMEOUT = 60
+# Unfiltered tables at least this big are counted from planner statistics
+ESTIMATE_THRESHOLD = 10000
+
+
+def estimated_count(model):
+    """Return SQLite's row estimate for a table, None without statistics
+
+    ``sqlite_stat1`` is filled by ``ANALYZE``; the first number of an
+    index's stat is the number of rows in the index, which is every row of
+    the table unless the index is partial.
+    """
+    if connection.vendor != 'sqlite':
+        return None
+    try:
+        with connection.cursor() as cursor:
+            # Automatic indexes have no SQL and are never partial
+            cursor.execute(
+                'SELECT stat FROM sqlite_stat1 LEFT JOIN sqlite_master '
+                "ON type = 'index' AND name = idx WHERE tbl = %s AND "
+                "(sql IS NULL OR sql NOT LIKE '%% WHERE %%') LIMIT 1",
+                [model._meta.db_table]
+            )
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    return int(row[0].split()[0]) if row else None
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator that estimates or caches the total instead of counting
+
+    The count only sizes the page links, so a number that is a minute old
+    or approximate is good enough for admin changelists.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None:
+            return super().count
+        if not query.where:
+            estimate = estimated_count(self.object_list.model)
+            if estimate is not None and estimate >= ESTIMATE_THRESHOLD:
+                return estimate
+        try:
+            sql = str(query)
+        except EmptyResultSet:
+            return 0
+        key = 'count:' + hashlib.md5(sql.encode('utf-8')).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = self.object_list.count()
+            cache.set(key, count, COUNT_TIMEOUT)
+        return count
@@ -0,0 +1,134 @@
+"""Write throttling on top of the shared cache.
+
+Limits use a sliding window approximated by two fixed windows: the count
+of the previous window is weighted by how much of it still overlaps the
+sliding one. A check costs one ``get_many`` and one ``incr`` whatever the
+rate, and the keys expire on their own.
+
+Counts are approximate. Reading and incrementing are separate cache calls,
+so concurrent requests can all pass a check that only some should, and a
+counter that expires or is culled in between starts over. Throttled
+requests are counted per day for ``STATS_DAYS`` days, for
+``ratelimit_stats``.
+
+Limits are configured per scope in ``settings.RATELIMITS`` as
+``{'scope': ('<count>/<s|m|h|d>', 'user' | 'ip')}``.
+"""
+import logging
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import render
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+STATS_DAYS = 7
+
+
+def parse_rate(rate):
+    count, period = rate.split('/')
+    return int(count), PERIODS[period]
+
+
+def client_key(request, key):
+    if key == 'user' and request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return f'ip:{request.META.get("REMOTE_ADDR", "")}'
+
+
+def increment(key, timeout):
+    """Add one to a cache counter that expires after timeout seconds"""
+    if cache.add(key, 1, timeout=timeout):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Expired or culled since add(); this hit starts it again
+        cache.add(key, 1, timeout=timeout)
+    else:
+        # Backends without a native incr store the sum with their
+        # default timeout
+        cache.touch(key, timeout)
+
+
+def hit(scope, client, rate, now=None):
+    """Count a request and return seconds to wait, 0 if it's allowed"""
+    limit, period = parse_rate(rate)
+    now = time.time() if now is None else now
+    window, elapsed = divmod(now, period)
+    current = f'ratelimit:{scope}:{client}:{int(window)}'
+    previous = f'ratelimit:{scope}:{client}:{int(window) - 1}'
+    counts = cache.get_many([current, previous])
+    in_current = counts.get(current, 0)
+    in_previous = counts.get(previous, 0)
+    weight = (period - elapsed) / period
+    if in_previous * weight + in_current >= limit:
+        if in_current >= limit or not in_previous:
+            wait = period - elapsed
+        else:
+            # When the previous window fades out enough to let one through
+            wait = period - elapsed - (limit - in_current) * period / (
+                in_previous
+            )
+        return max(1, math.ceil(wait))
+    increment(current, period * 2)
+    return 0
+
+
+def stats_key(scope, day):
+    return f'ratelimit:throttled:{scope}:{day}'
+
+
+def record_throttled(scope, now=None):
+    now = time.time() if now is None else now
+    day = int(now // PERIODS['d'])
+    increment(stats_key(scope, day), STATS_DAYS * PERIODS['d'])
+
+
+def throttled_counts(now=None):
+    """Return roughly how many requests were throttled per configured
+    scope over the last STATS_DAYS days
+    """
+    now = time.time() if now is None else now
+    today = int(now // PERIODS['d'])
+    keys = {
+        stats_key(scope, day): scope
+        for scope in settings.RATELIMITS
+        for day in range(today - STATS_DAYS + 1, today + 1)
+    }
+    counts = cache.get_many(list(keys))
+    totals = dict.fromkeys(settings.RATELIMITS, 0)
+    for key, count in counts.items():
+        totals[keys[key]] += count
+    return totals
+
+
+def ratelimit(scope, methods=('POST',)):
+    """Answer 429 with Retry-After once a client exceeds the scope rate"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            rule = settings.RATELIMITS.get(scope)
+            if rule and request.method in methods:
+                rate, key = rule
+                retry_after = hit(scope, client_key(request, key), rate)
+                if retry_after:
+                    record_throttled(scope)
+                    logger.info(
+                        'Throttled %s for %s', scope, client_key(request, key)
+                    )
+                    response = render(
+                        request,
+                        'misc/429.html',
+                        {'retry_after': retry_after},
+                        status=429
+                    )
+                    response['Retry-After'] = str(retry_after)
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
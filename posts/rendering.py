@@ -0,0 +1,37 @@
+"""Rendering of post and comment text to HTML.
+
+The result is stored next to the text when it is saved, so feeds output
+ready HTML instead of running filters on every render. Bump
+RENDERER_VERSION whenever the output changes and run
+``manage.py rerender_text`` to bring stored HTML up to date.
+"""
+import re
+
+from django.template.defaultfilters import linebreaksbr
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+
+# Version 2 links #tags and @mentions
+RENDERER_VERSION = 2
+
+TAG_RE = re.compile(r'(?<![\w&#])#(\w{1,100})')
+MENTION_RE = re.compile(r'(?<![\w@])@([\w.@+-]{1,150})')
+
+
+def link_tag(match):
+    url = reverse('tag_posts', args=[match.group(1).lower()])
+    return f'<a href="{url}">#{match.group(1)}</a>'
+
+
+def link_mention(match):
+    username = match.group(1).rstrip('.')
+    tail = match.group(1)[len(username):]
+    url = reverse('profile', args=[username])
+    return f'<a href="{url}">@{username}</a>{tail}'
+
+
+def render_text(text):
+    html = linebreaksbr(text, autoescape=True)
+    html = TAG_RE.sub(link_tag, html)
+    html = MENTION_RE.sub(link_mention, html)
+    return mark_safe(html)
@@ -0,0 +1,135 @@
+"""Edit history of posts.
+
+Every edit made on the post edit page adds a PostRevision. Most revisions
+store only a delta against the previous one: the difflib opcodes of a
+line diff, where unchanged runs are ``[start, end]`` line ranges of the
+previous text and everything else is the new lines themselves. Every
+``SNAPSHOT_EVERY`` revisions, and whenever a delta would be no smaller
+than the text, the whole text is stored instead.
+
+Rebuilding a revision starts at the latest snapshot before it and applies
+at most ``SNAPSHOT_EVERY - 1`` deltas, all read in one query. The history
+page lists revisions by their stored length and line counts and never
+loads a text or a delta. Revisions of archived posts are read the same
+way from posts.archive.
+"""
+import difflib
+import json
+
+from django.db import transaction
+from django.db.models import Max
+
+from . import archive
+from .models import Post, PostRevision
+
+SNAPSHOT_EVERY = 10
+# Columns the history page needs
+SUMMARY_FIELDS = (
+    'number', 'created', 'is_snapshot', 'length', 'lines_added',
+    'lines_removed',
+)
+
+
+def make_delta(old, new):
+    """Return (ops, lines added, lines removed) turning old into new"""
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, False)
+    ops, added, removed = [], 0, 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+            continue
+        removed += i2 - i1
+        added += j2 - j1
+        if j2 > j1:
+            ops.append(''.join(new_lines[j1:j2]))
+    return ops, added, removed
+
+
+def apply_delta(old, ops):
+    old_lines = old.splitlines(keepends=True)
+    return ''.join(
+        op if isinstance(op, str) else ''.join(old_lines[op[0]:op[1]])
+        for op in ops
+    )
+
+
+def record(post, old_text):
+    """Add a revision for an edit that changed old_text into post.text
+
+    Call it in the transaction that saved the post, with old_text read
+    under the post's row lock. The delta is taken against the last stored
+    revision; when that isn't old_text, because this is the first edit or
+    the text was changed elsewhere (the admin, import_data), old_text is
+    stored as a snapshot first. Returns the new revision or None if the
+    text didn't change.
+    """
+    if post.text == old_text:
+        return None
+    with transaction.atomic():
+        # Locks the post, so concurrent edits are numbered in turn
+        Post.objects.select_for_update().only('pk').get(pk=post.pk)
+        last = last_number(post)
+        if not last or rebuild(post, last) != old_text:
+            last += 1
+            PostRevision.objects.create(
+                post=post, number=last, is_snapshot=True, text=old_text,
+                length=len(old_text)
+            )
+        number = last + 1
+        ops, added, removed = make_delta(old_text, post.text)
+        delta = json.dumps(ops, ensure_ascii=False, separators=(',', ':'))
+        revision = PostRevision(
+            post=post, number=number, length=len(post.text),
+            lines_added=added, lines_removed=removed
+        )
+        if number % SNAPSHOT_EVERY == 1 or len(delta) >= len(post.text):
+            revision.is_snapshot, revision.text = True, post.text
+        else:
+            revision.delta = delta
+        revision.save()
+    return revision
+
+
+def rebuild(post, number):
+    """Return the text of a revision, or None if there is no such one"""
+    # A snapshot is never further back than the last periodic one
+    first = number - (number - 1) % SNAPSHOT_EVERY
+    if post.is_archived:
+        chain = [
+            (revision.number, revision.is_snapshot, revision.text,
+             revision.delta)
+            for revision in reversed(archive.fetch_revisions(
+                post.pk, numbers=(first, number)
+            ))
+        ]
+    else:
+        chain = list(post.revisions.filter(
+            number__gte=first, number__lte=number
+        ).order_by('number').values_list(
+            'number', 'is_snapshot', 'text', 'delta'
+        ))
+    if not chain or chain[-1][0] != number:
+        return None
+    start = max(index for index, row in enumerate(chain) if row[1])
+    text = chain[start][2]
+    for _, _, _, delta in chain[start + 1:]:
+        text = apply_delta(text, json.loads(delta))
+    return text
+
+
+def last_number(post):
+    """Return the number of the latest revision, 0 if there is none"""
+    if post.is_archived:
+        return archive.last_revision(post.pk) or 0
+    return post.revisions.aggregate(last=Max('number'))['last'] or 0
+
+
+def history(post):
+    """Return revisions newest first, without their texts"""
+    if post.is_archived:
+        return archive.fetch_revisions(
+            post.pk, names=('id', 'post_id') + SUMMARY_FIELDS
+        )
+    return post.revisions.only(*SUMMARY_FIELDS)
@@ -0,0 +1,73 @@
+"""Drafts and scheduled posts.
+
+A post saved with ``is_published=False`` is a draft, or a scheduled post
+when it has ``publish_at``. Readers never see either: every list and feed
+goes through ``Post.objects.published()``, which the partial
+``post_published_idx`` covers, so pending rows aren't even in the index
+those queries read.
+
+The ``publish_scheduled`` worker reads due posts from the partial
+``post_due_idx`` and claims each one with an update that only matches
+while the post is still pending. Only the worker whose update matched
+announces the post, so it goes live exactly once however many workers
+run. Between runs the worker sleeps until the next post is due, but no
+longer than its interval, so a post scheduled meanwhile isn't late.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import feeds, outbox
+from .models import OutboxEvent, Post
+from .tags import index_post
+
+BATCH_SIZE = 500
+
+
+def announce(post):
+    """Do what a post going live triggers, as signals do on a save"""
+    index_post(post)
+    feeds.touch_on_commit(*feeds.post_scopes(post))
+    outbox.record(OutboxEvent.POST_CREATED, outbox.post_data(post))
+
+    def push():
+        # posts.live brings asyncio along, see views.new_post
+        from .live import publish_post
+        publish_post(post)
+
+    transaction.on_commit(push)
+
+
+def due_posts(now=None):
+    return Post.objects.filter(
+        is_published=False, publish_at__lte=now or timezone.now()
+    )
+
+
+def publish_due(batch_size=BATCH_SIZE, now=None):
+    """Publish a batch of posts that are due, return how many went live"""
+    now = now or timezone.now()
+    published = 0
+    with transaction.atomic():
+        batch = list(
+            due_posts(now).select_related('author', 'group')
+            .order_by('publish_at')[:batch_size]
+        )
+        for post in batch:
+            # Matches nothing if another worker published the post first
+            claimed = Post.objects.filter(
+                pk=post.pk, is_published=False
+            ).update(is_published=True, pub_date=post.publish_at)
+            if not claimed:
+                continue
+            post.is_published = True
+            post.pub_date = post.publish_at
+            announce(post)
+            published += 1
+    return published
+
+
+def next_due():
+    """Return when the next scheduled post is due, or None"""
+    return Post.objects.filter(
+        is_published=False, publish_at__isnull=False
+    ).order_by('publish_at').values_list('publish_at', flat=True).first()
@@ -0,0 +1,130 @@
+from django.contrib.flatpages.models import FlatPage
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from . import feeds, outbox
+from .flatpages import invalidate_flatpages
+from .groups import invalidate_group_choices
+from .models import Comment, Follow, Group, Notification, OutboxEvent, Post
+from .notifications import notify
+from .tags import index_post, unindex_post
+from .threads import forget_reply
+
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, raw=False, **kwargs):
+    # Drafts are indexed by posts.scheduling.announce when they go live
+    if not raw and instance.is_published:
+        index_post(instance)
+
+
+@receiver(pre_delete, sender=Post)
+def unindex_deleted_post(sender, instance, **kwargs):
+    unindex_post(instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_state(sender, instance, raw=False, **kwargs):
+    if not raw and not instance._state.adding:
+        # A post moved to another group leaves the old group's feed, and
+        # a draft saved as published is a new post for webhooks
+        instance._old_group_id, instance._was_published = (
+            Post.objects.filter(pk=instance.pk).values_list(
+                'group_id', 'is_published'
+            ).first() or (None, False)
+        )
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def touch_post_feeds(sender, instance, raw=False, **kwargs):
+    if not raw:
+        feeds.touch_on_commit(*feeds.post_scopes(
+            instance, getattr(instance, '_old_group_id', None)
+        ))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def touch_group_feed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        feeds.touch_on_commit(f'group:{instance.pk}')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def forget_group_choices(sender, **kwargs):
+    invalidate_group_choices()
+
+
+@receiver(post_save, sender=FlatPage)
+@receiver(post_delete, sender=FlatPage)
+@receiver(m2m_changed, sender=FlatPage.sites.through)
+def forget_flatpages(sender, **kwargs):
+    invalidate_flatpages()
+
+
+@receiver(post_save, sender=Follow)
+def notify_followed_author(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        notify(instance.author, instance.user, Notification.FOLLOW)
+
+
+@receiver(post_save, sender=Comment)
+def notify_post_author(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        notify(
+            instance.post.author, instance.author, Notification.COMMENT,
+            post=instance.post, comment=instance
+        )
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_deleted_reply(sender, instance, **kwargs):
+    forget_reply(instance)
+
+
+@receiver(post_save, sender=Post)
+def record_saved_post(sender, instance, created, raw=False, **kwargs):
+    if raw or not instance.is_published:
+        return
+    went_live = created or not getattr(instance, '_was_published', True)
+    outbox.record(
+        OutboxEvent.POST_CREATED if went_live else OutboxEvent.POST_UPDATED,
+        outbox.post_data(instance)
+    )
+
+
+@receiver(post_delete, sender=Post)
+def record_deleted_post(sender, instance, **kwargs):
+    if not instance.is_published:
+        return
+    outbox.record(OutboxEvent.POST_DELETED, {
+        # Related rows may be gone already, so only ids
+        'id': instance.pk,
+        'author_id': instance.author_id,
+    })
+
+
+@receiver(post_save, sender=Comment)
+def record_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        outbox.record(
+            OutboxEvent.COMMENT_CREATED, outbox.comment_data(instance)
+        )
+
+
+@receiver(post_save, sender=Follow)
+def record_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        outbox.record(OutboxEvent.FOLLOW_CREATED, outbox.follow_data(instance))
+
+
+@receiver(post_delete, sender=Follow)
+def record_unfollow(sender, instance, **kwargs):
+    outbox.record(OutboxEvent.FOLLOW_DELETED, {
+        'user_id': instance.user_id,
+        'author_id': instance.author_id,
+    })
@@ -0,0 +1,140 @@
+"""Fingerprinted, precompressed static files.
+
+``CompressedManifestStaticFilesStorage`` makes ``collectstatic`` write
+content-hashed copies listed in ``staticfiles.json`` and, next to every
+hashed text asset, a ``.gz`` (and ``.br`` when the brotli package is
+installed) compressed once at the highest level. ``serve`` hands out the
+smallest variant the client accepts; hashed names never change content, so
+they are cached for a year as immutable.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage, staticfiles_storage
+)
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.map', '.txt', '.xml')
+# Smaller files don't win enough to pay for the extra header
+MIN_SIZE = 256
+IMMUTABLE = 'public, max-age=31536000, immutable'
+SHORT = 'public, max-age=60'
+
+
+def gzip_bytes(content):
+    # mtime=0 keeps the output identical between runs
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+def encoders():
+    """Return (encoding, suffix, compress) for available encoders"""
+    available = []
+    if brotli is not None:
+        available.append(('br', '.br', brotli.compress))
+    available.append(('gzip', '.gz', gzip_bytes))
+    return available
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # A missing entry falls back to the plain name; check_static reports it
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(set(self.hashed_files.values())):
+            for compressed in self.compress(name):
+                yield name, compressed, True
+
+    def compress(self, name):
+        """Write compressed siblings of name, return their names"""
+        if not name.endswith(COMPRESSIBLE):
+            return []
+        with self.open(name) as original:
+            content = original.read()
+        if len(content) < MIN_SIZE:
+            return []
+        written = []
+        for _, suffix, compress in encoders():
+            packed = compress(content)
+            if len(packed) >= len(content):
+                continue
+            with open(self.path(name + suffix), 'wb') as target:
+                target.write(packed)
+            written.append(name + suffix)
+        return written
+
+
+def parse_accept_encoding(header):
+    """Return encodings the client accepts, q=0 ones left out"""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def is_hashed(name):
+    """Tell whether name is a fingerprinted file from the manifest"""
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', None)
+    if not hashed_files:
+        return False
+    names = getattr(staticfiles_storage, 'hashed_names', None)
+    if names is None:
+        names = staticfiles_storage.hashed_names = set(hashed_files.values())
+    return name in names
+
+
+def serve(request, path):
+    """Serve a collected file, compressed when the client allows it"""
+    name = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, name)
+    except ValueError:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    stat = os.stat(full_path)
+    since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    if not was_modified_since(since, stat.st_mtime, stat.st_size):
+        return HttpResponseNotModified()
+    accepted = parse_accept_encoding(
+        request.META.get('HTTP_ACCEPT_ENCODING', '')
+    )
+    encoding, served_path = None, full_path
+    for candidate, suffix, _ in encoders():
+        if candidate in accepted and os.path.isfile(full_path + suffix):
+            encoding, served_path = candidate, full_path + suffix
+            break
+    content_type, _ = mimetypes.guess_type(full_path)
+    response = FileResponse(
+        open(served_path, 'rb'),
+        content_type=content_type or 'application/octet-stream'
+    )
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = IMMUTABLE if is_hashed(name) else SHORT
+    response['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
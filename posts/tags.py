@@ -0,0 +1,70 @@
+"""Hashtag and @mention extraction with an inverted index.
+
+Every saved post is parsed and its ``#tags`` and ``@usernames`` are kept
+in PostTag and Mention rows, so tag and mention feeds read an index
+instead of scanning ``Post.text`` with ``LIKE``.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from .models import Mention, PostTag, Tag, User
+from .rendering import MENTION_RE, TAG_RE
+
+
+def extract_tags(text):
+    return {name.lower() for name in TAG_RE.findall(text)}
+
+
+def extract_mentions(text):
+    # A mention at the end of a sentence shouldn't swallow the full stop
+    return {name.rstrip('.') for name in MENTION_RE.findall(text)}
+
+
+def update_tags(post, names):
+    links = PostTag.objects.filter(post=post)
+    current = set(links.values_list('tag__name', flat=True))
+    removed, added = current - names, names - current
+    if removed:
+        links.filter(tag__name__in=removed).delete()
+        Tag.objects.filter(name__in=removed).update(
+            post_count=F('post_count') - 1
+        )
+    if added:
+        Tag.objects.bulk_create(
+            [Tag(name=name) for name in added], ignore_conflicts=True
+        )
+        tags = Tag.objects.filter(name__in=added)
+        PostTag.objects.bulk_create(
+            PostTag(tag=tag, post=post, pub_date=post.pub_date)
+            for tag in tags
+        )
+        tags.update(post_count=F('post_count') + 1)
+    links.exclude(pub_date=post.pub_date).update(pub_date=post.pub_date)
+
+
+def update_mentions(post, usernames):
+    mentions = Mention.objects.filter(post=post)
+    users = set(User.objects.filter(username__in=usernames).values_list(
+        'pk', flat=True
+    ))
+    current = set(mentions.values_list('user_id', flat=True))
+    mentions.filter(user_id__in=current - users).delete()
+    Mention.objects.bulk_create(
+        Mention(user_id=user_id, post=post, pub_date=post.pub_date)
+        for user_id in users - current
+    )
+    mentions.exclude(pub_date=post.pub_date).update(pub_date=post.pub_date)
+
+
+def index_post(post):
+    """Bring the post's tag and mention rows in line with its text"""
+    with transaction.atomic():
+        update_tags(post, extract_tags(post.text))
+        update_mentions(post, extract_mentions(post.text))
+
+
+def unindex_post(post):
+    """Decrease tag counters of a post that is about to be deleted"""
+    Tag.objects.filter(post_links__post=post).update(
+        post_count=F('post_count') - 1
+    )
@@ -0,0 +1,93 @@
+"""Render timing for templates and includes.
+
+When ``TEMPLATE_TIMING`` is on, every ``Template._render`` call (the page
+itself and each ``{% include %}``) is timed. Each measurement is sent
+through the ``template_timed`` signal for any instrumentation that wants
+it, and ``TemplateTimingMiddleware`` sums them per request into a
+``Server-Timing`` header.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.dispatch import Signal
+from django.template.base import Template
+
+# Arguments: name, duration (seconds), depth (0 for the page itself)
+template_timed = Signal(providing_args=['name', 'duration', 'depth'])
+
+state = threading.local()
+original_render = None
+
+
+def timed_render(self, context):
+    depth = getattr(state, 'depth', 0)
+    state.depth = depth + 1
+    started = time.perf_counter()
+    try:
+        return original_render(self, context)
+    finally:
+        duration = time.perf_counter() - started
+        state.depth = depth
+        name = self.origin.template_name if self.origin else self.name
+        name = name or '<string>'
+        totals = getattr(state, 'totals', None)
+        if totals is not None:
+            totals[name][0] += 1
+            totals[name][1] += duration
+        template_timed.send(
+            sender=Template, name=name, duration=duration, depth=depth
+        )
+
+
+def install():
+    """Start timing renders, wrapping whatever _render is current"""
+    global original_render
+    if original_render is None:
+        original_render = Template._render
+        Template._render = timed_render
+
+
+def uninstall():
+    global original_render
+    if original_render is not None:
+        Template._render = original_render
+        original_render = None
+
+
+def start_collecting():
+    state.totals = defaultdict(lambda: [0, 0.0])
+
+
+def stop_collecting():
+    """Return {template name: (renders, seconds)} since start_collecting"""
+    totals = getattr(state, 'totals', None) or {}
+    state.totals = None
+    return {name: tuple(value) for name, value in totals.items()}
+
+
+class TemplateTimingMiddleware:
+    """Report per-template render time in a Server-Timing header"""
+
+    def __init__(self, get_response):
+        if not settings.TEMPLATE_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start_collecting()
+        try:
+            response = self.get_response(request)
+        finally:
+            totals = stop_collecting()
+        entries = [
+            f'tpl{number};desc="{name} x{count}";dur={seconds * 1000:.2f}'
+            for number, (name, (count, seconds)) in enumerate(sorted(
+                totals.items(), key=lambda item: -item[1][1]
+            ))
+        ]
+        if entries:
+            response['Server-Timing'] = ', '.join(entries)
+        return response
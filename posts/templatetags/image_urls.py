@@ -0,0 +1,13 @@
+from django import template
+
+from posts import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def image_url(image, width, height, fit=images.CROP, fmt='jpg'):
+    """Return the URL of image resized to width x height"""
+    if not image:
+        return ''
+    return images.image_url(image.name, width, height, fit, fmt)
@@ -0,0 +1,672 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import archive, likes, revisions, scheduling
+from posts.deletion import schedule_group_deletion, schedule_user_deletion
+from posts.models import (
+    Comment, DataExport, DeletionJob, Follow, Group, Inbox, Like,
+    OutboxEvent, Post, PostRevision, Tag, User, WebhookEndpoint
+)
+from posts.outbox import SIGNATURE_HEADER, TIMESTAMP_HEADER, sign
+from posts.staticfiles import IMMUTABLE, serve
+from posts.transfer import iter_records
+
+from .test_settings import Settings
+
+
+class TransferCommandsTest(Settings):
+    def setUp(self):
+        super().setUp()
+        self.post.image = 'posts/picture.gif'
+        self.post.music = 'posts/song.mp3'
+        self.post.music_duration, self.post.music_title = 61.5, 'Трек'
+        self.post.likes_count = 1
+        self.post.save()
+        revisions.record(self.post, 'Было')
+        comment = Comment.objects.create(
+            post=self.post, author=self.stranger_user, text='Коммент'
+        )
+        Like.objects.create(user=self.stranger_user, post=self.post)
+        Like.objects.create(user=self.user, comment=comment)
+        Follow.objects.create(user=self.stranger_user, author=self.user)
+        # Creation dates must survive the import, not become its time
+        long_ago = timezone.now() - timedelta(days=30)
+        for model in (Comment, Like, PostRevision):
+            model.objects.update(created=long_ago)
+
+    def round_trip(self, extension):
+        """Export everything, wipe the tables and import it back"""
+        before = list(iter_records(100))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, f'dump.{extension}')
+            call_command('export_data', path, stdout=StringIO())
+            User.objects.all().delete()
+            Group.objects.all().delete()
+            call_command(
+                'import_data', path, batch_size=2,
+                stdout=StringIO()
+            )
+        self.assertEqual(list(iter_records(100)), before)
+
+    def test_jsonl_round_trip_is_lossless(self):
+        """Test JSONL export can be imported back without changes"""
+        self.round_trip('jsonl')
+
+    def test_csv_round_trip_is_lossless(self):
+        """Test CSV export can be imported back without changes"""
+        self.round_trip('csv')
+
+    def test_import_builds_tag_index(self):
+        """Test imported posts get tag rows after the bulk load"""
+        self.post.text = 'Пост про #импорт'
+        self.post.save()
+        self.round_trip('jsonl')
+        self.assertEqual(Tag.objects.get(name='импорт').post_count, 1)
+
+    def test_import_keeps_media_references(self):
+        """Test imported post points to the same media files"""
+        self.round_trip('jsonl')
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.image.name, 'posts/picture.gif')
+        self.assertEqual(post.music.name, 'posts/song.mp3')
+        self.assertEqual(post.pub_date, self.post.pub_date)
+
+
+class DataExportTest(Settings):
+    def test_export_is_built_by_worker_and_streamed(self):
+        """Test queued export gets archived and downloaded by its owner"""
+        self.post.music.save('song.mp3', ContentFile(b'ID3 music'))
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Мой коммент'
+        )
+        self.authorized_client.post(reverse('data_export'))
+        export = DataExport.objects.get(user=self.user)
+        self.assertEqual(export.status, DataExport.PENDING)
+        call_command('run_exports', once=True, stdout=StringIO())
+        export.refresh_from_db()
+        self.assertEqual(export.status, DataExport.DONE)
+        url = reverse('data_export_download', args=[export.id])
+        self.assertEqual(self.stranger_client.get(url).status_code, 404)
+        response = self.authorized_client.get(url)
+        self.assertTrue(response.streaming)
+        archive = zipfile.ZipFile(BytesIO(b''.join(response)))
+        posts = json.loads(archive.read('posts.json'))
+        comments = json.loads(archive.read('comments.json'))
+        self.assertEqual(posts[0]['text'], self.post.text)
+        self.assertEqual(comments[0]['text'], 'Мой коммент')
+        self.assertEqual(
+            archive.read(f'media/{self.post.music.name}'), b'ID3 music'
+        )
+
+    def test_archives_are_private_and_expire(self):
+        """Test archives stay out of MEDIA_ROOT and are deleted later"""
+        export = DataExport.objects.create(user=self.user)
+        call_command('run_exports', once=True, stdout=StringIO())
+        export.refresh_from_db()
+        path = export.archive.path
+        self.assertTrue(path.startswith(settings.EXPORT_ROOT))
+        self.assertFalse(path.startswith(settings.MEDIA_ROOT))
+        self.assertNotIn(self.user.username, export.archive.name)
+        self.assertTrue(os.path.isfile(path))
+        DataExport.objects.filter(pk=export.pk).update(
+            finished=timezone.now() - timedelta(
+                days=settings.EXPORT_KEEP_DAYS + 1
+            )
+        )
+        call_command('run_exports', once=True, stdout=StringIO())
+        self.assertFalse(DataExport.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_export_of_a_dead_worker_is_claimed_again(self):
+        """Test a running export without heartbeats is rebuilt and old
+        failed exports are purged
+        """
+        long_ago = timezone.now() - timedelta(
+            days=settings.EXPORT_KEEP_DAYS + 1
+        )
+        stuck = DataExport.objects.create(
+            user=self.user, status=DataExport.RUNNING, heartbeat=long_ago
+        )
+        busy = DataExport.objects.create(
+            user=self.stranger_user, status=DataExport.RUNNING,
+            heartbeat=timezone.now()
+        )
+        failed = DataExport.objects.create(
+            user=self.user, status=DataExport.FAILED
+        )
+        DataExport.objects.filter(pk=failed.pk).update(created=long_ago)
+        call_command('run_exports', once=True, stdout=StringIO())
+        self.assertEqual(
+            dict(DataExport.objects.values_list('pk', 'status')),
+            {stuck.pk: DataExport.DONE, busy.pk: DataExport.RUNNING}
+        )
+
+
+class DeletionJobTest(Settings):
+    def test_user_is_deactivated_then_deleted_in_batches(self):
+        """Test user deletion removes dependents and media in background"""
+        self.post.image.save('picture.gif', ContentFile(b'GIF89a'))
+        storage = self.post.image.storage
+        name = self.post.image.name
+        Comment.objects.create(
+            post=self.post, author=self.stranger_user, text='Коммент'
+        )
+        Follow.objects.create(user=self.stranger_user, author=self.user)
+        job = schedule_user_deletion(self.user)
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_active)
+        # Comment, follow and the two notifications about them
+        self.assertEqual(job.total, 5)
+        call_command(
+            'run_deletions', once=True, batch_size=1, stdout=StringIO()
+        )
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.DONE)
+        self.assertEqual(job.processed, 5)
+        self.assertEqual(job.media_removed, 1)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(storage.exists(name))
+
+    def test_group_posts_are_detached_before_deletion(self):
+        """Test group deletion keeps posts without the group"""
+        schedule_group_deletion(self.group)
+        call_command('run_deletions', once=True, stdout=StringIO())
+        self.assertFalse(Group.objects.filter(pk=self.group.pk).exists())
+        self.post.refresh_from_db()
+        self.assertIsNone(self.post.group)
+
+    def test_jobs_are_queued_once_and_reclaimed_when_stuck(self):
+        """Test a second request reuses the job and a dead worker's job
+        is finished by the next one
+        """
+        job = schedule_group_deletion(self.group)
+        self.assertEqual(schedule_group_deletion(self.group), job)
+        DeletionJob.objects.filter(pk=job.pk).update(
+            status=DeletionJob.RUNNING,
+            heartbeat=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(schedule_group_deletion(self.group), job)
+        call_command('run_deletions', once=True, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.DONE)
+        self.assertFalse(Group.objects.filter(pk=self.group.pk).exists())
+
+    def test_admin_delete_only_schedules_job(self):
+        """Test deleting a group from admin queues a job"""
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.authorized_client.force_login(admin)
+        self.authorized_client.post(
+            reverse('admin:posts_group_delete', args=[self.group.pk]),
+            {'post': 'yes'}
+        )
+        self.assertTrue(Group.objects.filter(pk=self.group.pk).exists())
+        self.assertTrue(DeletionJob.objects.filter(
+            kind=DeletionJob.GROUP, object_id=self.group.pk
+        ).exists())
+
+    def test_admin_delete_needs_permissions_along_the_cascade(self):
+        """Test a staff user who can't delete posts can't delete authors"""
+        staff = User.objects.create_user('staff', is_staff=True)
+        staff.user_permissions.set(Permission.objects.filter(
+            content_type__app_label='auth',
+            codename__in=['view_user', 'change_user', 'delete_user']
+        ))
+        self.authorized_client.force_login(staff)
+        url = reverse('admin:auth_user_delete', args=[self.user.pk])
+        response = self.authorized_client.get(url)
+        self.assertIn(
+            Post._meta.verbose_name, response.context['perms_lacking']
+        )
+        response = self.authorized_client.post(url, {'post': 'yes'})
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(DeletionJob.objects.exists())
+
+
+class RerenderTextCommandTest(Settings):
+    def test_outdated_html_is_rerendered(self):
+        """Test command refreshes HTML left by an older renderer"""
+        Post.objects.filter(pk=self.post.pk).update(
+            text_html='old', text_html_version=0
+        )
+        call_command('rerender_text', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text_html, self.post.text)
+        self.assertGreater(self.post.text_html_version, 0)
+
+
+class BackfillTagsCommandTest(Settings):
+    def test_existing_posts_are_indexed(self):
+        """Test backfill builds index rows for posts saved without them"""
+        Post.objects.filter(pk=self.post.pk).update(text='Старый #пост')
+        call_command('backfill_tags', batch_size=1, stdout=StringIO())
+        self.assertTrue(
+            self.post.tag_links.filter(tag__name='пост').exists()
+        )
+
+
+class NotificationDigestTest(Settings):
+    def setUp(self):
+        super().setUp()
+        self.user.email = 'leatherman@yatube.ru'
+        self.user.save()
+
+    def test_events_are_coalesced_into_one_digest(self):
+        """Test follow and comments end up in a single email"""
+        self.stranger_client.get(
+            reverse('profile_follow', args=[self.user.username])
+        )
+        for text in ('Первый', 'Второй'):
+            self.stranger_client.post(self.ADD_COMMENT_URL, {'text': text})
+        self.assertEqual(self.user.inbox.unread, 3)
+        call_command('send_notifications', once=True, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Новые подписчики: Stranger', mail.outbox[0].body)
+        self.assertIn('от: Stranger, Stranger', mail.outbox[0].body)
+        call_command('send_notifications', once=True, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_delivery_preferences_are_respected(self):
+        """Test switched off events don't produce emails"""
+        self.authorized_client.post(reverse('notifications'), {
+            'email_on_follow': '',
+            'email_on_comment': '',
+        })
+        self.stranger_client.post(self.ADD_COMMENT_URL, {'text': 'Текст'})
+        call_command('send_notifications', once=True, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_visiting_notifications_resets_unread_counter(self):
+        """Test notifications page marks everything read"""
+        self.stranger_client.post(self.ADD_COMMENT_URL, {'text': 'Текст'})
+        self.authorized_client.get(reverse('notifications'))
+        self.user.inbox.refresh_from_db()
+        self.assertEqual(self.user.inbox.unread, 0)
+        self.assertFalse(self.user.notifications.filter(is_read=False))
+
+    def test_deleted_notifications_leave_unread_counter(self):
+        """Test deleting a post or its commenter recounts unread marks"""
+        other = Post.objects.create(author=self.user, text='Другой')
+        for post in (self.post, other):
+            self.stranger_client.post(reverse('add_comment', kwargs={
+                'username': self.user.username, 'post_id': post.pk
+            }), {'text': 'Коммент'})
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.guest_client.force_login(admin)
+        self.guest_client.post(
+            reverse('admin:posts_post_delete', args=[self.post.pk]),
+            {'post': 'yes'}
+        )
+        self.user.inbox.refresh_from_db()
+        self.assertEqual(self.user.inbox.unread, 1)
+        # Out of step already, e.g. counted before notifications were read
+        Inbox.objects.filter(user=self.user).update(unread=5)
+        schedule_user_deletion(self.stranger_user)
+        call_command('run_deletions', once=True, stdout=StringIO())
+        self.user.inbox.refresh_from_db()
+        self.assertEqual(self.user.inbox.unread, 0)
+
+
+class WebhookStandIn(BaseHTTPRequestHandler):
+    """Records deliveries and answers with the server's current status"""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.received.append((dict(self.headers), body))
+        if self.path == '/garbage':
+            # Not HTTP at all
+            self.wfile.write(b'garbage\r\n\r\n')
+            return
+        self.send_response(self.server.status)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class OutboxRelayTest(Settings):
+    def setUp(self):
+        super().setUp()
+        self.server = HTTPServer(('127.0.0.1', 0), WebhookStandIn)
+        self.server.received = []
+        self.server.status = 200
+        threading.Thread(target=self.server.serve_forever).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.endpoint = WebhookEndpoint.objects.create(
+            url=f'http://127.0.0.1:{self.server.server_port}/hook',
+            secret='s3cret',
+            cursor=OutboxEvent.objects.order_by('pk').last().pk,
+        )
+
+    def relay(self):
+        call_command('relay_outbox', once=True, stdout=StringIO())
+        self.endpoint.refresh_from_db()
+
+    def test_events_are_written_with_changes(self):
+        """Test views leave an outbox event for each change"""
+        self.stranger_client.post(self.ADD_COMMENT_URL, {'text': 'Хм'})
+        self.stranger_client.get(
+            reverse('profile_follow', args=[self.user.username])
+        )
+        self.stranger_client.get(
+            reverse('profile_unfollow', args=[self.user.username])
+        )
+        topics = OutboxEvent.objects.filter(
+            pk__gt=self.endpoint.cursor
+        ).values_list('topic', flat=True)
+        self.assertEqual(list(topics), [
+            OutboxEvent.COMMENT_CREATED,
+            OutboxEvent.FOLLOW_CREATED,
+            OutboxEvent.FOLLOW_DELETED,
+        ])
+
+    def test_events_are_delivered_signed_and_in_order(self):
+        """Test relay posts a signed ordered batch and moves the cursor"""
+        self.authorized_client.post(reverse('new_post'), {'text': 'Первый'})
+        self.authorized_client.post(reverse('new_post'), {'text': 'Второй'})
+        self.relay()
+        self.assertEqual(len(self.server.received), 1)
+        headers, body = self.server.received[0]
+        self.assertEqual(
+            headers[SIGNATURE_HEADER],
+            sign('s3cret', headers[TIMESTAMP_HEADER], body)
+        )
+        events = json.loads(body)['events']
+        self.assertEqual(
+            [event['data']['text'] for event in events],
+            ['Первый', 'Второй']
+        )
+        self.assertEqual(self.endpoint.cursor, events[-1]['id'])
+        self.relay()
+        self.assertEqual(len(self.server.received), 1)
+
+    def test_failed_delivery_is_retried_later(self):
+        """Test a failing endpoint keeps its cursor and backs off"""
+        self.server.status = 500
+        cursor = self.endpoint.cursor
+        self.authorized_client.post(reverse('new_post'), {'text': 'Текст'})
+        self.relay()
+        self.assertEqual(self.endpoint.cursor, cursor)
+        self.assertEqual(self.endpoint.attempts, 1)
+        self.assertIsNotNone(self.endpoint.next_attempt_at)
+        # Not due yet
+        self.relay()
+        self.assertEqual(len(self.server.received), 1)
+        self.server.status = 200
+        WebhookEndpoint.objects.update(next_attempt_at=None)
+        self.relay()
+        self.assertEqual(len(self.server.received), 2)
+        self.assertEqual(self.endpoint.attempts, 0)
+        self.assertGreater(self.endpoint.cursor, cursor)
+
+    def test_malformed_answers_dont_stop_the_relay(self):
+        """Test garbage answers and bad URLs are failed attempts"""
+        cursor = self.endpoint.cursor
+        WebhookEndpoint.objects.filter(pk=self.endpoint.pk).update(
+            url=self.endpoint.url.replace('/hook', '/garbage')
+        )
+        broken = WebhookEndpoint.objects.create(
+            url='http://127.0.0.1:port/hook', secret='s3cret', cursor=cursor
+        )
+        later = WebhookEndpoint.objects.create(
+            url=self.endpoint.url, secret='s3cret', cursor=cursor
+        )
+        self.authorized_client.post(reverse('new_post'), {'text': 'Текст'})
+        self.relay()
+        for endpoint in (self.endpoint, broken):
+            endpoint.refresh_from_db()
+            self.assertEqual(endpoint.attempts, 1)
+            self.assertIsNotNone(endpoint.next_attempt_at)
+        later.refresh_from_db()
+        self.assertGreater(later.cursor, cursor)
+
+class ArchiveTest(Settings):
+    def setUp(self):
+        super().setUp()
+        path = os.path.join(
+            tempfile.mkdtemp(dir=settings.MEDIA_ROOT), 'archive.sqlite3'
+        )
+        archive_settings = override_settings(ARCHIVE_PATH=path)
+        archive_settings.enable()
+        self.addCleanup(archive_settings.disable)
+        self.addCleanup(archive.close_reader)
+        for number in range(11):
+            post = Post.objects.create(
+                text=f'Старый пост {number}',
+                author=self.user,
+                group=self.group,
+            )
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=timezone.now() - timedelta(days=400 + number)
+            )
+        self.old_post = post
+        Comment.objects.create(
+            post=post, author=self.stranger_user, text='Древний коммент'
+        )
+        self.events = OutboxEvent.objects.count()
+        call_command('archive_posts', days=30, stdout=StringIO())
+
+    def test_old_posts_are_moved_to_archive(self):
+        """Test archived posts leave the hot tables quietly"""
+        self.assertEqual(list(Post.objects.all()), [self.post])
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(archive.count_posts('author_id', self.user.pk), 11)
+        self.assertEqual(OutboxEvent.objects.count(), self.events)
+        # The comment notification moved along with the post
+        self.assertEqual(self.user.inbox.unread, 0)
+
+    def test_pages_read_across_hot_and_cold_posts(self):
+        """Test profile and group pages paginate over both storages"""
+        for url in (
+            reverse('profile', args=[self.user.username]),
+            reverse('group_post', args=[self.group.slug]),
+        ):
+            with self.subTest(url=url):
+                first = self.guest_client.get(url)
+                self.assertEqual(first.context['paginator'].count, 12)
+                self.assertEqual(
+                    first.context['page'].object_list[0], self.post
+                )
+                last = self.guest_client.get(url, {'page': 2})
+                self.assertEqual(
+                    [post.text for post in last.context['page']],
+                    ['Старый пост 9', 'Старый пост 10']
+                )
+
+    def test_archived_post_is_read_only(self):
+        """Test an archived post shows its comments but takes no new ones"""
+        url = reverse('post', args=[self.user.username, self.old_post.pk])
+        response = self.stranger_client.get(url)
+        self.assertContains(response, 'Древний коммент')
+        self.assertIsNone(response.context['form'])
+        self.stranger_client.post(url, {'text': 'Некропостинг'})
+        self.assertFalse(Comment.objects.exists())
+
+    def test_archived_post_keeps_likes_and_history(self):
+        """Test rows the delete would cascade to are moved along"""
+        post = Post.objects.create(text='Было', author=self.user)
+        # Still in a counter shard, not yet in likes_count
+        likes.like(self.stranger_user, post)
+        post.text = 'Стало'
+        post.save()
+        revisions.record(post, 'Было')
+        Post.objects.filter(pk=post.pk).update(
+            pub_date=timezone.now() - timedelta(days=400)
+        )
+        call_command('archive_posts', days=30, stdout=StringIO())
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
+        args = [self.user.username, post.pk]
+        response = self.guest_client.get(reverse('post', args=args))
+        self.assertEqual(response.context['post'].likes_count, 1)
+        response = self.guest_client.get(reverse('post_history', args=args))
+        self.assertEqual(
+            [revision.number for revision in response.context['page']],
+            [2, 1]
+        )
+        response = self.guest_client.get(
+            reverse('post_revision', args=args + [1])
+        )
+        self.assertEqual(response.context['text'], 'Было')
+        self.assertFalse(response.context['is_last'])
+        self.assertEqual(
+            len(list(archive.iter_rows('user_like', 'post_id', post.pk))), 1
+        )
+        # The comment in setUp notified the author
+        self.assertEqual(len(list(archive.iter_rows(
+            'notification', 'recipient_id', self.user.pk
+        ))), 1)
+
+    def test_user_deletion_removes_archived_posts(self):
+        """Test background deletion reaches into the archive"""
+        job = schedule_user_deletion(self.user)
+        call_command('run_deletions', once=True, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.DONE)
+        self.assertEqual(archive.count_posts('author_id', self.user.pk), 0)
+        self.assertFalse(list(archive.iter_rows(
+            'notification', 'recipient_id', self.user.pk
+        )))
+
+
+class StaticPipelineTest(Settings):
+    def setUp(self):
+        super().setUp()
+        source = tempfile.mkdtemp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source)
+        self.addCleanup(shutil.rmtree, self.root)
+        os.makedirs(os.path.join(source, 'css'))
+        self.css = 'body { background: url("dot.svg"); }\n' * 20
+        with open(os.path.join(source, 'css', 'site.css'), 'w') as css:
+            css.write(self.css)
+        with open(os.path.join(source, 'css', 'dot.svg'), 'w') as svg:
+            svg.write('<svg xmlns="http://www.w3.org/2000/svg"/>')
+        static_settings = override_settings(
+            STATICFILES_DIRS=[source],
+            STATIC_ROOT=self.root,
+            STATICFILES_FINDERS=[
+                'django.contrib.staticfiles.finders.FileSystemFinder'
+            ],
+            STATICFILES_STORAGE=(
+                'posts.staticfiles.CompressedManifestStaticFilesStorage'
+            ),
+        )
+        static_settings.enable()
+        self.addCleanup(static_settings.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(self.root, 'staticfiles.json')) as manifest:
+            self.hashed = json.load(manifest)['paths']['css/site.css']
+
+    def get(self, path, **headers):
+        return serve(RequestFactory().get('/', **headers), path)
+
+    def test_hashed_files_get_compressed_siblings(self):
+        """Test collectstatic writes a valid manifest and .gz files"""
+        self.assertNotEqual(self.hashed, 'css/site.css')
+        self.assertTrue(os.path.isfile(
+            os.path.join(self.root, self.hashed + '.gz')
+        ))
+        call_command('check_static', stdout=StringIO())
+
+    def test_encoding_is_negotiated(self):
+        """Test gzip is served only to clients accepting it"""
+        response = self.get(self.hashed, HTTP_ACCEPT_ENCODING='br, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        body = gzip.decompress(b''.join(response.streaming_content))
+        self.assertIn(b'background', body)
+        plain = self.get(self.hashed, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        # Unhashed names may change, so they are cached briefly
+        unhashed = self.get('css/site.css')
+        self.assertNotEqual(unhashed['Cache-Control'], IMMUTABLE)
+
+    def test_check_reports_changed_files(self):
+        """Test check_static fails when a file doesn't match its hash"""
+        with open(os.path.join(self.root, self.hashed), 'a') as css:
+            css.write('/* edited */')
+        with self.assertRaises(CommandError):
+            call_command('check_static', stdout=StringIO())
+
+
+class ScheduledPostTest(Settings):
+    def test_drafts_and_scheduled_posts_are_hidden(self):
+        """Test pending posts reach only their author until published"""
+        later = timezone.localtime() + timedelta(hours=1)
+        self.authorized_client.post(reverse('new_post'), {
+            'text': 'Черновик #скоро', 'draft': 'on'
+        })
+        self.authorized_client.post(reverse('new_post'), {
+            'text': 'Отложенная',
+            'publish_at': later.strftime('%Y-%m-%d %H:%M'),
+        })
+        draft = Post.objects.get(text__startswith='Черновик')
+        self.assertEqual(
+            Post.objects.filter(is_published=False).count(), 2
+        )
+        self.assertFalse(Tag.objects.filter(name='скоро').exists())
+        url = reverse('post', args=[self.user.username, draft.pk])
+        self.assertEqual(self.stranger_client.get(url).status_code, 404)
+        self.assertEqual(self.authorized_client.get(url).status_code, 200)
+        response = self.authorized_client.get(reverse('drafts'))
+        self.assertEqual(len(response.context['page']), 2)
+        for page in (reverse('index'), reverse('feed', args=['rss'])):
+            self.assertNotContains(self.guest_client.get(page), 'Отложенная')
+
+    def test_due_posts_are_published_exactly_once(self):
+        """Test the worker publishes due posts once and fires their events"""
+        due = timezone.now() - timedelta(minutes=1)
+        post = Post.objects.create(
+            text='Пора #сейчас', author=self.user, is_published=False,
+            publish_at=due
+        )
+        Post.objects.create(
+            text='Позже', author=self.user, is_published=False,
+            publish_at=due + timedelta(hours=1)
+        )
+        cursor = OutboxEvent.objects.order_by('pk').last().pk
+        self.assertEqual(scheduling.next_due(), due)
+        call_command('publish_scheduled', once=True, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual((post.is_published, post.pub_date), (True, due))
+        self.assertEqual(scheduling.publish_due(), 0)
+        self.assertEqual(Tag.objects.get(name='сейчас').post_count, 1)
+        topics = OutboxEvent.objects.filter(
+            pk__gt=cursor
+        ).values_list('topic', flat=True)
+        self.assertEqual(list(topics), [OutboxEvent.POST_CREATED])
+        self.assertContains(self.guest_client.get(reverse('index')), 'Пора')
+
+    def test_draft_published_from_edit_form(self):
+        """Test saving a draft without the draft flag publishes it"""
+        draft = Post.objects.create(
+            text='Черновик', author=self.user, is_published=False
+        )
+        self.authorized_client.post(
+            reverse('post_edit', args=[self.user.username, draft.pk]),
+            {'text': 'Готово'}
+        )
+        draft.refresh_from_db()
+        self.assertTrue(draft.is_published)
+        self.assertEqual(
+            OutboxEvent.objects.order_by('pk').last().topic,
+            OutboxEvent.POST_CREATED
+        )
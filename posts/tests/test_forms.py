@@ -1,13 +1,46 @@
+import io
+from unittest import mock
+
 from django import forms
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from posts.models import Group, Post
+from posts.audio import analyze
+from posts.groups import CHOICES_LIMIT, get_group_choices
+from posts.models import Group, Post, User
 
 from .test_settings import Settings
 
 # Making constants
 NEWPOST_URL = reverse('new_post')
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, stereo, no CRC
+FRAME_HEADER = b'\xff\xfb\x90\x00'
+FRAME_LENGTH = 417
+
+
+def id3_frame(frame_id, text):
+    body = b'\x03' + text.encode('utf-8')
+    return frame_id + len(body).to_bytes(4, 'big') + b'\x00\x00' + body
+
+
+def make_mp3(gains, title='Песня', artist='Автор'):
+    """Return an ID3v2.3 tag, a Xing frame and frames with these gains"""
+    frames = id3_frame(b'TIT2', title) + id3_frame(b'TPE1', artist)
+    size = bytes((len(frames) >> shift) & 0x7f for shift in (21, 14, 7, 0))
+    data = b'ID3\x03\x00\x00' + size + frames
+    xing = FRAME_HEADER + bytes(32) + b'Xing'
+    data += xing.ljust(FRAME_LENGTH, b'\x00')
+    for gain in gains:
+        # 20 zero bits of main_data_begin, private bits and scfsi, then
+        # 4 granule/channels with part2_3_length and global_gain set
+        bits = 0
+        for _ in range(4):
+            bits = (bits << 59) | (100 << 47) | (gain << 30)
+        side = bits.to_bytes(32, 'big')
+        data += (FRAME_HEADER + side).ljust(FRAME_LENGTH, b'\x00')
+    return data
 
 
 class TestFormClass(Settings):
@@ -129,3 +162,124 @@ class TestFormClass(Settings):
         self.assertEqual(comment_list[0].text, form_data['text'])
         self.assertEqual(comment_list[0].author, self.user)
         self.assertEqual(comment_list[0].post, self.post)
+
+    def test_signup_refuses_names_taken_by_routes(self):
+        """Test nobody can sign up as a page their profile would hide"""
+        for username in ('drafts', 'Notifications', 'feed'):
+            with self.subTest(username=username):
+                response = self.guest_client.post(reverse('signup'), {
+                    'username': username,
+                    'password1': 'Sup3r-secret!',
+                    'password2': 'Sup3r-secret!',
+                })
+                self.assertFormError(
+                    response, 'form', 'username',
+                    'Это имя занято адресом сайта, выберите другое.'
+                )
+        self.assertFalse(User.objects.filter(username='drafts').exists())
+
+
+class GroupChoicesTest(Settings):
+    def setUp(self):
+        super().setUp()
+        Group.objects.bulk_create(
+            Group(title=f'Клуб {number:03}', slug=f'club{number:03}')
+            for number in range(CHOICES_LIMIT * 2)
+        )
+
+    def test_form_renders_limited_cached_choices(self):
+        """Test the select keeps its size and the current group"""
+        far_group = Group.objects.get(slug='club039')
+        Post.objects.filter(pk=self.post.pk).update(group=far_group)
+        self.authorized_client.get(self.POST_EDIT_URL)
+        with CaptureQueriesContext(connection) as queries:
+            form_field = self.authorized_client.get(
+                self.POST_EDIT_URL
+            ).context['form'].fields['group']
+        # The first titles come from the cache, the current one by its id
+        group_queries = [
+            query['sql'] for query in queries
+            if 'FROM "posts_group"' in query['sql']
+        ]
+        self.assertEqual(len(group_queries), 1)
+        self.assertIn('"posts_group"."id" =', group_queries[0])
+        # Empty choice, first groups and the current one
+        self.assertEqual(len(form_field.choices), CHOICES_LIMIT + 2)
+        self.assertIn((far_group.pk, far_group.title), form_field.choices)
+
+    def test_new_groups_are_valid_choices_at_once(self):
+        """Test group writes drop the cached choices"""
+        self.authorized_client.get(NEWPOST_URL)
+        group = Group.objects.create(title='Новое', slug='new_one')
+        self.authorized_client.post(
+            NEWPOST_URL, {'text': 'Текст', 'group': group.id}
+        )
+        self.assertTrue(Post.objects.filter(group=group).exists())
+
+    def test_group_deleted_elsewhere_is_rejected(self):
+        """Test a group missing from the database fails validation even
+        while the cached choices still list it
+        """
+        group_id = Group.objects.get(slug='club000').pk
+        self.authorized_client.get(NEWPOST_URL)
+        # Deleted by another process: this one's cache isn't told
+        with mock.patch('posts.signals.invalidate_group_choices'):
+            Group.objects.filter(pk=group_id).delete()
+        self.assertIn(group_id, dict(get_group_choices()))
+        response = self.authorized_client.post(
+            NEWPOST_URL, {'text': 'Текст', 'group': group_id}
+        )
+        self.assertTrue(response.context['form'].errors['group'])
+
+    def test_unknown_group_is_rejected(self):
+        """Test a made up group id doesn't pass validation"""
+        response = self.authorized_client.post(
+            NEWPOST_URL, {'text': 'Текст', 'group': 100500}
+        )
+        self.assertTrue(response.context['form'].errors['group'])
+
+    def test_autocomplete_finds_by_prefix(self):
+        """Test autocomplete matches title and slug prefixes"""
+        url = reverse('group_autocomplete')
+        for query, count in (('клуб 01', 10), ('club03', 10), ('нет', 0)):
+            with self.subTest(query=query):
+                results = self.authorized_client.get(
+                    url, {'q': query}
+                ).json()['results']
+                self.assertEqual(len(results), count)
+
+
+class MusicUploadTest(Settings):
+    def test_frames_and_tags_are_read(self):
+        """Test duration, bitrate, tags and peaks of a generated file"""
+        info = analyze(io.BytesIO(make_mp3(range(100, 200))))
+        self.assertEqual(info['duration'], round(100 * 1152 / 44100, 3))
+        self.assertEqual(info['bitrate'], 128)
+        self.assertEqual((info['title'], info['artist']), ('Песня', 'Автор'))
+        self.assertEqual(len(info['peaks']), 100)
+        self.assertEqual((info['peaks'][0], info['peaks'][-1]), (5, 100))
+        self.assertIsNone(analyze(io.BytesIO(b'ID3 not music' * 100)))
+
+    def test_upload_stores_metadata_for_the_feed(self):
+        """Test an uploaded file's metadata is saved and shown"""
+        music = SimpleUploadedFile(
+            'song.mp3', make_mp3([150] * 120), content_type='audio/mpeg'
+        )
+        response = self.authorized_client.post(
+            NEWPOST_URL, {'text': 'С музыкой', 'music': music}, follow=True
+        )
+        post = Post.objects.get(text='С музыкой')
+        self.assertEqual(post.music_bitrate, 128)
+        self.assertEqual(post.music_title, 'Песня')
+        self.assertEqual(len(post.waveform), 120)
+        self.assertContains(response, '0:03 · 128 кбит/с')
+        self.assertContains(response, 'preload="none"')
+
+    def test_file_without_audio_is_rejected(self):
+        """Test a file with no MP3 frames fails validation"""
+        music = SimpleUploadedFile('song.mp3', b'not music' * 100)
+        response = self.authorized_client.post(
+            NEWPOST_URL, {'text': 'Тишина', 'music': music}
+        )
+        self.assertTrue(response.context['form'].has_error('music'))
+        self.assertFalse(Post.objects.filter(text='Тишина').exists())
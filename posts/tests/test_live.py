@@ -0,0 +1,118 @@
+import asyncio
+import tempfile
+
+from django.test import override_settings
+from django.urls import reverse
+
+from posts.live import Broker, broker, publish_post, serve_events
+from posts.models import Comment
+
+from .test_settings import Settings
+
+
+def run_stream(query, publish, limit=2):
+    """Open an SSE stream, call publish and return the first bodies"""
+    bodies = []
+
+    async def scenario():
+        closed = asyncio.Event()
+
+        async def receive():
+            await closed.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message.get('body'):
+                bodies.append(message['body'])
+            if len(bodies) == limit:
+                closed.set()
+
+        scope = {
+            'type': 'http',
+            'path': '/events/',
+            'query_string': query,
+            'headers': [],
+        }
+        stream = asyncio.ensure_future(serve_events(scope, receive, send))
+        while not broker.subscriptions and not stream.done():
+            await asyncio.sleep(0)
+        publish()
+        await asyncio.wait_for(stream, 5)
+
+    asyncio.run(scenario())
+    return bodies
+
+
+class LiveUpdatesTest(Settings):
+    def test_new_post_is_pushed_to_index_stream(self):
+        """Test subscribers of the index stream get the post's card URL"""
+        bodies = run_stream(b'stream=index', lambda: publish_post(self.post))
+        self.assertTrue(bodies[1].startswith(b'event: post\n'))
+        url = reverse('post_card', args=[self.user.username, self.post.pk])
+        self.assertIn(f'data: {url}\n'.encode('utf-8'), bodies[1])
+        self.assertEqual(broker.subscriptions, 0)
+
+    def test_cards_are_rendered_for_the_fetching_user(self):
+        """Test pushed cards keep like buttons and the author's links"""
+        url = reverse('post_card', args=[self.user.username, self.post.pk])
+        response = self.authorized_client.get(url)
+        self.assertContains(response, self.post.text)
+        self.assertContains(response, self.POST_EDIT_URL)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertNotContains(self.stranger_client.get(url), 'Редактировать')
+        comment = Comment.objects.create(
+            post=self.post, author=self.stranger_user, text='Живой'
+        )
+        response = self.authorized_client.get(
+            reverse('comment_card', args=[comment.pk])
+        )
+        self.assertContains(response, 'Живой')
+        self.assertContains(
+            response, reverse('like_comment', args=[comment.pk])
+        )
+
+    @override_settings(LIVE_HEARTBEAT=0.01)
+    def test_idle_stream_gets_heartbeats(self):
+        """Test idle connection receives keep-alive comments"""
+        bodies = run_stream(b'stream=index', lambda: None)
+        self.assertEqual(bodies[1], b': ping\n\n')
+
+    @override_settings(LIVE_MAX_CONNECTIONS=0)
+    def test_connection_limit(self):
+        """Test stream refuses connections over the limit"""
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(serve_events(
+            {'type': 'http', 'query_string': b'stream=index'}, None, send
+        ))
+        self.assertEqual(messages[0]['status'], 503)
+
+    def test_events_are_fanned_out_between_processes(self):
+        """Test an event published elsewhere reaches local subscribers"""
+        with tempfile.TemporaryDirectory() as directory:
+            listener, publisher = Broker(directory), Broker(directory)
+            received = []
+
+            async def scenario():
+                loop = asyncio.get_running_loop()
+                listener.listen(loop)
+                subscription = listener.subscribe(['posts'], loop)
+                publisher.publish(['posts'], 'post', '<p>Пост</p>')
+                received.append(
+                    await asyncio.wait_for(subscription.queue.get(), 5)
+                )
+                loop.remove_reader(listener.socket.fileno())
+                listener.socket.close()
+
+            asyncio.run(scenario())
+        self.assertEqual(
+            received[0], 'event: post\ndata: <p>Пост</p>\n\n'.encode('utf-8')
+        )
+
+    def test_wsgi_fallback_stops_event_source(self):
+        """Test events url without ASGI tells clients not to reconnect"""
+        response = self.guest_client.get(reverse('live_events'))
+        self.assertEqual(response.status_code, 204)
@@ -1,3 +1,6 @@
+from posts.models import Comment
+from posts.rendering import RENDERER_VERSION
+
 from .test_settings import Settings
 
 
@@ -41,3 +44,17 @@ class PostModelTest(Settings):
         res = '|'.join(post_str_data)
         self.assertEqual(str(post), res)
         self.assertEqual(str(group), group.title)
+
+    def test_text_html_is_rendered_on_save(self):
+        """Test post and comment keep escaped HTML of their text"""
+        self.post.text = '<b>Жирный</b>\nвторая строка'
+        self.post.save()
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text='раз\nдва'
+        )
+        self.assertEqual(
+            self.post.text_html,
+            '&lt;b&gt;Жирный&lt;/b&gt;<br>вторая строка'
+        )
+        self.assertEqual(self.post.text_html_version, RENDERER_VERSION)
+        self.assertEqual(comment.text_html, 'раз<br>два')
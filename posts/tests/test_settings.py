@@ -5,7 +5,7 @@ from django.conf import settings
 from django.contrib.flatpages.models import FlatPage
 from django.contrib.sites.models import Site
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
 from posts.models import Group, Post, User
@@ -14,7 +14,12 @@ from posts.models import Group, Post, User
 class Settings(TestCase):
     @classmethod
     def setUpClass(cls):
-        settings.MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        # override_settings also resets the cached default storage location
+        cls.media_settings = override_settings(
+            MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR),
+            EXPORT_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR),
+        )
+        cls.media_settings.enable()
         super().setUpClass()
         # Create a test Group object
         Group.objects.create(
@@ -48,6 +53,8 @@ class Settings(TestCase):
     def tearDownClass(cls):
         super().tearDownClass()
         shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(settings.EXPORT_ROOT, ignore_errors=True)
+        cls.media_settings.disable()
 
     def setUp(self):
         # Test guest client
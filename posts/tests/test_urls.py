@@ -1,5 +1,19 @@
+import asyncio
+import os
+import subprocess
+import sys
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.flatpages.models import FlatPage
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from yatube.asgi import build_environ, run_wsgi
+
 from .test_settings import Settings
 
 # Making constant urls
@@ -85,3 +99,96 @@ class StaticURLTests(Settings):
     def test_page_show_404(self):
         response = self.authorized_client.get(PROFILE_URL+'/data/')
         self.assertEqual(response.status_code, 404)
+
+
+class FlatpageCacheTests(Settings):
+    def flatpage_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(url)
+        return response, [
+            query for query in queries
+            if 'django_flatpage' in query['sql']
+        ]
+
+    def test_pages_and_misses_are_cached(self):
+        """Test repeated flatpage hits and 404s skip the lookup"""
+        for url, status in ((ABOUT_URL, 200), ('/group/nope/x/', 404)):
+            with self.subTest(url=url):
+                self.guest_client.get(url)
+                response, queries = self.flatpage_queries(url)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(queries, [])
+
+    def test_saved_flatpage_replaces_cached_miss(self):
+        """Test a new flatpage is served where a miss was cached"""
+        url = '/rules/'
+        self.assertEqual(self.guest_client.get(url).status_code, 404)
+        page = FlatPage.objects.create(url=url, title='Правила')
+        page.sites.add(self.site)
+        self.assertContains(self.guest_client.get(url), 'Правила')
+
+
+class ASGIEnvironTests(SimpleTestCase):
+    def test_scope_is_translated_to_wsgi_environ(self):
+        """Test ASGI scope keeps path, query and headers for Django"""
+        body = BytesIO(b'text=1')
+        environ = build_environ({
+            'type': 'http',
+            'method': 'POST',
+            'path': '/Привет/',
+            'query_string': b'page=2',
+            'headers': [
+                (b'content-type', b'application/x-www-form-urlencoded'),
+                (b'accept', b'text/html'),
+                (b'accept', b'*/*'),
+            ],
+            'server': ('testserver', 80),
+            'client': ('10.0.0.1', 5000),
+        }, body)
+        self.assertEqual(environ['REQUEST_METHOD'], 'POST')
+        self.assertEqual(
+            environ['PATH_INFO'].encode('latin-1').decode('utf-8'),
+            '/Привет/'
+        )
+        self.assertEqual(environ['QUERY_STRING'], 'page=2')
+        self.assertEqual(
+            environ['CONTENT_TYPE'], 'application/x-www-form-urlencoded'
+        )
+        self.assertEqual(environ['HTTP_ACCEPT'], 'text/html,*/*')
+        self.assertEqual(environ['REMOTE_ADDR'], '10.0.0.1')
+        self.assertIs(environ['wsgi.input'], body)
+
+    def test_failing_application_still_starts_a_response(self):
+        """Test a view error before start_response ends up as a 500"""
+        async def run():
+            loop = asyncio.get_running_loop()
+            queue = asyncio.Queue()
+            with self.assertRaises(RuntimeError):
+                await loop.run_in_executor(None, run_wsgi, {}, loop, queue)
+            return [queue.get_nowait() for _ in range(queue.qsize())]
+
+        with mock.patch(
+            'yatube.asgi.wsgi_application', side_effect=RuntimeError
+        ):
+            messages = asyncio.run(run())
+        self.assertEqual([message[:2] for message in messages], [
+            ('start', 500), ('end',)
+        ])
+
+
+class SettingsProfileTests(SimpleTestCase):
+    def test_profile_module_loads_no_other_profile(self):
+        """Test naming prod directly doesn't import dev settings first"""
+        env = dict(
+            os.environ, DJANGO_SETTINGS_MODULE='yatube.settings.prod',
+            YATUBE_PROFILE='dev', SECRET_KEY='x'
+        )
+        output = subprocess.run(
+            [sys.executable, '-c', (
+                'import sys; from django.conf import settings; '
+                'print(settings.DEBUG, "yatube.settings.dev" in sys.modules)'
+            )],
+            env=env, cwd=settings.BASE_DIR, check=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+        self.assertEqual(output.decode().split(), ['False', 'False'])
@@ -1,7 +1,34 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from django.conf import settings
 from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from posts.models import Follow, Post
+from PIL import Image
+
+from posts import (
+    feeds, images, likes, revisions, template_timing, threads
+)
+from posts.ratelimit import (
+    STATS_DAYS, hit, record_throttled, throttled_counts
+)
+from posts.follows import get_follow_set
+from posts.models import (
+    MAX_DEPTH, Comment, Follow, Group, Like, LikeCounter, Mention, Post,
+    PostRevision, Tag, User
+)
+from posts.paginators import estimated_count
+from posts.staticfiles import IMMUTABLE
+from yatube.settings import base
 
 from .test_settings import Settings
 
@@ -17,6 +44,11 @@ PROFILE_URL = reverse('profile', kwargs={'username': USERNAME})
 FOLLOW_URL = reverse('profile_follow', kwargs={'username': USERNAME})
 UNFOLLOW_URL = reverse('profile_unfollow', kwargs={'username': USERNAME})
 FOLLOW_INDEX_URL = reverse('follow_index')
+FEED_URL = reverse('feed', kwargs={'fmt': 'rss'})
+GROUP_FEED_URL = reverse(
+    'group_feed', kwargs={'slug': GROUP_SLUG, 'fmt': 'atom'}
+)
+SITEMAP_URL = reverse('sitemap')
 
 
 class PostPagesTest(Settings):
@@ -146,3 +178,635 @@ class PostPagesTest(Settings):
         response = self.authorized_client.get(FOLLOW_INDEX_URL)
         page = response.context.get('page')
         self.assertEqual(len(page), 0)
+
+    def test_follow_set_is_updated_on_follow_and_unfollow(self):
+        """Test cached follow set is invalidated by follow views"""
+        self.assertNotIn(self.user, get_follow_set(self.stranger_user))
+        self.stranger_client.get(FOLLOW_URL)
+        self.assertIn(self.user, get_follow_set(self.stranger_user))
+        self.stranger_client.get(UNFOLLOW_URL)
+        self.assertNotIn(self.user, get_follow_set(self.stranger_user))
+
+    def test_profile_follow_state_is_current(self):
+        """Test the profile shows the follow state as it is now"""
+        self.stranger_client.get(FOLLOW_URL)
+        response = self.stranger_client.get(PROFILE_URL)
+        self.assertTrue(response.context['is_following'])
+        # The set is cached now; unfollowing has to drop it
+        self.stranger_client.get(UNFOLLOW_URL)
+        response = self.stranger_client.get(PROFILE_URL)
+        self.assertFalse(response.context['is_following'])
+        self.assertFalse(Follow.objects.exists())
+
+
+class TemplateTimingTest(Settings):
+    def setUp(self):
+        super().setUp()
+        template_timing.install()
+        self.addCleanup(template_timing.uninstall)
+
+    def test_signal_reports_page_and_includes(self):
+        """Test every template and include render is reported"""
+        timings = []
+
+        def receiver(sender, name, duration, depth, **kwargs):
+            timings.append((name, depth))
+
+        template_timing.template_timed.connect(receiver)
+        self.addCleanup(template_timing.template_timed.disconnect, receiver)
+        self.guest_client.get(GROUP_URL)
+        self.assertIn(('group.html', 0), timings)
+        self.assertIn('includes/post_item.html', [name for name, _ in timings])
+
+    @override_settings(TEMPLATE_TIMING=True)
+    def test_server_timing_header(self):
+        """Test middleware sums render time per template"""
+        response = self.guest_client.get(GROUP_URL)
+        self.assertIn('desc="group.html x1"', response['Server-Timing'])
+
+
+class TagFeedTest(Settings):
+    def test_tags_and_mentions_are_indexed_on_save(self):
+        """Test saving a post updates tag and mention index rows"""
+        post = Post.objects.create(
+            text='#Django и #python для @Stranger.', author=self.user
+        )
+        self.assertEqual(
+            set(post.tag_links.values_list('tag__name', flat=True)),
+            {'django', 'python'}
+        )
+        self.assertEqual(Tag.objects.get(name='django').post_count, 1)
+        self.assertTrue(
+            Mention.objects.filter(post=post, user=self.stranger_user).exists()
+        )
+        self.assertIn(
+            f'<a href="{reverse("tag_posts", args=["django"])}">#Django</a>',
+            post.text_html
+        )
+        post.text = 'Только #python'
+        post.save()
+        self.assertEqual(Tag.objects.get(name='django').post_count, 0)
+        self.assertFalse(Mention.objects.filter(post=post).exists())
+        post.delete()
+        self.assertEqual(Tag.objects.get(name='python').post_count, 0)
+
+    def test_tag_feed_is_paginated_by_keyset(self):
+        """Test tag feed walks pages through the before cursor"""
+        posts = [
+            Post.objects.create(text=f'Пост {number} #лента', author=self.user)
+            for number in range(12)
+        ]
+        url = reverse('tag_posts', args=['лента'])
+        response = self.guest_client.get(url)
+        page = response.context.get('page')
+        self.assertEqual(
+            [row.post for row in page], posts[::-1][:10]
+        )
+        response = self.guest_client.get(
+            url, {'before': page.next_cursor}
+        )
+        second = response.context.get('page')
+        self.assertEqual([row.post for row in second], posts[1::-1])
+        self.assertFalse(second.has_next)
+
+    def test_mentions_feed(self):
+        """Test mentions page lists posts mentioning the user"""
+        post = Post.objects.create(text='Привет, @Stranger', author=self.user)
+        response = self.guest_client.get(
+            reverse('mentions', args=['Stranger'])
+        )
+        self.assertEqual(
+            [row.post for row in response.context.get('page')], [post]
+        )
+
+
+class RateLimitTest(Settings):
+    @override_settings(RATELIMITS={'comment': ('2/m', 'user')})
+    def test_comments_over_limit_get_429(self):
+        """Test third comment in a minute is throttled with Retry-After"""
+        for _ in range(2):
+            response = self.authorized_client.post(
+                self.ADD_COMMENT_URL, {'text': 'Коммент'}
+            )
+            self.assertEqual(response.status_code, 302)
+        response = self.authorized_client.post(
+            self.ADD_COMMENT_URL, {'text': 'Коммент'}
+        )
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(self.post.comments.count(), 2)
+        self.assertEqual(throttled_counts(), {'comment': 1})
+        # Other users have their own budget
+        response = self.stranger_client.post(
+            self.ADD_COMMENT_URL, {'text': 'Коммент'}
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def test_sliding_window_weights_previous_window(self):
+        """Test previous window still counts while it overlaps"""
+        for _ in range(4):
+            self.assertEqual(hit('test', 'client', '4/m', now=59), 0)
+        # A quarter into the next window 3/4 of the old hits still count
+        self.assertEqual(hit('test', 'client', '4/m', now=75), 0)
+        self.assertGreater(hit('test', 'client', '4/m', now=75), 0)
+        self.assertEqual(hit('test', 'client', '4/m', now=120), 0)
+
+    @override_settings(RATELIMITS={'comment': ('2/m', 'user')})
+    def test_counters_survive_expiry_and_age_out(self):
+        """Test a counter gone between add and incr is started again and
+        throttled counts only cover the last STATS_DAYS days
+        """
+        hit('test', 'client', '4/m', now=0)
+        with mock.patch.object(cache, 'incr', side_effect=ValueError):
+            self.assertEqual(hit('test', 'client', '4/m', now=1), 0)
+        day = 24 * 60 * 60
+        record_throttled('comment', now=0)
+        record_throttled('comment', now=day)
+        self.assertEqual(throttled_counts(now=day), {'comment': 2})
+        self.assertEqual(
+            throttled_counts(now=STATS_DAYS * day), {'comment': 1}
+        )
+
+
+class AdminChangelistTest(Settings):
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.admin_client = self.guest_client
+        self.admin_client.force_login(admin)
+
+    def changelist_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.admin_client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_changelists_do_not_query_per_row(self):
+        """Test post and follow rows come with their relations joined"""
+        url_factories = {
+            reverse('admin:posts_post_changelist'): lambda user: (
+                Post.objects.create(
+                    text='Текст', author=user, group=self.group
+                )
+            ),
+            reverse('admin:posts_follow_changelist'): lambda user: (
+                Follow.objects.create(user=user, author=self.user)
+            ),
+        }
+        for url, create in url_factories.items():
+            with self.subTest(url=url):
+                create(User.objects.create(username=f'first{len(url)}'))
+                cache.clear()
+                before = self.changelist_queries(url)
+                for number in range(5):
+                    create(User.objects.create(
+                        username=f'user{number}_{len(url)}'
+                    ))
+                cache.clear()
+                self.assertEqual(self.changelist_queries(url), before)
+
+    def test_estimated_count_skips_partial_indexes(self):
+        """Test the row estimate counts drafts the partial indexes skip"""
+        Post.objects.bulk_create(
+            Post(text='Черновик', author=self.user, is_published=False)
+            for _ in range(3)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimated_count(Post), Post.objects.count())
+
+    def test_post_date_cant_be_backdated(self):
+        """Test the post change form has no publication date field"""
+        response = self.admin_client.get(
+            reverse('admin:posts_post_change', args=[self.post.pk])
+        )
+        self.assertNotIn('pub_date', response.context['adminform'].form.fields)
+
+    def test_follows_are_searched_by_username(self):
+        """Test follow search looks at follower and author names"""
+        Follow.objects.create(user=self.stranger_user, author=self.user)
+        response = self.admin_client.get(
+            reverse('admin:posts_follow_changelist'), {'q': 'Strang'}
+        )
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+    def test_bulk_delete_runs_in_batches(self):
+        """Test delete action removes posts without collecting them first"""
+        for _ in range(3):
+            Post.objects.create(text='Текст', author=self.stranger_user)
+        ids = list(Post.objects.values_list('pk', flat=True))
+        response = self.admin_client.post(
+            reverse('admin:posts_post_changelist'),
+            {'action': 'delete_selected', '_selected_action': ids,
+             'post': 'yes'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Post.objects.exists())
+
+
+class FeedTest(Settings):
+    def test_touch_from_another_process_reaches_feeds(self):
+        """Test scope stamps written by a worker are seen by web processes"""
+        self.assertNotIn('LocMem', base.CACHES['default']['BACKEND'])
+        location = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, location, True)
+        file_cache = {'default': {
+            **base.CACHES['default'], 'LOCATION': location
+        }}
+        with override_settings(CACHES=file_cache):
+            before = feeds.changed_at(['global'])
+            # Cache connections are per thread, like separate processes
+            worker = threading.Thread(target=feeds.touch, args=['global'])
+            worker.start()
+            worker.join()
+            self.assertGreater(feeds.changed_at(['global']), before)
+
+    def test_feeds_list_posts_of_their_scope(self):
+        """Test site, group and author feeds render their posts"""
+        other = Post.objects.create(text='Без сообщества', author=self.user)
+        response = self.guest_client.get(GROUP_FEED_URL)
+        self.assertTrue(
+            response['Content-Type'].startswith('application/atom+xml')
+        )
+        self.assertContains(response, self.post.text)
+        self.assertNotContains(response, other.text)
+        author_feed = reverse(
+            'author_feed', kwargs={'username': USERNAME, 'fmt': 'rss'}
+        )
+        self.assertContains(self.guest_client.get(author_feed), other.text)
+        missing = reverse('feed', kwargs={'fmt': 'json'})
+        self.assertEqual(self.guest_client.get(missing).status_code, 404)
+
+    def test_feed_is_stored_until_a_post_changes(self):
+        """Test repeated requests are served from the cache or with 304"""
+        first = self.guest_client.get(FEED_URL)
+        with self.assertNumQueries(0):
+            again = self.guest_client.get(FEED_URL)
+        self.assertEqual(again.content, first.content)
+        not_modified = self.guest_client.get(
+            FEED_URL, HTTP_IF_NONE_MATCH=first['ETag']
+        )
+        self.assertEqual(not_modified.status_code, 304)
+        Post.objects.create(text='Свежая запись', author=self.stranger_user)
+        fresh = self.guest_client.get(
+            FEED_URL, HTTP_IF_NONE_MATCH=first['ETag']
+        )
+        self.assertEqual(fresh.status_code, 200)
+        self.assertContains(fresh, 'Свежая запись')
+
+    def test_moved_post_leaves_old_group_feed(self):
+        """Test editing a post's group refreshes the old group's feed"""
+        self.assertContains(self.guest_client.get(GROUP_FEED_URL), 'написано')
+        self.post.group = Group.objects.create(
+            title='Другое', slug='other', description='Другое сообщество'
+        )
+        self.post.save()
+        response = self.guest_client.get(GROUP_FEED_URL)
+        self.assertNotContains(response, 'написано')
+
+    def test_sitemap_is_sharded_past_the_limit(self):
+        """Test sitemap.xml turns into an index of pk-range shards"""
+        response = self.guest_client.get(SITEMAP_URL)
+        self.assertContains(response, '<urlset')
+        self.assertContains(response, self.POST_URL)
+        second = Post.objects.create(text='Вторая', author=self.user)
+        with mock.patch.object(feeds, 'SITEMAP_LIMIT', self.post.pk):
+            shard = feeds.shard_of(second.pk)
+            index = self.guest_client.get(SITEMAP_URL)
+            shard_url = reverse('sitemap_shard', args=[shard])
+            self.assertContains(index, '<sitemapindex')
+            self.assertContains(index, shard_url)
+            second_url = reverse('post', args=[USERNAME, second.pk])
+            self.assertContains(self.guest_client.get(shard_url), second_url)
+            beyond = reverse('sitemap_shard', args=[shard + 1])
+            self.assertEqual(self.guest_client.get(beyond).status_code, 404)
+
+
+class ImageResizeTest(Settings):
+    def setUp(self):
+        super().setUp()
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        cache_settings = override_settings(IMAGE_CACHE_DIR=cache_dir)
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+        picture = io.BytesIO()
+        Image.new('RGB', (400, 200), 'teal').save(picture, 'PNG')
+        self.post.image.save('teal.png', ContentFile(picture.getvalue()))
+        self.name = self.post.image.name
+
+    def fetch(self, url):
+        response = self.guest_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content)
+        return response, Image.open(io.BytesIO(content))
+
+    def test_derivatives_have_the_requested_size(self):
+        """Test crop fills the box and fit keeps the aspect ratio"""
+        response, picture = self.fetch(images.image_url(self.name, 100, 80))
+        self.assertEqual(picture.size, (100, 80))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE)
+        _, picture = self.fetch(
+            images.image_url(self.name, 100, 100, images.FIT, 'png')
+        )
+        self.assertEqual((picture.format, picture.size), ('PNG', (100, 50)))
+
+    def test_unsigned_sizes_are_rejected(self):
+        """Test a URL with a changed size or format doesn't resize"""
+        url = images.image_url(self.name, 100, 80)
+        for forged in (
+            url.replace('100x80', '1000x800'), url.replace('.jpg', '.png')
+        ):
+            with self.subTest(url=forged):
+                response = self.guest_client.get(forged)
+                self.assertEqual(response.status_code, 404)
+
+    def test_concurrent_requests_resize_once(self):
+        """Test simultaneous requests for a new size share one resize"""
+        token = images.make_token(self.name, '64x64/crop.jpg')
+        opened = []
+
+        def request():
+            handle, _ = images.get_derivative(token, 64, 64, 'crop', 'jpg')
+            opened.append(handle)
+
+        with mock.patch.object(
+            images, 'resize', wraps=images.resize
+        ) as resize:
+            threads = [threading.Thread(target=request) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        for handle in opened:
+            handle.close()
+        self.assertEqual(len(opened), 8)
+        self.assertEqual(resize.call_count, 1)
+
+    def test_least_recently_used_are_evicted(self):
+        """Test eviction drops the derivative that was used longest ago"""
+        paths = []
+        for width, used_at in ((50, 300), (60, 100), (70, 200)):
+            handle, _ = images.get_derivative(
+                images.make_token(self.name, f'{width}x50/crop.jpg'),
+                width, 50, 'crop', 'jpg'
+            )
+            handle.close()
+            os.utime(handle.name, (used_at, used_at))
+            paths.append(handle.name)
+        total = sum(os.path.getsize(path) for path in paths)
+        self.assertEqual(images.evict(limit=total - 1), 1)
+        self.assertEqual(
+            [os.path.exists(path) for path in paths], [True, False, True]
+        )
+
+    def test_cache_directory_is_scanned_only_when_full(self):
+        """Test writes add to a counter instead of listing every file"""
+        def write(width):
+            handle, _ = images.get_derivative(
+                images.make_token(self.name, f'{width}x50/crop.jpg'),
+                width, 50, 'crop', 'jpg'
+            )
+            handle.close()
+
+        with mock.patch.object(images, 'evict', wraps=images.evict) as evict:
+            # The first write finds no counter and measures the directory
+            write(50)
+            write(60)
+            self.assertEqual(evict.call_count, 1)
+            cache.set(images.USAGE_KEY, settings.IMAGE_CACHE_SIZE)
+            write(70)
+            self.assertEqual(evict.call_count, 2)
+
+
+class LikeTest(Settings):
+    def setUp(self):
+        super().setUp()
+        self.LIKE_URL = reverse('like_post', args=[USERNAME, self.post.pk])
+        self.UNLIKE_URL = reverse(
+            'unlike_post', args=[USERNAME, self.post.pk]
+        )
+
+    def test_like_and_unlike_post(self):
+        """Test a user likes a post once and can take it back"""
+        for _ in range(2):
+            response = self.stranger_client.post(self.LIKE_URL)
+            self.assertRedirects(response, self.POST_URL)
+        self.assertEqual(Like.objects.filter(post=self.post).count(), 1)
+        response = self.stranger_client.get(self.POST_URL)
+        self.assertContains(response, self.UNLIKE_URL)
+        self.stranger_client.post(self.UNLIKE_URL)
+        self.assertFalse(Like.objects.exists())
+        # Guests are sent to the login page
+        self.guest_client.post(self.LIKE_URL)
+        self.assertFalse(Like.objects.exists())
+
+    def test_counter_shards_are_folded_into_likes_count(self):
+        """Test likes_count sums likes and unlikes from all shards"""
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text='Комментарий'
+        )
+        users = [
+            User.objects.create(username=f'fan{number}')
+            for number in range(5)
+        ]
+        for user in users:
+            likes.like(user, post=self.post)
+        likes.unlike(users[0], post=self.post)
+        likes.like(users[1], comment=comment)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+        self.assertEqual(likes.aggregate(batch_size=1), 2)
+        self.post.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual((self.post.likes_count, comment.likes_count), (4, 1))
+        self.assertFalse(LikeCounter.objects.exists())
+
+    def test_liked_posts_of_a_page_take_one_query(self):
+        """Test the liked state of a whole page is looked up at once"""
+        posts = [self.post] + [
+            Post.objects.create(text=f'Запись {number}', author=self.user)
+            for number in range(3)
+        ]
+        likes.like(self.stranger_user, post=posts[1])
+        with self.assertNumQueries(1):
+            liked = likes.liked_post_ids(
+                self.stranger_user, [post.pk for post in posts]
+            )
+        self.assertEqual(liked, {posts[1].pk})
+        response = self.stranger_client.get(PROFILE_URL)
+        self.assertContains(
+            response, reverse('unlike_post', args=[USERNAME, posts[1].pk])
+        )
+        self.assertContains(response, self.LIKE_URL)
+
+    def test_like_has_exactly_one_target(self):
+        """Test the database rejects a like of both a post and a comment"""
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text='Комментарий'
+        )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Like.objects.create(
+                user=self.user, post=self.post, comment=comment
+            )
+
+
+class ThreadTest(Settings):
+    def comment(self, parent=None, text='Комментарий'):
+        return Comment.objects.create(
+            post=self.post, author=self.user, text=text, parent=parent
+        )
+
+    def test_replies_follow_their_parents(self):
+        """Test a thread reads depth first with replies in written order"""
+        first = self.comment(text='первый')
+        second = self.comment(text='второй')
+        reply = self.comment(first, 'ответ')
+        nested = self.comment(reply, 'вложенный')
+        late = self.comment(first, 'поздний')
+        self.assertEqual(
+            (nested.root_id, nested.depth, nested.seq), (first.pk, 2, 2)
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                list(threads.subtree(first)), [first, reply, nested, late]
+            )
+        _, _, comments = threads.thread_page(self.post, 1, replies=2)
+        with self.assertNumQueries(1):
+            self.assertEqual(list(comments), [second, first, reply, nested])
+        first.refresh_from_db()
+        self.assertEqual(first.replies_count, 3)
+
+    def test_deleted_replies_leave_the_count(self):
+        """Test deleting replies lowers the count but frees no numbers"""
+        root = self.comment()
+        reply = self.comment(root)
+        self.comment(reply)
+        last = self.comment(root)
+        # The nested reply goes with its parent
+        reply.delete()
+        root.refresh_from_db()
+        self.assertEqual(root.replies_count, 1)
+        self.assertEqual(self.comment(root).seq, last.seq + 1)
+
+    def test_reply_to_a_comment_without_root(self):
+        """Test answering a comment not yet threaded starts its thread"""
+        Comment.objects.bulk_create([
+            Comment(post=self.post, author=self.user, text='Старый')
+        ])
+        old = Comment.objects.get(text='Старый')
+        reply = self.comment(old)
+        self.assertEqual((reply.root_id, reply.seq), (old.pk, 1))
+
+    def test_depth_is_capped(self):
+        """Test replies below MAX_DEPTH are attached to their parent's
+        parent
+        """
+        comment = self.comment()
+        for _ in range(MAX_DEPTH + 2):
+            comment = self.comment(comment)
+        self.assertEqual(comment.depth, MAX_DEPTH)
+        self.assertEqual(len(comment.path.split('/')), MAX_DEPTH + 1)
+
+    def test_reply_is_posted_with_the_form(self):
+        """Test the comment form answers a comment of the same post only"""
+        parent = self.comment()
+        response = self.authorized_client.get(
+            self.POST_URL, {'reply': parent.pk}
+        )
+        self.assertContains(response, f'value="{parent.pk}"')
+        other = Post.objects.create(text='Другая', author=self.user)
+        foreign = Comment.objects.create(
+            post=other, author=self.user, text='Чужой'
+        )
+        for target in (parent, foreign):
+            self.authorized_client.post(
+                self.POST_URL, {'text': 'Ответ', 'parent': target.pk}
+            )
+        reply = Comment.objects.get(text='Ответ')
+        self.assertEqual((reply.parent, reply.depth), (parent, 1))
+        response = self.authorized_client.get(
+            self.POST_URL, {'thread': parent.pk}
+        )
+        self.assertEqual(response.context['comments'], [parent, reply])
+
+    def test_fill_paths_places_bulk_created_comments(self):
+        """Test comments written by bulk_create are put into threads"""
+        root = self.comment()
+        Comment.objects.bulk_create([
+            Comment(post=self.post, author=self.user, text='Ответ')
+        ])
+        reply = Comment.objects.get(text='Ответ')
+        Comment.objects.bulk_create([Comment(
+            post=self.post, author=self.user, text='Ещё', parent=reply
+        )])
+        Comment.objects.filter(pk=reply.pk).update(parent=root)
+        self.assertEqual(threads.fill_paths(batch_size=1), 2)
+        nested = Comment.objects.get(text='Ещё')
+        self.assertEqual(nested.path.split('/'), [
+            f'{pk:010d}' for pk in (root.pk, reply.pk, nested.pk)
+        ])
+        root.refresh_from_db()
+        self.assertEqual((root.replies_count, nested.seq), (2, 2))
+
+
+class RevisionTest(Settings):
+    def setUp(self):
+        super().setUp()
+        self.EDIT_URL = reverse('post_edit', args=[USERNAME, self.post.pk])
+        self.HISTORY_URL = reverse(
+            'post_history', args=[USERNAME, self.post.pk]
+        )
+
+    def edit(self, text):
+        self.authorized_client.post(self.EDIT_URL, {'text': text})
+
+    def test_edits_are_stored_as_deltas(self):
+        """Test every version is rebuilt from a snapshot and deltas"""
+        texts = [self.post.text]
+        lines = [f'Строка {number}' for number in range(30)]
+        for number in range(2, revisions.SNAPSHOT_EVERY + 4):
+            lines[number] = f'Правка {number}'
+            texts.append('\n'.join(lines))
+            self.edit(texts[-1])
+        self.edit(texts[-1])
+        stored = PostRevision.objects.filter(post=self.post)
+        self.assertEqual(stored.count(), len(texts))
+        self.assertEqual(
+            list(stored.filter(is_snapshot=True).values_list(
+                'number', flat=True
+            ).order_by('number')),
+            [1, 2, revisions.SNAPSHOT_EVERY + 1]
+        )
+        delta = stored.get(number=3)
+        self.assertEqual((delta.text, delta.lines_added), ('', 1))
+        self.assertLess(len(delta.delta), len(texts[2]) // 2)
+        for number, text in enumerate(texts, 1):
+            with self.assertNumQueries(1):
+                self.assertEqual(revisions.rebuild(self.post, number), text)
+
+    def test_text_changed_outside_edit_page_is_kept(self):
+        """Test a delta is never applied to a text it wasn't made from"""
+        texts = [self.post.text, 'а\nб', 'в\nг\nд', 'в\nг\nд\nе']
+        self.edit(texts[1])
+        # The admin or import_data change the text without a revision
+        Post.objects.filter(pk=self.post.pk).update(text=texts[2])
+        self.edit(texts[3])
+        self.assertEqual(
+            [revisions.rebuild(self.post, number) for number in (1, 2, 3, 4)],
+            texts
+        )
+
+    def test_history_pages_skip_texts(self):
+        """Test the history lists revisions without loading texts"""
+        self.edit('Вторая версия')
+        response = self.guest_client.get(self.HISTORY_URL)
+        page = list(response.context['page'])
+        self.assertEqual([revision.number for revision in page], [2, 1])
+        self.assertLessEqual(
+            {'text', 'delta'}, page[0].get_deferred_fields()
+        )
+        response = self.guest_client.get(
+            reverse('post_revision', args=[USERNAME, self.post.pk, 1])
+        )
+        self.assertEqual(response.context['text'], self.post.text)
@@ -0,0 +1,115 @@
+"""Reading comment threads.
+
+Each comment keeps a materialized ``path``: the zero-padded ids of its
+root, of every ancestor and its own, joined by ``/``. Sorting by path
+lists a thread depth first with replies in the order they were written,
+and the comments below one form a single range of paths, because ``/``
+sorts right before ``0``. ``seq`` numbers a thread's comments by time, so
+"the first N replies" is a range of the (root, seq) index.
+
+Every read here is one query over an index, whatever the depth.
+Comment.save fills the fields; ``fill_paths`` does it for rows written
+with bulk_create. A root's ``replies_count`` goes down again as replies
+are deleted, in a post_delete handler, while ``seq`` numbers are never
+reused.
+"""
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import F, Max
+
+from .models import MAX_DEPTH, Comment, path_segment
+
+THREADS_PER_PAGE = 10
+REPLIES_SHOWN = 3
+BATCH_SIZE = 500
+
+
+def subtree(comment):
+    """Return the comment and every reply below it, in thread order"""
+    return Comment.objects.filter(
+        post_id=comment.post_id,
+        path__gte=comment.path,
+        path__lt=comment.path + '0',
+    ).select_related('author').order_by('path')
+
+
+def thread_page(post, number, per_page=THREADS_PER_PAGE,
+                replies=REPLIES_SHOWN):
+    """Return (paginator, page, comments) for a page of top-level threads
+
+    Threads go newest first, each with its first ``replies`` replies.
+    """
+    roots = post.comments.filter(depth=0).order_by('-pk')
+    paginator = Paginator(roots, per_page)
+    page = paginator.get_page(number)
+    offset = (page.number - 1) * per_page
+    comments = Comment.objects.filter(
+        root__in=roots.values('pk')[offset:offset + per_page],
+        seq__lte=replies,
+    ).select_related('author').order_by('-root_id', 'path')
+    return paginator, page, comments
+
+
+def forget_reply(comment):
+    """Take a deleted reply out of its root's count, never below 0"""
+    if comment.root_id and comment.root_id != comment.pk:
+        Comment.objects.filter(
+            pk=comment.root_id, replies_count__gt=0
+        ).update(replies_count=F('replies_count') - 1)
+
+
+def fill_paths(batch_size=BATCH_SIZE):
+    """Place comments saved without Comment.save into their threads"""
+    placed = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Comment.objects.filter(path='').order_by('pk')[:batch_size]
+            )
+            if not batch:
+                return placed
+            known = Comment.objects.in_bulk({
+                comment.parent_id for comment in batch if comment.parent_id
+            })
+            # Replies to the deepest comments go to their parents
+            known.update(Comment.objects.in_bulk({
+                parent.parent_id for parent in known.values()
+                if parent.depth >= MAX_DEPTH
+            }))
+            replies = {}
+            for comment in batch:
+                parent = known.get(comment.parent_id)
+                if parent is not None and parent.path:
+                    if parent.depth >= MAX_DEPTH:
+                        parent = known[parent.parent_id]
+                    comment.parent_id = parent.pk
+                    comment.root_id = parent.root_id
+                    comment.depth = parent.depth + 1
+                    comment.path = parent.path + '/' + path_segment(
+                        comment.pk
+                    )
+                    count = replies.get(comment.root_id, 0) + 1
+                    replies[comment.root_id] = count
+                    comment.seq = count
+                else:
+                    comment.parent_id = None
+                    comment.root_id = comment.pk
+                    comment.depth = comment.seq = 0
+                    comment.path = path_segment(comment.pk)
+                known[comment.pk] = comment
+            counts = dict(Comment.objects.filter(
+                root_id__in=replies
+            ).exclude(path='').order_by().values('root_id').annotate(
+                last=Max('seq')
+            ).values_list('root_id', 'last'))
+            for comment in batch:
+                if comment.seq:
+                    comment.seq += counts.get(comment.root_id, 0)
+            Comment.objects.bulk_update(
+                batch, ['parent', 'root', 'depth', 'path', 'seq']
+            )
+            for root_id, count in replies.items():
+                Comment.objects.filter(pk=root_id).update(
+                    replies_count=F('replies_count') + count
+                )
+        placed += len(batch)
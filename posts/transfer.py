@@ -0,0 +1,174 @@
+"""Streaming import and export of site content.
+
+Records are flat dicts with a ``model`` key, written one per line as JSONL
+or as rows of a single CSV file with a shared header. Foreign keys are
+stored as ids and media files as their storage names, so an export can be
+loaded into an empty database without losing anything.
+
+Only what can't be rebuilt is written: tag and mention rows, thread paths
+and rendered HTML are derived again on import. Like counter shards not yet
+folded by ``aggregate_likes`` are not exported, so run it first. Per-user
+state such as notifications, inboxes, data exports, deletion jobs and
+webhooks stays behind, as do posts moved to ``posts.archive``.
+"""
+import csv
+import datetime
+import json
+
+from django.core.management.color import no_style
+from django.db import connection, models
+from django.utils import timezone
+
+from .models import Comment, Follow, Group, Like, Post, PostRevision, User
+
+# Models in dependency order, both for writing and for reading back
+MODELS = {
+    'user': User,
+    'group': Group,
+    'post': Post,
+    'comment': Comment,
+    'like': Like,
+    'revision': PostRevision,
+    'follow': Follow,
+}
+FIELDS = {
+    'user': [
+        'id', 'username', 'email', 'first_name', 'last_name', 'password',
+        'is_active', 'is_staff', 'is_superuser', 'date_joined', 'last_login',
+    ],
+    'group': ['id', 'title', 'slug', 'description'],
+    'post': [
+        'id', 'text', 'pub_date', 'author', 'group', 'image', 'music',
+        'is_published', 'publish_at', 'music_duration', 'music_bitrate',
+        'music_title', 'music_artist', 'music_peaks', 'likes_count',
+    ],
+    'comment': [
+        'id', 'post', 'author', 'text', 'created', 'parent', 'likes_count',
+    ],
+    'like': ['id', 'user', 'post', 'comment', 'created'],
+    'revision': [
+        'id', 'post', 'number', 'created', 'is_snapshot', 'text', 'delta',
+        'length', 'lines_added', 'lines_removed',
+    ],
+    'follow': ['id', 'user', 'author'],
+}
+# auto_now_add fields, which bulk_create fills with the import time
+CREATED_FIELDS = {
+    'comment': 'created',
+    'like': 'created',
+    'revision': 'created',
+}
+CSV_COLUMNS = ['model'] + sorted({
+    name for names in FIELDS.values() for name in names
+})
+
+
+def get_format(path, format=None):
+    format = format or path.rsplit('.', 1)[-1].lower()
+    if format not in ('jsonl', 'csv'):
+        raise ValueError(f'Unknown format: {format}')
+    return format
+
+
+def to_record(label, obj):
+    """Return a JSON-friendly dict for one model instance"""
+    record = {'model': label}
+    for name in FIELDS[label]:
+        field = obj._meta.get_field(name)
+        value = getattr(obj, field.attname)
+        if isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        elif isinstance(field, models.FileField):
+            value = value.name or None
+        record[name] = value
+    return record
+
+
+def from_record(record):
+    """Build an unsaved model instance from a record"""
+    label = record['model']
+    model = MODELS[label]
+    values = {}
+    for name in FIELDS[label]:
+        if name not in record:
+            # Exported before the field existed; the model default applies
+            continue
+        field = model._meta.get_field(name)
+        value = record[name]
+        if value == '' and field.null:
+            value = None
+        if value is not None and not isinstance(field, models.FileField):
+            value = field.to_python(value)
+        values[field.attname] = value
+    return model(**values)
+
+
+def write_records(stream, format, records):
+    if format == 'csv':
+        writer = csv.DictWriter(stream, CSV_COLUMNS, restval='')
+        writer.writeheader()
+        for record in records:
+            writer.writerow({
+                key: '' if value is None else value
+                for key, value in record.items()
+            })
+            yield record
+    else:
+        for record in records:
+            stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+            yield record
+
+
+def read_records(stream, format):
+    if format == 'csv':
+        for row in csv.DictReader(stream):
+            yield {
+                key: value for key, value in row.items()
+                if key in FIELDS.get(row['model'], ())
+                or key == 'model'
+            }
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_records(chunk_size):
+    """Yield records for the whole site, one model at a time"""
+    for label, model in MODELS.items():
+        queryset = model._default_manager.order_by('pk')
+        for obj in queryset.iterator(chunk_size=chunk_size):
+            yield to_record(label, obj)
+
+
+def insert(label, batch, ignore_conflicts=False):
+    """Bulk create a batch, keeping its imported creation dates"""
+    manager = MODELS[label]._default_manager
+    name = CREATED_FIELDS.get(label)
+    if name is None:
+        # Post.pub_date is only a default, imported values are kept anyway
+        manager.bulk_create(batch, ignore_conflicts=ignore_conflicts)
+        return
+    dates = [getattr(obj, name) for obj in batch]
+    started = timezone.now()
+    manager.bulk_create(batch, ignore_conflicts=ignore_conflicts)
+    dated = []
+    for obj, date in zip(batch, dates):
+        if date is not None and obj.pk is not None:
+            setattr(obj, name, date)
+            dated.append(obj)
+    if dated:
+        # Rows skipped as conflicts are older and keep their own dates
+        manager.filter(**{f'{name}__gte': started}).bulk_update(
+            dated, [name]
+        )
+
+
+def reset_sequences():
+    """Move primary key sequences past the imported ids"""
+    statements = connection.ops.sequence_reset_sql(
+        no_style(), list(MODELS.values())
+    )
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
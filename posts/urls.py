@@ -6,21 +6,81 @@ urlpatterns = [
     path('',
          views.index,
          name='index'),
+    path('groups/autocomplete/',
+         views.group_autocomplete,
+         name='group_autocomplete'),
     path('group/<slug:slug>/',
          views.group_post,
          name='group_post'),
+    path('feed/<slug:fmt>/',
+         views.feed,
+         name='feed'),
+    path('group/<slug:slug>/feed/<slug:fmt>/',
+         views.group_feed,
+         name='group_feed'),
+    path('sitemap.xml',
+         views.sitemap,
+         name='sitemap'),
+    path('sitemap-<int:shard>.xml',
+         views.sitemap_shard,
+         name='sitemap_shard'),
+    path('img/<str:token>/<int:width>x<int:height>/<slug:fit>.<slug:fmt>',
+         views.image,
+         name='image'),
+    path('tag/<str:name>/',
+         views.tag_posts,
+         name='tag_posts'),
     path('new/',
          views.new_post,
          name='new_post'),
+    path('drafts/',
+         views.drafts,
+         name='drafts'),
+    path('events/',
+         views.live_events,
+         name='live_events'),
+    path('notifications/',
+         views.notifications,
+         name='notifications'),
+    path('export/',
+         views.data_export,
+         name='data_export'),
+    path('export/<int:export_id>/',
+         views.data_export_download,
+         name='data_export_download'),
+    path('comment/<int:comment_id>/like/',
+         views.like_comment,
+         name='like_comment'),
+    path('comment/<int:comment_id>/unlike/',
+         views.unlike_comment,
+         name='unlike_comment'),
+    path('comment/<int:comment_id>/card/',
+         views.comment_card,
+         name='comment_card'),
     path('<str:username>/<int:post_id>/',
          views.post_view,
          name='post'),
     path('<str:username>/<int:post_id>/edit/',
          views.post_edit,
          name='post_edit'),
+    path('<str:username>/<int:post_id>/history/',
+         views.post_history,
+         name='post_history'),
+    path('<str:username>/<int:post_id>/history/<int:number>/',
+         views.post_revision,
+         name='post_revision'),
+    path('<str:username>/<int:post_id>/card/',
+         views.post_card,
+         name='post_card'),
     path('<username>/<int:post_id>/comment',
          views.add_comment,
          name='add_comment'),
+    path('<str:username>/<int:post_id>/like/',
+         views.like_post,
+         name='like_post'),
+    path('<str:username>/<int:post_id>/unlike/',
+         views.unlike_post,
+         name='unlike_post'),
     path('follow/',
          views.follow_index,
          name='follow_index'),
@@ -30,6 +90,12 @@ urlpatterns = [
     path('<str:username>/unfollow/',
          views.profile_unfollow,
          name='profile_unfollow'),
+    path('<str:username>/feed/<slug:fmt>/',
+         views.author_feed,
+         name='author_feed'),
+    path('<str:username>/mentions/',
+         views.mentions,
+         name='mentions'),
     path('<str:username>/',
          views.profile,
          name='profile'),
@@ -1,30 +1,45 @@
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Count, Q
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import require_POST
 from django.core.cache import cache
 from django.core.cache.utils import make_template_fragment_key
 
-from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from . import archive, feeds, images, likes, revisions, threads
+from .follows import get_follow_set, invalidate_follow_set
+from .groups import search_groups
+from .forms import CommentForm, InboxForm, PostForm
+from .keyset import keyset_page
+from .notifications import mark_all_read
+from .models import (
+    Comment, DataExport, Follow, Group, Inbox, Post, Tag, User
+)
+from .ratelimit import ratelimit
+from .staticfiles import IMMUTABLE
 
 
 def index(request):
     key = make_template_fragment_key('navbar', request.user.username)
     cache.delete(key)
-    paginator = Paginator(Post.objects.all(), 10)
+    paginator = Paginator(Post.objects.published(), 10)
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
     return render(request, 'posts/index.html', {
         'paginator': paginator,
         'page': page,
+        'liked_posts': likes.liked_post_ids(
+            request.user, [post.pk for post in page]
+        ),
     })
 
 
 def group_post(request, slug):
     """Return a group page with posts"""
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, 10)
+    paginator = Paginator(archive.group_posts(group), 10)
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
     return render(request, 'group.html', {
@@ -32,10 +47,90 @@ def group_post(request, slug):
         'group_page': True,
         'paginator': paginator,
         'page': page,
+        'liked_posts': likes.liked_post_ids(
+            request.user, [post.pk for post in page]
+        ),
     })
 
 
+def feed(request, fmt):
+    """Return the RSS or Atom feed of the latest posts"""
+    return feeds.feed_response(request, fmt)
+
+
+def group_feed(request, slug, fmt):
+    group = get_object_or_404(Group, slug=slug)
+    return feeds.feed_response(request, fmt, group)
+
+
+def author_feed(request, username, fmt):
+    author = get_object_or_404(User, username=username)
+    return feeds.feed_response(request, fmt, author)
+
+
+def sitemap(request):
+    return feeds.sitemap_response(request)
+
+
+def sitemap_shard(request, shard):
+    return feeds.sitemap_shard_response(request, shard)
+
+
+def image(request, token, width, height, fit, fmt):
+    """Return a resized post image for a signed URL"""
+    try:
+        handle, content_type = images.get_derivative(
+            token, width, height, fit, fmt
+        )
+    except (images.InvalidImageRequest, OSError):
+        raise Http404
+    response = FileResponse(handle, content_type=content_type)
+    # A signed URL always stands for the same picture
+    response['Cache-Control'] = IMMUTABLE
+    return response
+
+
 @login_required
+def group_autocomplete(request):
+    """Return groups matching a title or slug prefix for the post form"""
+    groups = search_groups(request.GET.get('q', ''))
+    return JsonResponse({'results': [
+        {'id': group.id, 'title': group.title, 'slug': group.slug}
+        for group in groups
+    ]})
+
+
+def tag_posts(request, name):
+    """Return posts with a hashtag, paginated over the tag index"""
+    tag = get_object_or_404(Tag, name=name.lower())
+    rows = tag.post_links.select_related('post__author', 'post__group')
+    page = keyset_page(rows, request.GET.get('before'))
+    return render(request, 'posts/tag.html', {
+        'title': f'#{tag.name}',
+        'total': tag.post_count,
+        'page': page,
+        'liked_posts': likes.liked_post_ids(
+            request.user, [row.post_id for row in page]
+        ),
+    })
+
+
+def mentions(request, username):
+    """Return posts mentioning the user"""
+    user = get_object_or_404(User, username=username)
+    rows = user.mentions.select_related('post__author', 'post__group')
+    page = keyset_page(rows, request.GET.get('before'))
+    return render(request, 'posts/tag.html', {
+        'title': f'Упоминания @{user.username}',
+        'page': page,
+        'liked_posts': likes.liked_post_ids(
+            request.user, [row.post_id for row in page]
+        ),
+    })
+
+
+@login_required
+@ratelimit('new_post')
 def new_post(request):
     """Return a new post page with form"""
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -43,48 +138,110 @@ def new_post(request):
         return render(request, 'posts/new_post.html', {'form': form})
     # Change data in instance of our form
     form.instance.author = request.user
-    form.save()
+    # The outbox event is written by a signal within the same transaction
+    with transaction.atomic():
+        post = form.save()
+    if not post.is_published:
+        return redirect('drafts')
+    # posts.live brings asyncio along, so it is only loaded on first write
+    from .live import publish_post
+    publish_post(post)
     return redirect('index')
 
 
+@login_required
+def drafts(request):
+    """Return the user's drafts and scheduled posts"""
+    paginator = Paginator(
+        request.user.posts.filter(is_published=False).order_by('-pk'), 10
+    )
+    page = paginator.get_page(request.GET.get('page'))
+    return render(request, 'posts/drafts.html', {
+        'paginator': paginator,
+        'page': page,
+    })
+
+
+def author_counters(author):
+    """Return follower and subscription counts in one query"""
+    return Follow.objects.filter(Q(author=author) | Q(user=author)).aggregate(
+        followers_count=Count('pk', filter=Q(author=author)),
+        following_count=Count('pk', filter=Q(user=author)),
+    )
+
+
 def profile(request, username):
     """Return a user's profile page"""
     user = get_object_or_404(User, username=username)
-    paginator = Paginator(user.posts.all(), 10)
+    paginator = Paginator(archive.author_posts(user), 10)
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
-    is_following = (
-        request.user.is_authenticated and
-        Follow.objects.filter(author=user, user=request.user)
-    )
+    is_following = user.pk in get_follow_set(request.user)
     context = {
         'author': user,
         'paginator': paginator,
         'page': page,
         'is_following': is_following,
+        'posts_count': paginator.count,
+        'liked_posts': likes.liked_post_ids(
+            request.user, [post.pk for post in page]
+        ),
+        **author_counters(user),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@ratelimit('comment')
 def post_view(request, username, post_id):
     """Return one particular post with comments and comment's form"""
     user = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, id=post_id, author=user)
-    is_following = (
-        request.user.is_authenticated and
-        Follow.objects.filter(author=user, user=request.user)
+    post = Post.objects.filter(id=post_id, author=user).first()
+    if post is None:
+        post = archive.get_post(post_id, user)
+    if post is None or not (post.is_published or request.user == user):
+        raise Http404
+    is_following = user.pk in get_follow_set(request.user)
+    # Archived posts are read-only, pending ones wait for readers
+    read_only = post.is_archived or not post.is_published
+    form = None if read_only else CommentForm(
+        request.POST or None, post=post,
+        initial={'parent': request.GET.get('reply')},
     )
-    form = CommentForm(request.POST or None)
-    if not form.is_valid():
+    if form is None or not form.is_valid():
+        paginator = page = None
+        thread = request.GET.get('thread')
+        if post.is_archived:
+            comments = list(post.comments.all())
+        elif thread and thread.isdigit():
+            root = get_object_or_404(post.comments, pk=thread)
+            comments = list(threads.subtree(root))
+        else:
+            paginator, page, comments = threads.thread_page(
+                post, request.GET.get('page')
+            )
+            comments = list(comments)
         return render(request, 'posts/profile.html', {
             'form': form,
             'author': user,
             'post': post,
+            'comments': comments,
+            'paginator': paginator,
+            'page': page,
+            'replies_shown': threads.REPLIES_SHOWN,
             'is_following': is_following,
+            'posts_count': archive.author_posts(user).count(),
+            'liked_posts': likes.liked_post_ids(request.user, [post.pk]),
+            'liked_comments': likes.liked_comment_ids(
+                request.user, [comment.pk for comment in comments]
+            ),
+            **author_counters(user),
         })
     form.instance.author = request.user
     form.instance.post = post
-    form.save()
+    with transaction.atomic():
+        comment = form.save()
+    from .live import publish_comment
+    publish_comment(comment)
     return redirect('post', user.username, post.id)
 
 
@@ -107,29 +264,155 @@ def post_edit(request, username, post_id):
             'author': user,
             'post': post,
         })
-    form.save()
+    was_pending = not post.is_published
+    with transaction.atomic():
+        # Read under the lock: the form has already put the new text into
+        # the post, and another edit may have been saved since it loaded
+        old_text = Post.objects.select_for_update().values_list(
+            'text', flat=True
+        ).get(pk=post.pk)
+        form.save()
+        revisions.record(post, old_text)
+    if was_pending and post.is_published:
+        from .live import publish_post
+        publish_post(post)
     # Go back to the post
     return redirect('post', user.username, post.id)
 
 
+def visible_post(request, username, post_id):
+    user = get_object_or_404(User, username=username)
+    post = Post.objects.select_related('author').filter(
+        id=post_id, author=user
+    ).first()
+    if post is None:
+        post = archive.get_post(post_id, user)
+    if post is None or not (post.is_published or request.user == user):
+        raise Http404
+    return post
+
+
+def post_history(request, username, post_id):
+    """Return a page of a post's revisions, without their texts"""
+    post = visible_post(request, username, post_id)
+    paginator = Paginator(revisions.history(post), 20)
+    page = paginator.get_page(request.GET.get('page'))
+    return render(request, 'posts/history.html', {
+        'post': post,
+        'paginator': paginator,
+        'page': page,
+    })
+
+
+def post_revision(request, username, post_id, number):
+    """Return one revision of a post's text"""
+    post = visible_post(request, username, post_id)
+    text = revisions.rebuild(post, number)
+    if text is None:
+        raise Http404
+    return render(request, 'posts/revision.html', {
+        'post': post,
+        'number': number,
+        'text': text,
+        'is_last': number == revisions.last_number(post),
+    })
+
+
+def post_card(request, username, post_id):
+    """Return a post's card for the live updates of this user's page"""
+    post = visible_post(request, username, post_id)
+    return render(request, 'includes/post_item.html', {
+        'post': post,
+        'liked_posts': likes.liked_post_ids(request.user, [post.pk]),
+    })
+
+
+def comment_card(request, comment_id):
+    """Return a comment's card for the live updates of its post page"""
+    comment = get_object_or_404(
+        Comment.objects.select_related('author', 'post'),
+        id=comment_id, post__is_published=True
+    )
+    return render(request, 'includes/comment_item.html', {
+        'item': comment,
+        # The post page it goes to has a comment form, so replies work
+        'form': CommentForm(post=comment.post),
+        'liked_comments': likes.liked_comment_ids(
+            request.user, [comment.pk]
+        ),
+    })
+
+
 @login_required
+@ratelimit('comment')
 def add_comment(request, username, post_id):
     """Return an adding comment page for post"""
     user = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, id=post_id, author=user)
-    form = CommentForm(request.POST or None)
+    post = get_object_or_404(
+        Post.objects.published(), id=post_id, author=user
+    )
+    form = CommentForm(request.POST or None, post=post)
     if not form.is_valid():
         return redirect('post', user.username, post.id)
     form.instance.author = request.user
     form.instance.post = post
-    form.save()
+    with transaction.atomic():
+        comment = form.save()
+    from .live import publish_comment
+    publish_comment(comment)
     return redirect('post', user.username, post.id)
 
 
+@login_required
+@require_POST
+@ratelimit('like')
+def like_post(request, username, post_id):
+    """Like a post and go back to it"""
+    post = get_object_or_404(
+        Post.objects.published(), id=post_id, author__username=username
+    )
+    likes.like(request.user, post=post)
+    return redirect('post', username, post_id)
+
+
+@login_required
+@require_POST
+@ratelimit('like')
+def unlike_post(request, username, post_id):
+    post = get_object_or_404(
+        Post.objects.published(), id=post_id, author__username=username
+    )
+    likes.unlike(request.user, post=post)
+    return redirect('post', username, post_id)
+
+
+@login_required
+@require_POST
+@ratelimit('like')
+def like_comment(request, comment_id):
+    """Like a comment and go back to its post"""
+    comment = get_object_or_404(
+        Comment.objects.select_related('post__author'), id=comment_id
+    )
+    likes.like(request.user, comment=comment)
+    return redirect('post', comment.post.author.username, comment.post_id)
+
+
+@login_required
+@require_POST
+@ratelimit('like')
+def unlike_comment(request, comment_id):
+    comment = get_object_or_404(
+        Comment.objects.select_related('post__author'), id=comment_id
+    )
+    likes.unlike(request.user, comment=comment)
+    return redirect('post', comment.post.author.username, comment.post_id)
+
+
 @login_required
 def follow_index(request):
     """Return user's favorite author's posts"""
-    post_list = Post.objects.select_related('author').filter(
+    post_list = Post.objects.published().select_related('author').filter(
         author__following__user=request.user
     )
     paginator = Paginator(post_list, 10)
@@ -137,12 +420,16 @@ def follow_index(request):
     page = paginator.get_page(page_number)
     context = {
         'paginator': paginator,
-        'page': page
+        'page': page,
+        'liked_posts': likes.liked_post_ids(
+            request.user, [post.pk for post in page]
+        ),
     }
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@ratelimit('follow', methods=('GET', 'POST'))
 def profile_follow(request, username):
     """Do a subscribtion of the user to the author"""
     author = get_object_or_404(User, username=username)
@@ -150,20 +437,89 @@ def profile_follow(request, username):
         author=author,
         user=request.user
     ).exists():
-        Follow.objects.create(author=author, user=request.user)
+        with transaction.atomic():
+            Follow.objects.create(author=author, user=request.user)
+        invalidate_follow_set(request.user)
     return redirect('profile', author.username)
 
 
 @login_required
+@ratelimit('follow', methods=('GET', 'POST'))
 def profile_unfollow(request, username):
     """Unfollow the user from the author"""
     # Check if the user is a follower of the author and delete it
+    # Deletion runs post_delete receivers, the outbox one too, atomically
     get_object_or_404(
         Follow, user=request.user, author__username=username
     ).delete()
+    invalidate_follow_set(request.user)
     return redirect('profile', username)
 
 
+@login_required
+def data_export(request):
+    """Return user's data exports and queue a new one on POST"""
+    exports = request.user.data_exports.all()
+    if request.method == 'POST':
+        if not exports.filter(status__in=(
+            DataExport.PENDING, DataExport.RUNNING
+        )).exists():
+            DataExport.objects.create(user=request.user)
+        return redirect('data_export')
+    return render(request, 'posts/export.html', {'exports': exports})
+
+
+@login_required
+def data_export_download(request, export_id):
+    """Stream a ready archive to its owner"""
+    export = get_object_or_404(
+        DataExport,
+        id=export_id,
+        user=request.user,
+        status=DataExport.DONE
+    )
+    # FileResponse is a StreamingHttpResponse reading the file in blocks
+    try:
+        archive = export.archive.open('rb')
+    except FileNotFoundError:
+        raise Http404
+    stamp = export.finished.strftime('%Y%m%d%H%M%S')
+    return FileResponse(
+        archive,
+        as_attachment=True,
+        filename=f'{request.user.username}-{stamp}.zip'
+    )
+
+
+@login_required
+def notifications(request):
+    """Return user's notifications and delivery settings"""
+    inbox, _ = Inbox.objects.get_or_create(user=request.user)
+    form = InboxForm(request.POST or None, instance=inbox)
+    if form.is_valid():
+        form.save()
+        return redirect('notifications')
+    paginator = Paginator(
+        request.user.notifications.select_related('actor', 'post__author'),
+        20
+    )
+    page = paginator.get_page(request.GET.get('page'))
+    # Render the unread marks first, then reset them
+    response = render(request, 'posts/notifications.html', {
+        'form': form,
+        'paginator': paginator,
+        'page': page,
+    })
+    if inbox.unread:
+        mark_all_read(request.user)
+    return response
+
+
+def live_events(request):
+    """Tell EventSource clients to stop when served without yatube.asgi"""
+    return HttpResponse(status=204)
+
+
 def page_not_found(request, exception):
     return render(
         request,
@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import UserCreationForm
 
+from .validators import validate_not_reserved
+
 User = get_user_model()
 
 
@@ -9,3 +11,9 @@ class CreationForm(UserCreationForm):
     class Meta:
         model = User
         fields = ('first_name', 'last_name', 'username', 'email')
+
+    def clean_username(self):
+        # /drafts/ and the like would never reach such a profile
+        username = self.cleaned_data['username']
+        validate_not_reserved(username)
+        return username
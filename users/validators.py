@@ -0,0 +1,33 @@
+from functools import lru_cache
+
+from django.core.exceptions import ValidationError
+from django.urls import get_resolver
+from django.urls.resolvers import RoutePattern
+
+
+@lru_cache(maxsize=None)
+def reserved_usernames():
+    """First path segments of site routes, which profile URLs would hit"""
+    names = set()
+    patterns = list(get_resolver().url_patterns)
+    while patterns:
+        pattern = patterns.pop()
+        if not isinstance(pattern.pattern, RoutePattern):
+            continue
+        route = str(pattern.pattern)
+        if not route and hasattr(pattern, 'url_patterns'):
+            # An app mounted at the root, like posts.urls
+            patterns.extend(pattern.url_patterns)
+            continue
+        segment = route.split('/', 1)[0]
+        if segment and '<' not in segment:
+            names.add(segment.lower())
+    return frozenset(names)
+
+
+def validate_not_reserved(username):
+    if username.lower() in reserved_usernames():
+        raise ValidationError(
+            'Это имя занято адресом сайта, выберите другое.',
+            code='reserved'
+        )
@@ -0,0 +1,175 @@
+"""ASGI entry point.
+
+Django 2.2 has neither an ASGI handler nor async views, so this module
+adapts the regular WSGI handler: the event loop owns the connections and
+waits for request bodies and slow clients, while the Django code of each
+request runs on a bounded thread pool. A worker thread is only busy while
+a view is really working, not while a connection is idle.
+
+Server-Sent Events are the exception: ``EVENTS_PATH`` is served natively
+on the loop, so an idle subscriber costs a coroutine instead of a thread.
+
+Run it with any ASGI 3 server, e.g. ``uvicorn yatube.asgi:application``.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+from django.urls import reverse
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+wsgi_application = get_wsgi_application()
+
+from posts.live import serve_events  # noqa: E402 (needs Django set up)
+
+EVENTS_PATH = reverse('live_events')
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASGI_THREADS,
+    thread_name_prefix='asgi'
+)
+# Responses are handed from the worker thread to the loop in small steps
+RESPONSE_QUEUE_SIZE = 8
+
+
+def build_environ(scope, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        # WSGI wants the raw path bytes decoded as latin-1
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+        environ['REMOTE_PORT'] = str(scope['client'][1])
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        if name in environ:
+            value = f'{environ[name]},{value}'
+        environ[name] = value
+    return environ
+
+
+async def read_body(receive):
+    """Collect the request body on the loop, spilling big ones to disk"""
+    body = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+    )
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            body.close()
+            return None
+        body.write(message.get('body', b''))
+        if not message.get('more_body'):
+            body.seek(0)
+            return body
+
+
+def run_wsgi(environ, loop, queue):
+    """Run one request in a worker thread and feed the response to queue
+
+    The whole request, including closing the response, stays on one
+    thread so Django's per-thread connection handling keeps working. The
+    queue always gets a start and an end, a 500 start if the application
+    failed before it started a response.
+    """
+    started = False
+
+    def put(message):
+        asyncio.run_coroutine_threadsafe(queue.put(message), loop).result()
+
+    def start_response(status, headers, exc_info=None):
+        nonlocal started
+        started = True
+        code = int(status.split(' ', 1)[0])
+        put(('start', code, [
+            (name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers
+        ]))
+
+    result = None
+    try:
+        result = wsgi_application(environ, start_response)
+        for chunk in result:
+            if chunk:
+                put(('body', chunk))
+    finally:
+        try:
+            if hasattr(result, 'close'):
+                result.close()
+        finally:
+            if not started:
+                put(('start', 500, [(b'content-type', b'text/plain')]))
+            put(('end',))
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        raise ValueError(f'Unsupported scope type: {scope["type"]}')
+    if scope['path'] == EVENTS_PATH:
+        await serve_events(scope, receive, send, executor)
+        return
+    body = await read_body(receive)
+    if body is None:
+        return
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(RESPONSE_QUEUE_SIZE)
+    worker = loop.run_in_executor(
+        executor, run_wsgi, build_environ(scope, body), loop, queue
+    )
+    finished = False
+    try:
+        while not finished:
+            message = await queue.get()
+            if message[0] == 'start':
+                await send({
+                    'type': 'http.response.start',
+                    'status': message[1],
+                    'headers': message[2],
+                })
+            elif message[0] == 'body':
+                await send({
+                    'type': 'http.response.body',
+                    'body': message[1],
+                    'more_body': True,
+                })
+            else:
+                finished = True
+                await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        # A gone client must not leave the worker blocked on a full queue
+        while not finished:
+            finished = (await queue.get())[0] == 'end'
+        try:
+            # Re-raises what the application raised, for the server to log
+            await worker
+        finally:
+            body.close()
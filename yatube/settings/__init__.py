@@ -0,0 +1,32 @@
+"""Settings profiles.
+
+``YATUBE_PROFILE`` picks ``dev`` (the default), ``test`` or ``prod``. Each
+profile starts from ``base`` and changes only what differs, so
+``DJANGO_SETTINGS_MODULE`` can also name a profile module directly, e.g.
+``yatube.settings.prod``. Python imports this package first then, so the
+profile choice and ``.env`` are only read when the package itself is the
+settings module: a production process never loads dev settings.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+if os.getenv('DJANGO_SETTINGS_MODULE', __name__) == __name__:
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        # python-dotenv is only a convenience for local runs
+        pass
+    else:
+        load_dotenv()
+
+    PROFILE = os.getenv('YATUBE_PROFILE', 'dev')
+
+    if PROFILE == 'dev':
+        from .dev import *  # noqa: F401,F403
+    elif PROFILE == 'test':
+        from .test import *  # noqa: F401,F403
+    elif PROFILE == 'prod':
+        from .prod import *  # noqa: F401,F403
+    else:
+        raise ImproperlyConfigured(f'Unknown YATUBE_PROFILE {PROFILE!r}')
@@ -0,0 +1,194 @@
+"""Settings shared by every profile, see yatube.settings"""
+import os
+
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+SECRET_KEY = os.getenv('SECRET_KEY')
+
+DEBUG = False
+
+SITE_ID = 1
+
+ALLOWED_HOSTS = [
+    'localhost',
+    '127.0.0.1',
+    '[::1]',
+    'testserver',
+]
+
+
+INSTALLED_APPS = [
+    'posts',
+    'users',
+    'django.contrib.sites',
+    'django.contrib.flatpages',
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+]
+
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'posts.flatpages.CachedFlatpageFallbackMiddleware',
+    'posts.template_timing.TemplateTimingMiddleware',
+]
+
+ROOT_URLCONF = 'yatube.urls'
+
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+# Time every template and include render, see posts.template_timing
+TEMPLATE_TIMING = os.getenv('TEMPLATE_TIMING') == 'True'
+
+
+def build_templates(cached, debug=True):
+    """Return TEMPLATES, a fresh copy for every profile"""
+    loaders = TEMPLATE_LOADERS
+    if cached:
+        # Keep compiled templates (and templates found by includes) in memory
+        loaders = [('django.template.loaders.cached.Loader', loaders)]
+    context_processors = [
+        'django.template.context_processors.request',
+        'django.contrib.auth.context_processors.auth',
+        'django.contrib.messages.context_processors.messages',
+        'posts.context_processors.notifications',
+    ]
+    if debug:
+        context_processors.insert(
+            0, 'django.template.context_processors.debug'
+        )
+    return [
+        {
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'DIRS': [
+                os.path.join(BASE_DIR, 'templates'),
+            ],
+            'OPTIONS': {
+                'context_processors': context_processors,
+                'loaders': loaders,
+            },
+        },
+    ]
+
+
+TEMPLATE_CACHE = os.getenv('TEMPLATE_CACHE', 'True') == 'True'
+TEMPLATES = build_templates(TEMPLATE_CACHE)
+
+WSGI_APPLICATION = 'yatube.wsgi.application'
+
+# Size of the thread pool running Django code behind yatube.asgi
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', 8))
+
+# Server-Sent Events served by yatube.asgi
+LIVE_MAX_CONNECTIONS = int(os.getenv('LIVE_MAX_CONNECTIONS', 10000))
+LIVE_HEARTBEAT = 15
+LIVE_QUEUE_SIZE = 100
+# Directory for sockets shared by all processes; None keeps events local
+LIVE_SOCKET_DIR = os.getenv('LIVE_SOCKET_DIR')
+
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+    }
+}
+
+# Cold storage for posts older than ARCHIVE_AFTER_DAYS, see posts.archive
+ARCHIVE_PATH = os.getenv(
+    'ARCHIVE_PATH', os.path.join(BASE_DIR, 'archive.sqlite3')
+)
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 365))
+ARCHIVE_MMAP_SIZE = 256 * 1024 * 1024
+
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+
+LANGUAGE_CODE = 'ru'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_L10N = True
+
+USE_TZ = True
+
+
+STATIC_URL = '/static/'
+STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+# Serve collected files from Django (posts.staticfiles.serve) when DEBUG
+# is off and no front server does it
+SERVE_STATIC = False
+
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Personal data archives; private, never under MEDIA_ROOT
+EXPORT_ROOT = os.path.join(BASE_DIR, 'exports')
+EXPORT_KEEP_DAYS = 7
+
+# Resized post images, see posts.images
+IMAGE_CACHE_DIR = os.path.join(BASE_DIR, 'image_cache')
+IMAGE_CACHE_SIZE = 512 * 1024 * 1024
+
+LOGIN_URL = '/auth/login/'
+LOGIN_REDIRECT_URL = 'index'
+
+EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
+
+
+# Feed stamps, follow sets, group titles and rate limits are written by one
+# process and read by all others, web workers and management commands
+# alike, so the cache has to be shared; LocMemCache is per process. The
+# default file cache is shared by the processes of one host.
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'
+)
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')
+        ),
+    }
+}
+if CACHE_BACKEND.endswith('FileBasedCache'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 100000}
+
+# Write throttling, see posts.ratelimit
+RATELIMITS = {
+    'new_post': ('10/m', 'user'),
+    'comment': ('20/m', 'user'),
+    'follow': ('30/m', 'user'),
+    'like': ('60/m', 'user'),
+}
+
+INTERNAL_IPS = []
@@ -0,0 +1,28 @@
+"""Local development: debug pages, uncached templates, the toolbar"""
+import os
+from importlib.util import find_spec
+
+from .base import *  # noqa: F401,F403
+from .base import INSTALLED_APPS, MIDDLEWARE, build_templates
+
+DEBUG = True
+
+# Edited templates show up without a restart
+TEMPLATE_CACHE = os.getenv('TEMPLATE_CACHE', 'False') == 'True'
+TEMPLATES = build_templates(TEMPLATE_CACHE)
+
+INTERNAL_IPS = [
+    '127.0.0.1',
+]
+
+# django-debug-toolbar is optional and never shipped to production
+if find_spec('debug_toolbar') is not None:
+    INSTALLED_APPS = INSTALLED_APPS + ['debug_toolbar']
+    position = MIDDLEWARE.index(
+        'posts.template_timing.TemplateTimingMiddleware'
+    )
+    MIDDLEWARE = (
+        MIDDLEWARE[:position]
+        + ['debug_toolbar.middleware.DebugToolbarMiddleware']
+        + MIDDLEWARE[position:]
+    )
@@ -0,0 +1,34 @@
+"""Production: no debug machinery, cached templates, kept connections"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .base import *  # noqa: F401,F403
+from .base import CACHE_BACKEND, DATABASES, TEMPLATE_CACHE, build_templates
+
+DEBUG = False
+
+ALLOWED_HOSTS = [
+    host for host in os.getenv('ALLOWED_HOSTS', '').split(',') if host
+]
+
+TEMPLATES = build_templates(TEMPLATE_CACHE, debug=False)
+
+# Workers would invalidate feeds and caches of their own process only
+if CACHE_BACKEND.endswith('LocMemCache'):
+    raise ImproperlyConfigured('CACHE_BACKEND has to be shared by processes')
+
+DATABASES = {
+    'default': {
+        **DATABASES['default'],
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 60)),
+    }
+}
+
+# collectstatic writes hashed names with .gz/.br siblings
+STATICFILES_STORAGE = 'posts.staticfiles.CompressedManifestStaticFilesStorage'
+SERVE_STATIC = os.getenv('SERVE_STATIC', 'True') == 'True'
+
+EMAIL_BACKEND = os.getenv(
+    'EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend'
+)
@@ -0,0 +1,19 @@
+"""Test runs: fast hashing, mail kept in memory, no debug machinery"""
+import os
+
+from .base import *  # noqa: F401,F403
+
+SECRET_KEY = os.getenv('SECRET_KEY', 'test-secret-key')
+
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
+
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+# Tests run in one process
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
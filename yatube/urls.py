@@ -1,9 +1,13 @@
+import re
+
 from django.conf import settings
 from django.conf.urls import handler404, handler500
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.contrib.flatpages import views
-from django.urls import include, path
+from django.urls import include, path, re_path
+
+from posts.flatpages import flatpage
+from posts.staticfiles import serve as serve_static
 
 
 urlpatterns = [
@@ -16,13 +20,13 @@ urlpatterns = [
 urlpatterns += [
     path(
         'about-author/',
-        views.flatpage,
+        flatpage,
         {'url': '/about-author/'},
         name='about'
     ),
     path(
         'about-spec/',
-        views.flatpage,
+        flatpage,
         {'url': '/about-spec/'},
         name='terms'
     ),
@@ -38,5 +42,15 @@ if settings.DEBUG:
     urlpatterns += static(
         settings.STATIC_URL, document_root=settings.STATIC_ROOT
     )
-    import debug_toolbar    
+elif settings.SERVE_STATIC:
+    urlpatterns += [
+        re_path(
+            r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')),
+            serve_static
+        ),
+    ]
+
+# Only the dev profile installs the toolbar
+if 'debug_toolbar' in settings.INSTALLED_APPS:
+    import debug_toolbar
     urlpatterns += (path("__debug__/", include(debug_toolbar.urls)),)